@@ -0,0 +1,201 @@
+"""NumPy による一括シミュレーション
+
+N 面の盤面を (N, FIELD_HEIGHT, FIELD_WIDTH) の配列で持ち、移動・固定・重力・
+同じ月の連結判定・役判定・得点計算を全ゲームまとめて配列演算で行う。
+ルールは HanafudaEngine と同じだが、1回の step が「花札1枚を置いて連鎖を
+最後まで解決する」までに相当する。フレーム単位の概念（落下速度・ボーナスタイム
+による得点2倍・演出の待ち時間）は扱わない。
+"""
+
+import numpy as np
+
+from cards import CARD_MONTH, CARD_COLOR, COLOR_BLUE, COLOR_RED, MONTH_FIRST_CARD
+from engine import YAKU_NAMES, YAKU_BONUS
+
+_MONTH_TABLE = np.array(CARD_MONTH, dtype=np.int8)
+_COLOR_TABLE = np.array(CARD_COLOR, dtype=np.int8)
+
+
+class BatchEngine:
+    """N 面のゲームをまとめて進める"""
+
+    def __init__(self, n, seed=None, width=8, height=6):
+        self.n = n
+        self.FIELD_WIDTH = width
+        self.FIELD_HEIGHT = height
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        """全ゲームを開始状態に戻す"""
+        # yaku_counts の列は YAKU_NAMES の順
+        n, h, w = self.n, self.FIELD_HEIGHT, self.FIELD_WIDTH
+        self.field = np.zeros((n, h, w), dtype=np.int8)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.combo = np.zeros(n, dtype=np.int32)
+        self.max_combo = np.zeros(n, dtype=np.int32)
+        self.placed = np.zeros(n, dtype=np.int32)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.yaku_counts = np.zeros((n, len(YAKU_NAMES)), dtype=np.int32)
+        self.next_card = self._draw_cards()
+        self.falling_card = self.next_card
+        self.next_card = self._draw_cards()
+
+    def _draw_cards(self):
+        return self.rng.integers(1, 49, size=self.n, dtype=np.int8)
+
+    def step(self, columns):
+        """各ゲームの落下中の花札を columns の列に置き、連鎖を最後まで解決する
+
+        戻り値はこの step で増えた得点（ゲームオーバー済みのゲームは0）。
+        """
+        columns = np.asarray(columns, dtype=np.int64)
+        active = ~self.game_over
+        score_before = self.score.copy()
+        rows = np.arange(self.n)
+
+        # 移動：出現位置から目標の列まで最上段を横に進み、埋まったマスの手前で止まる
+        x = self.reached_columns(columns)
+
+        # 固定：列の一番下の空きマスに置く（安定した盤面では列は下に詰まっている）
+        heights = np.count_nonzero(self.field[rows, :, x], axis=1)
+        y = self.FIELD_HEIGHT - 1 - heights
+        can_place = active & (y >= 0)
+        self.field[rows[can_place], y[can_place], x[can_place]] = self.falling_card[can_place]
+        self.placed += can_place
+
+        # 消去判定と連鎖（初回の消去は combo=1 から始まる）
+        self.combo[:] = 0
+        pending = self.find_cards_to_remove(can_place)
+        chaining = pending.any(axis=(1, 2))
+        self.combo[chaining] = 1
+        np.maximum(self.max_combo, self.combo, out=self.max_combo)
+
+        # 次の花札の出現（元のゲームでは連鎖の消去より前に出現判定が行われる）
+        spawn_x = self.FIELD_WIDTH // 2
+        self.game_over |= active & (self.field[:, 0, spawn_x] != 0)
+        self.falling_card = np.where(active, self.next_card, self.falling_card)
+        self.next_card = np.where(active, self._draw_cards(), self.next_card)
+        chaining &= ~self.game_over
+        pending &= chaining[:, None, None]
+
+        while chaining.any():
+            # 消去と得点（連結枚数による基本点 × (コンボ+1)）
+            counts = np.count_nonzero(pending, axis=(1, 2))
+            points = np.where(counts >= 5, 300, np.where(counts == 4, 200, np.where(counts == 3, 100, 0)))
+            self.score += np.where(chaining, points * (self.combo + 1), 0)
+            self.field[pending] = 0
+
+            # 重力で落とし、落ちた盤面で再判定
+            self.drop_cards(chaining)
+            pending = self.find_cards_to_remove(chaining)
+            next_chaining = pending.any(axis=(1, 2))
+            self.combo += next_chaining
+            np.maximum(self.max_combo, self.combo, out=self.max_combo)
+            self.combo[chaining & ~next_chaining] = 0
+            chaining = next_chaining
+
+        return self.score - score_before
+
+    def reached_columns(self, columns):
+        """目標の列に向かって最上段を進んだときに到達できる列"""
+        w = self.FIELD_WIDTH
+        spawn_x = w // 2
+        target = np.clip(columns, 0, w - 1)
+        cols = np.arange(w)
+        blocked = self.field[:, 0, :] != 0
+
+        # 左へ進む場合：目標と出現位置の間で一番右の障害物の右隣まで
+        left_block = blocked & (cols >= target[:, None]) & (cols < spawn_x)
+        left_stop = np.where(left_block, cols, -1).max(axis=1) + 1
+        # 右へ進む場合：目標と出現位置の間で一番左の障害物の左隣まで
+        right_block = blocked & (cols <= target[:, None]) & (cols > spawn_x)
+        right_stop = np.where(right_block, cols, w).min(axis=1) - 1
+
+        reached = np.where(target < spawn_x, np.maximum(target, left_stop), target)
+        return np.where(target > spawn_x, np.minimum(target, right_stop), reached)
+
+    def find_cards_to_remove(self, active):
+        """同じ月で3枚以上の連結と特殊役の消去対象（(N, H, W) の真偽配列）"""
+        field = self.field
+        occupied = (field != 0) & active[:, None, None]
+        months = _MONTH_TABLE[field]
+        to_remove = occupied & (self.component_sizes(months, occupied) >= 3)
+        to_remove |= self.check_special_combinations(active)
+        return to_remove
+
+    def component_sizes(self, months, occupied):
+        """各マスが属する同じ月の連結成分の大きさ（ラベル伝播で求める）"""
+        n, h, w = months.shape
+        cells = h * w
+        big = np.int32(cells)
+        labels = np.where(occupied, np.arange(cells, dtype=np.int32).reshape(1, h, w), big)
+
+        # 隣接マスが同じ月なら小さい方のラベルを伝播させる
+        same_down = occupied[:, :-1, :] & occupied[:, 1:, :] & (months[:, :-1, :] == months[:, 1:, :])
+        same_right = occupied[:, :, :-1] & occupied[:, :, 1:] & (months[:, :, :-1] == months[:, :, 1:])
+        while True:
+            new = labels.copy()
+            np.minimum(new[:, :-1, :], np.where(same_down, labels[:, 1:, :], big), out=new[:, :-1, :])
+            np.minimum(new[:, 1:, :], np.where(same_down, labels[:, :-1, :], big), out=new[:, 1:, :])
+            np.minimum(new[:, :, :-1], np.where(same_right, labels[:, :, 1:], big), out=new[:, :, :-1])
+            np.minimum(new[:, :, 1:], np.where(same_right, labels[:, :, :-1], big), out=new[:, :, 1:])
+            if np.array_equal(new, labels):
+                break
+            labels = new
+
+        # (ゲーム, ラベル) ごとに枚数を数え、各マスへ戻す
+        keys = np.arange(n, dtype=np.int64)[:, None, None] * (cells + 1) + labels
+        sizes = np.bincount(keys.ravel(), minlength=n * (cells + 1))
+        return np.where(occupied, sizes[keys], 0)
+
+    def check_special_combinations(self, active):
+        """特殊役の判定（得点・役の回数を加算し、消去対象を返す）"""
+        field = self.field
+        first = [None] * 13
+        present = np.zeros((13, self.n), dtype=bool)
+        for month in range(1, 13):
+            first[month] = field == MONTH_FIRST_CARD[month]
+            present[month] = first[month].any(axis=(1, 2))
+
+        goko_mask = first[1] | first[3] | first[8] | first[11] | first[12]
+        goko_count = np.count_nonzero(goko_mask, axis=(1, 2))
+        colors = _COLOR_TABLE[field]
+        blue_mask = colors == COLOR_BLUE
+        red_mask = colors == COLOR_RED
+
+        # 光札の役は五光 > 雨四光(11月があれば他は見ない) > 四光 > 三光 の順に1つだけ
+        goko = goko_count >= 5
+        rain = ~goko & present[11]
+        ame_shiko = rain & (goko_count >= 4)
+        shiko = ~goko & ~rain & (goko_count >= 4)
+        sanko = ~goko & ~rain & (goko_count == 3)
+        inoshikacho = present[6] & present[7] & present[10]
+        hanami = present[3] & present[9]
+        tsukimi = present[8] & present[9]
+        aotan = np.count_nonzero(blue_mask, axis=(1, 2)) >= 3
+        akatan = np.count_nonzero(red_mask, axis=(1, 2)) >= 3
+
+        found = np.stack([goko, ame_shiko, shiko, sanko, inoshikacho,
+                          hanami, tsukimi, aotan, akatan], axis=1) & active[:, None]
+        self.yaku_counts += found
+        self.score += found @ np.array(YAKU_BONUS, dtype=np.int64)
+
+        def where(flag, mask):
+            return flag[:, None, None] & mask
+
+        hikari = found[:, 0] | found[:, 1] | found[:, 2] | found[:, 3]
+        to_remove = where(hikari, goko_mask)
+        to_remove |= where(found[:, 4], first[6] | first[7] | first[10])
+        to_remove |= where(found[:, 5], first[3] | first[9])
+        to_remove |= where(found[:, 6], first[8] | first[9])
+        to_remove |= where(found[:, 7], blue_mask)
+        to_remove |= where(found[:, 8], red_mask)
+        return to_remove
+
+    def drop_cards(self, active):
+        """花札を重力で落下（各列を下に詰める）"""
+        field = self.field[active]
+        # 空マスを上へ、花札を順序を保ったまま下へ並べ替える
+        order = np.argsort(field != 0, axis=1, kind="stable")
+        self.field[active] = np.take_along_axis(field, order, axis=1)
@@ -0,0 +1,355 @@
+"""ルール処理と描画のベンチマーク
+
+固定の合成盤面（コーパス）でルールの主要関数を測るマイクロベンチマークと、
+ゲーム全体を回すマクロベンチマーク（step/秒、配置/秒、ヘッドレス描画のフレーム/秒）。
+結果は JSON に保存でき、保存しておいた基準の結果と比較できる。
+
+    python bench.py --json baseline.json
+    python bench.py --compare baseline.json   # 閾値より遅くなった項目があれば終了コード1
+    python bench.py --draw                    # Pyxel のヘッドレス描画も測る
+    python bench.py --startup                 # 起動から最初のフレームまでの時間も測る
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from engine import HanafudaEngine, board_size
+from game_state import GameState
+
+# 光札（1,3,8,11,12月の1枚目）
+HIKARI_CARDS = (1, 9, 29, 41, 45)
+
+# 起動時間を測る子プロセス（ヘッドレスで最初のフレームを描き、音の読み込みまで進める）
+STARTUP_PROBE = """
+import main
+app = main.HanafudaTetris(headless=True)
+app.update()
+app.draw()
+app.update()
+import json
+print(json.dumps(app.startup.to_dict()))
+"""
+
+# 12連鎖する 8x6 の盤面（2,4,5,7月のカス札）
+LONG_CASCADE = (
+    (28, 8, 20, 8, 8, 16, 8, 16),
+    (8, 16, 28, 20, 20, 28, 20, 16),
+    (28, 8, 16, 8, 8, 20, 16, 16),
+    (16, 28, 28, 16, 28, 8, 28, 20),
+    (28, 8, 8, 20, 16, 8, 20, 28),
+    (28, 20, 20, 28, 16, 20, 20, 28),
+)
+
+
+def plain_card(month):
+    """役に関わらない札（その月の4枚目のカス札）"""
+    return (month - 1) * 4 + 4
+
+
+def build_corpus(width=8, height=6):
+    """ベンチマーク用の盤面（名前 -> field）。毎回同じ内容になる"""
+    corpus = {}
+    corpus['empty'] = [[0] * width for _ in range(height)]
+
+    # 全マスを無作為な札で埋めた盤面
+    rng = random.Random(2025)
+    corpus['full'] = [[rng.randint(1, 48) for _ in range(width)] for _ in range(height)]
+
+    # 2つの月の市松模様（連結が1枚ずつに分かれる）
+    corpus['checkerboard'] = [[plain_card(2 if (x + y) % 2 else 4) for x in range(width)]
+                              for y in range(height)]
+
+    # 全マスが同じ月（連結が盤面全体になる最悪ケース）
+    corpus['single_month'] = [[(7, 8)[(x + y) % 2] for x in range(width)] for y in range(height)]
+
+    # 光札だけの盤面（同じ月が隣り合わないように並べる）
+    corpus['all_hikari'] = [[HIKARI_CARDS[(x + 2 * y) % 5] for x in range(width)]
+                            for y in range(height)]
+
+    # 連鎖が長く続く盤面（4つの月の無作為な盤面から探索で見つけた12連鎖、8x6 のときだけ）
+    if (width, height) == (8, 6):
+        corpus['long_cascade'] = [list(row) for row in LONG_CASCADE]
+    return corpus
+
+
+def measure(func, setup=None, min_time=0.02, repeat=5):
+    """func 1回あたりの所要時間（ナノ秒）を repeat 回測る
+
+    setup があれば毎回の呼び出し前に（計測外で）実行し、1回ずつ測る。
+    """
+    timer = time.perf_counter_ns
+    samples = []
+    if setup is None:
+        # 1回の計測が min_time 秒以上になるまで回数を増やす
+        number = 1
+        while True:
+            start = timer()
+            for _ in range(number):
+                func()
+            elapsed = timer() - start
+            if elapsed >= min_time * 1e9:
+                break
+            number *= 2
+        samples.append(elapsed / number)
+        for _ in range(repeat - 1):
+            start = timer()
+            for _ in range(number):
+                func()
+            samples.append((timer() - start) / number)
+    else:
+        for _ in range(repeat):
+            total = 0
+            count = 0
+            while total < min_time * 1e9:
+                setup()
+                start = timer()
+                func()
+                total += timer() - start
+                count += 1
+            samples.append(total / count)
+    return {'value': min(samples), 'median': statistics.median(samples),
+            'unit': "ns/call", 'better': "lower"}
+
+
+def run_chain(engine):
+    """盤面全体の消去判定→消去→落下を連鎖が止まるまで繰り返し、連鎖数を返す"""
+    chain = 0
+    to_remove = engine.find_cards_to_remove()
+    while to_remove:
+        chain += 1
+        engine.calculate_points(to_remove)
+        engine.remove_cards(to_remove)
+        engine.drop_cards()
+        to_remove = engine.find_cards_to_remove(engine.dirty_mask)
+    return chain
+
+
+def micro_benchmarks(corpus, min_time, repeat, board=(8, 6)):
+    """コーパスの各盤面でルールの主要関数を測る"""
+    results = {}
+    engine = HanafudaEngine(rng=random.Random(0), width=board[0], height=board[1])
+    for name, field in corpus.items():
+        engine.load_field(field)
+        engine.events = []
+
+        def find_all():
+            engine.find_cards_to_remove()
+            engine.events.clear()  # 役の成立で溜まる出来事は捨てる
+
+        def special():
+            engine.check_special_combinations()
+            engine.events.clear()
+
+        # 連結探索は盤面の左下の花札から（空なら即座に終わる）
+        start_y = engine.FIELD_HEIGHT - 1
+        results['micro.find_cards_to_remove.' + name] = measure(find_all, min_time=min_time, repeat=repeat)
+        results['micro.find_connected_cards.' + name] = measure(
+            lambda: engine.find_connected_cards(0, start_y), min_time=min_time, repeat=repeat)
+        results['micro.check_special_combinations.' + name] = measure(
+            special, min_time=min_time, repeat=repeat)
+
+        # 落下と得点計算は、最初に消える花札を取り除いた盤面で測る
+        to_remove = engine.find_cards_to_remove()
+        engine.events.clear()
+        engine.remove_cards(to_remove)
+        holed = [row[:] for row in engine.field]
+        results['micro.drop_cards.' + name] = measure(
+            engine.drop_cards, setup=lambda: engine.load_field(holed), min_time=min_time, repeat=repeat)
+        results['micro.calculate_points.' + name] = measure(
+            lambda: engine.calculate_points(to_remove), min_time=min_time, repeat=repeat)
+
+        # 連鎖を最後まで解決する一連の処理
+        results['micro.chain.' + name] = measure(
+            lambda: run_chain(engine), setup=lambda: engine.load_field(field),
+            min_time=min_time, repeat=repeat)
+
+        # 状態の写し・戻し（探索・巻き戻し・チェックポイント用）
+        engine.load_field(field)
+        snapshot = engine.snapshot()
+        data = snapshot.to_bytes()
+        results['micro.snapshot.' + name] = measure(engine.snapshot, min_time=min_time, repeat=repeat)
+        results['micro.restore_snapshot.' + name] = measure(
+            lambda: engine.restore_snapshot(snapshot), min_time=min_time, repeat=repeat)
+        results['micro.snapshot_to_bytes.' + name] = measure(snapshot.to_bytes, min_time=min_time, repeat=repeat)
+        results['micro.snapshot_from_bytes.' + name] = measure(
+            lambda: GameState.from_bytes(data), min_time=min_time, repeat=repeat)
+
+        # 全列の着地する行（列の高さの索引が最新のとき）と、索引の作り直し
+        columns = range(engine.FIELD_WIDTH)
+
+        def landing_all():
+            for x in columns:
+                engine.landing_row(x, -1)
+
+        results['micro.landing_row.' + name] = measure(landing_all, min_time=min_time, repeat=repeat)
+        results['micro.column_tops.' + name] = measure(engine.board.column_tops, min_time=min_time, repeat=repeat)
+        engine.events = []
+    return results
+
+
+def macro_benchmarks(games, repeat, board=(8, 6)):
+    """ゲーム全体を回す速度（step/秒、配置/秒）"""
+    from simulate import play_game
+
+    results = {}
+    # search 方針は1手ごとに先読みするので、ゲーム数と長さを絞る
+    for policy_name, policy_games, max_frames in (("greedy", games, 60 * 60 * 30),
+                                                  ("search", max(1, games // 10), 60 * 60 * 2)):
+        samples = []
+        for _ in range(repeat):
+            frames = 0
+            start = time.perf_counter()
+            for seed in range(policy_games):
+                # 飛ばしたフレームを step に数えないよう、全フレームを step で進める
+                frames += play_game(seed, policy_name, max_frames, fast_forward=False, board=board)[1]
+            samples.append(frames / (time.perf_counter() - start))
+        results['macro.game_steps.' + policy_name] = {'value': max(samples), 'median': statistics.median(samples),
+                                                      'unit': "steps/s", 'better': "higher"}
+
+    try:
+        from batch_engine import BatchEngine
+    except ImportError:  # NumPy がなければ BatchEngine は測らない
+        return results
+    samples = []
+    for r in range(repeat):
+        engine = BatchEngine(256, seed=r, width=board[0], height=board[1])
+        start = time.perf_counter()
+        while not engine.game_over.all():
+            engine.step(engine.rng.integers(0, engine.FIELD_WIDTH, size=engine.n))
+        samples.append(int(engine.placed.sum()) / (time.perf_counter() - start))
+    results['macro.batch_placements.random'] = {'value': max(samples), 'median': statistics.median(samples),
+                                                'unit': "placements/s", 'better': "higher"}
+    return results
+
+
+def draw_benchmarks(corpus, min_time, repeat, board=(8, 6)):
+    """Pyxel のヘッドレス描画で1フレームの描画時間を測る"""
+    from main import HanafudaTetris
+
+    app = HanafudaTetris(headless=True, field_width=board[0], field_height=board[1])
+    app.start_game()
+    results = {}
+    for name, field in corpus.items():
+        app.engine.load_field(field)
+        app.draw()
+
+        def invalidate():
+            app.field_layer_key = None
+            app.overlay_layer_key = None
+
+        # 盤面の画像が作り済みのフレームと、描き直しが入るフレーム
+        results['draw.cached.' + name] = measure(app.draw, min_time=min_time, repeat=repeat)
+        results['draw.rebuild.' + name] = measure(app.draw, setup=invalidate, min_time=min_time, repeat=repeat)
+    return results
+
+
+def startup_benchmarks(repeat):
+    """新しいプロセスで起動し、最初のフレームまでの時間と段階ごとの時間を測る"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    samples = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP_PROBE], cwd=root, check=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+        elapsed = (time.perf_counter() - start) * 1000.0
+        data = json.loads(output.splitlines()[-1])  # Pyxel の警告が標準出力に混ざることがある
+        samples.setdefault('startup.process', []).append(elapsed)
+        samples.setdefault('startup.first_frame', []).append(data['first_frame_ms'])
+        for name, ms in data['phases']:
+            samples.setdefault('startup.phase.' + name, []).append(ms)
+    return {name: {'value': min(values), 'median': statistics.median(values),
+                   'unit': "ms", 'better': "lower"}
+            for name, values in samples.items()}
+
+
+def compare(results, baseline, threshold):
+    """基準の結果と比べて表示し、閾値を超えて遅くなった項目の名前を返す"""
+    regressions = []
+    print("%-48s %20s %20s %8s" % ("benchmark", "baseline", "current", "change"))
+    for name in sorted(results):
+        if name not in baseline:
+            print("%-48s %20s %20s" % (name, "-", _format(results[name])))
+            continue
+        old, new = baseline[name]['value'], results[name]['value']
+        if results[name]['better'] == "lower":
+            change = old / new - 1 if new else 0.0
+        else:
+            change = new / old - 1 if old else 0.0
+        # change は「速くなった割合」（負なら遅くなった）
+        mark = ""
+        if change < -threshold:
+            mark = "  REGRESSION"
+            regressions.append(name)
+        elif change > threshold:
+            mark = "  faster"
+        print("%-48s %20s %20s %+7.1f%%%s" % (name, _format(baseline[name]), _format(results[name]),
+                                              change * 100, mark))
+    return regressions
+
+
+def _format(result):
+    return "%.6g %s" % (result['value'], result['unit'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="花札テトリスのベンチマーク")
+    parser.add_argument("--quick", action="store_true", help="計測時間を短くする（目安を見る用）")
+    parser.add_argument("--draw", action="store_true", help="Pyxel のヘッドレス描画も測る")
+    parser.add_argument("--startup", action="store_true", help="起動から最初のフレームまでの時間も測る")
+    parser.add_argument("--no-macro", action="store_true", help="ゲーム全体の計測を省く")
+    parser.add_argument("--board", type=board_size, default=(8, 6), metavar="WxH",
+                        help="盤面の大きさ（既定: 8x6）")
+    parser.add_argument("--filter", help="名前にこの文字列を含む盤面だけを測る")
+    parser.add_argument("--json", help="結果を書き出す JSON ファイル")
+    parser.add_argument("--compare", help="比較する基準の JSON ファイル")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="この割合より遅くなったら回帰とみなす（既定: 0.10）")
+    args = parser.parse_args(argv)
+
+    min_time, repeat, games = (0.005, 3, 3) if args.quick else (0.02, 5, 20)
+    corpus = build_corpus(*args.board)
+    if args.filter:
+        corpus = {name: field for name, field in corpus.items() if args.filter in name}
+
+    results = micro_benchmarks(corpus, min_time, repeat, args.board)
+    if not args.no_macro:
+        results.update(macro_benchmarks(games, repeat, args.board))
+    if args.draw:
+        results.update(draw_benchmarks(corpus, min_time, repeat, args.board))
+    if args.startup:
+        results.update(startup_benchmarks(repeat * 2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+    else:
+        regressions = []
+        for name, result in results.items():
+            print("%-48s %20s" % (name, _format(result)))
+
+    if args.json:
+        data = {
+            'meta': {
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'platform': platform.platform(),
+                'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                'config': vars(args),
+            },
+            'results': results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(data, f, indent=1)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
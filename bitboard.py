@@ -0,0 +1,369 @@
+"""フィールドのビットボード表現
+
+マス (x, y) をビット y * width + x に対応させ、占有マスクと月ごとのマスクで
+盤面を表す。連結判定・重力はすべて整数のシフトと論理演算で行う。
+大きい盤面（LARGE_BOARD_CELLS マスを超える）では盤面全体の整数のシフトが重くなるので、
+LargeFieldBitboard が連結判定を行ごとの小さな整数に分けて行う。
+"""
+
+from itertools import chain
+
+# これより大きい盤面は LargeFieldBitboard で扱う
+LARGE_BOARD_CELLS = 1024
+
+# LargeFieldBitboard が盤面全体のシフトで連結を広げる回数（止まらなければ行ごとの探索に切り替える）
+SHIFT_FILL_STEPS = 8
+
+
+if hasattr(int, "bit_count"):
+    def popcount(mask):
+        """立っているビット数を数える"""
+        return mask.bit_count()
+else:
+    def popcount(mask):
+        """立っているビット数を数える（Python 3.9以前）"""
+        return bin(mask).count("1")
+
+
+def make_bitboard(width, height):
+    """盤面の大きさに合ったビットボード"""
+    if width * height > LARGE_BOARD_CELLS:
+        return LargeFieldBitboard(width, height)
+    return FieldBitboard(width, height)
+
+
+_ONE_HOT = {}
+
+
+def value_masks(rows, count):
+    """マスの値（0..count-1）ごとの位置マスクを、盤面の行のリストからまとめて作る
+
+    1マスずつ整数を作らず、バイト列の置換と2進数の文字列の変換で一度に求める。
+    """
+    flat = bytes(chain.from_iterable(rows))[::-1]  # 2進数の文字列は上位ビットが先
+    masks = [0] * count
+    for value in set(flat):
+        if value:
+            table = _ONE_HOT.get(value)
+            if table is None:
+                table = bytearray(b"0" * 256)
+                table[value] = ord("1")
+                table = _ONE_HOT[value] = bytes(table)
+            masks[value] = int(flat.translate(table), 2)
+    return masks
+
+
+class FieldBitboard:
+    """占有マスク＋月ごとのマスクで盤面を保持する"""
+
+    large = False  # 大きい盤面用（LargeFieldBitboard）か
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.size = width * height
+
+        # 盤面全体・列ごとのマスク（横方向シフトの回り込み防止用）
+        self.full = (1 << self.size) - 1
+        first_col = 0
+        for y in range(height):
+            first_col |= 1 << (y * width)
+        last_col = first_col << (width - 1)
+        self.not_first_col = self.full & ~first_col
+        self.not_last_col = self.full & ~last_col
+        self.column_masks = [first_col << x for x in range(width)]
+
+        self.clear_all()
+
+    def clear_all(self):
+        """盤面を空にする"""
+        self.occupied = 0
+        self.month_masks = [0] * 13  # 添字は月（1-12）、0は未使用
+
+    def load_months(self, month_masks):
+        """月ごとのマスクから盤面を作る"""
+        self.month_masks = list(month_masks)
+        occupied = 0
+        for mask in month_masks:
+            occupied |= mask
+        self.occupied = occupied
+
+    def state(self):
+        """今の盤面（restore で戻せる）"""
+        return self.occupied, tuple(self.month_masks)
+
+    def restore(self, state):
+        occupied, month_masks = state
+        self.occupied = occupied
+        self.month_masks = list(month_masks)
+
+    def bit(self, x, y):
+        """マスに対応するビット"""
+        return 1 << (y * self.width + x)
+
+    def place(self, x, y, month):
+        """花札を置く"""
+        b = 1 << (y * self.width + x)
+        self.occupied |= b
+        self.month_masks[month] |= b
+
+    def remove(self, x, y, month):
+        """花札を取り除く"""
+        b = ~(1 << (y * self.width + x))
+        self.occupied &= b
+        self.month_masks[month] &= b
+
+    def remove_mask(self, mask):
+        """マスクで指定したマスをまとめて取り除く"""
+        keep = ~mask
+        self.occupied &= keep
+        masks = self.month_masks
+        for month in range(1, 13):
+            if masks[month] & mask:
+                masks[month] &= keep
+
+    def flood_fill(self, seed, region):
+        """seed から region 内で上下左右に連結した領域を求める"""
+        w = self.width
+        not_first = self.not_first_col
+        not_last = self.not_last_col
+        comp = seed & region
+        while True:
+            grown = (comp | ((comp << 1) & not_first) | ((comp >> 1) & not_last) |
+                     (comp << w) | (comp >> w)) & region
+            if grown == comp:
+                return comp
+            comp = grown
+
+    def groups(self, region, min_size=3):
+        """region 内の連結成分のうち min_size 以上のものをまとめたマスク"""
+        result = 0
+        rest = region
+        while rest:
+            seed = rest & -rest
+            comp = self.flood_fill(seed, rest)
+            rest ^= comp
+            if popcount(comp) >= min_size:
+                result |= comp
+        return result
+
+    def matching_groups(self, min_size=3):
+        """全ての月について min_size 枚以上つながった花札のマスク"""
+        result = 0
+        for month in range(1, 13):
+            mask = self.month_masks[month]
+            if mask and popcount(mask) >= min_size:
+                result |= self.groups(mask, min_size)
+        return result
+
+    def matching_groups_touching(self, seeds, min_size=3):
+        """seeds のマスを含む連結成分のうち min_size 以上のものだけを探索"""
+        result = 0
+        masks = self.month_masks
+        for month in range(1, 13):
+            mask = masks[month]
+            pending = seeds & mask
+            while pending:
+                comp = self.flood_fill(pending & -pending, mask)
+                pending &= ~comp
+                if popcount(comp) >= min_size:
+                    result |= comp
+        return result
+
+    def floating(self):
+        """真下が空いている花札のマスク"""
+        occupied = self.occupied
+        return occupied & ((self.full & ~occupied) >> self.width)
+
+    def fall_step(self):
+        """真下が空いている花札を1段落とし、動いた元の位置のマスクを返す"""
+        w = self.width
+        occupied = self.occupied
+        empty = self.full & ~occupied
+        moving = occupied & (empty >> w)
+        if moving:
+            self.occupied = (occupied & ~moving) | (moving << w)
+            masks = self.month_masks
+            for month in range(1, 13):
+                m = masks[month] & moving
+                if m:
+                    masks[month] = (masks[month] & ~m) | (m << w)
+        return moving
+
+    def column_tops(self):
+        """列ごとの一番上の花札の行のリスト（空の列は height）"""
+        w = self.width
+        occupied = self.occupied
+        tops = []
+        for mask in self.column_masks:
+            m = occupied & mask
+            tops.append(((m & -m).bit_length() - 1) // w if m else self.height)
+        return tops
+
+    def landing_row(self, x, y):
+        """(x, y) から真下に落としたときに止まる行（y より下の一番上の花札の1つ上）"""
+        w = self.width
+        below = self.occupied & self.column_masks[x] & ~((1 << ((y + 1) * w)) - 1)
+        if not below:
+            return self.height - 1
+        return ((below & -below).bit_length() - 1) // w - 1
+
+    def positions(self, mask):
+        """マスクを (x, y) のリストに変換"""
+        w = self.width
+        result = []
+        while mask:
+            low = mask & -mask
+            y, x = divmod(low.bit_length() - 1, w)
+            result.append((x, y))
+            mask ^= low
+        return result
+
+    def mask_of(self, positions):
+        """(x, y) の集まりをマスクに変換"""
+        w = self.width
+        mask = 0
+        for x, y in positions:
+            mask |= 1 << (y * w + x)
+        return mask
+
+
+class LargeFieldBitboard(FieldBitboard):
+    """大きい盤面用のビットボード
+
+    盤面全体の整数のシフトはマス数に比例するので、連結判定は領域を行ごとの整数に分けて行う。
+    行の中は足し算の繰り上がりとシフトの倍々で一度に広げ、上下の行へは増えた分だけを伝える。
+    マスクと座標の変換も1ビットずつではなく文字列・バイト列でまとめて行う。
+    """
+
+    large = True
+
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.row_mask = (1 << width) - 1
+        shifts = []
+        shift = 1
+        while shift < width:
+            shifts.append(shift)
+            shift *= 2
+        self.row_shifts = tuple(shifts)
+
+    def split_rows(self, mask):
+        """マスクを行ごとの整数のリストにする"""
+        w = self.width
+        row_mask = self.row_mask
+        rows = []
+        for _ in range(self.height):
+            rows.append(mask & row_mask)
+            mask >>= w
+        return rows
+
+    def join_rows(self, rows):
+        """split_rows の逆"""
+        w = self.width
+        mask = 0
+        for row in reversed(rows):
+            mask = (mask << w) | row
+        return mask
+
+    def fill_row(self, seed, row):
+        """row の中で seed から左右に続くマス"""
+        # 右（上位ビット）へは繰り上がりで広げる（seed のうち途中のものは or で戻す）
+        fill = (row & ~(row + seed)) | seed
+        # 左（下位ビット）へはシフトの倍々で広げる
+        prop = row
+        for shift in self.row_shifts:
+            fill |= prop & (fill >> shift)
+            prop &= prop >> shift
+        return fill
+
+    def fill_rows(self, rows, comp):
+        """行ごとの領域 rows の中で comp（行 -> ビット）から上下左右に広げる（comp を書き換える）"""
+        height = self.height
+        fill_row = self.fill_row
+        stack = list(comp)
+        while stack:
+            y = stack.pop()
+            bits = fill_row(comp[y], rows[y])
+            comp[y] = bits
+            for ny in (y - 1, y + 1):
+                if 0 <= ny < height:
+                    add = bits & rows[ny] & ~comp.get(ny, 0)
+                    if add:
+                        comp[ny] = comp.get(ny, 0) | add
+                        stack.append(ny)
+        return comp
+
+    def grouped_rows(self, rows, seeds, min_size):
+        """seeds（行ごと、書き換える）を含む連結成分のうち min_size 以上のもの（行ごと）"""
+        result = [0] * self.height
+        for y in range(self.height):
+            while seeds[y]:
+                comp = self.fill_rows(rows, {y: seeds[y] & -seeds[y]})
+                size = 0
+                for cy, bits in comp.items():
+                    seeds[cy] &= ~bits
+                    size += popcount(bits)
+                if size >= min_size:
+                    for cy, bits in comp.items():
+                        result[cy] |= bits
+        return result
+
+    def flood_fill(self, seed, region):
+        # 小さい連結なら盤面全体のシフトの方が速いので、数回広げて止まらなければ行ごとに切り替える
+        w = self.width
+        not_first = self.not_first_col
+        not_last = self.not_last_col
+        start = seed & region
+        for _ in range(SHIFT_FILL_STEPS):
+            grown = (start | ((start << 1) & not_first) | ((start >> 1) & not_last) |
+                     (start << w) | (start >> w)) & region
+            if grown == start:
+                return start
+            start = grown
+        rows = self.split_rows(region)
+        comp = {y: bits for y, bits in enumerate(self.split_rows(start)) if bits}
+        result = [0] * self.height
+        for y, bits in self.fill_rows(rows, comp).items():
+            result[y] = bits
+        return self.join_rows(result)
+
+    def groups(self, region, min_size=3):
+        rows = self.split_rows(region)
+        seeds = region
+        if min_size > 1:
+            # 上下左右に同じ領域のマスがないマスは連結にならないので、探索の起点にしない
+            w = self.width
+            seeds &= (((region << 1) & self.not_first_col) | ((region >> 1) & self.not_last_col) |
+                      (region << w) | (region >> w))
+        return self.join_rows(self.grouped_rows(rows, self.split_rows(seeds), min_size))
+
+    def matching_groups_touching(self, seeds, min_size=3):
+        if popcount(seeds) <= SHIFT_FILL_STEPS:
+            # 起点が少なければ連結ごとに flood_fill する方が速い
+            return super().matching_groups_touching(seeds, min_size)
+        result = 0
+        for mask in self.month_masks[1:]:
+            if seeds & mask:
+                result |= self.join_rows(self.grouped_rows(
+                    self.split_rows(mask), self.split_rows(seeds & mask), min_size))
+        return result
+
+    def positions(self, mask):
+        w = self.width
+        bits = bin(mask)[:1:-1]  # 下位ビットから
+        result = []
+        i = bits.find("1")
+        while i >= 0:
+            y, x = divmod(i, w)
+            result.append((x, y))
+            i = bits.find("1", i + 1)
+        return result
+
+    def mask_of(self, positions):
+        w = self.width
+        buf = bytearray((self.size + 7) // 8)
+        for x, y in positions:
+            i = y * w + x
+            buf[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(buf, "little")
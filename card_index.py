@@ -0,0 +1,73 @@
+"""フィールド上の花札の位置索引
+
+花札の配置・消去・落下に合わせて更新し、役判定が盤面を走査せずに
+マスクとその枚数を読むだけで済むようにする。位置はビットボードと同じく
+ビット y * width + x で表す。
+"""
+
+from cards import CARD_MONTH, CARD_IN_MONTH, CARD_COLOR, COLOR_RED, COLOR_BLUE
+
+
+class CardIndex:
+    """札IDごと・各月1枚目・短冊の色ごとの位置マスク"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """索引を空にする"""
+        self.card_masks = [0] * 49   # 札ID -> 位置マスク
+        self.first_masks = [0] * 13  # 月 -> その月の1枚目の位置マスク
+        self.blue_tan = 0            # 青短の位置マスク
+        self.red_tan = 0             # 赤短の位置マスク
+
+    def load(self, card_masks):
+        """札IDごとの位置マスクから索引を作る"""
+        self.clear()
+        for card_id in range(1, 49):
+            if card_masks[card_id]:
+                self.add(card_id, card_masks[card_id])
+
+    def state(self):
+        """今の索引（restore で戻せる）"""
+        return tuple(self.card_masks), tuple(self.first_masks), self.blue_tan, self.red_tan
+
+    def restore(self, state):
+        card_masks, first_masks, self.blue_tan, self.red_tan = state
+        self.card_masks = list(card_masks)
+        self.first_masks = list(first_masks)
+
+    def add(self, card_id, bit):
+        """花札が置かれた"""
+        self.card_masks[card_id] |= bit
+        if CARD_IN_MONTH[card_id] == 1:
+            self.first_masks[CARD_MONTH[card_id]] |= bit
+        color = CARD_COLOR[card_id]
+        if color == COLOR_BLUE:
+            self.blue_tan |= bit
+        elif color == COLOR_RED:
+            self.red_tan |= bit
+
+    def remove(self, card_id, bit):
+        """花札が取り除かれた"""
+        keep = ~bit
+        self.card_masks[card_id] &= keep
+        if CARD_IN_MONTH[card_id] == 1:
+            self.first_masks[CARD_MONTH[card_id]] &= keep
+        color = CARD_COLOR[card_id]
+        if color == COLOR_BLUE:
+            self.blue_tan &= keep
+        elif color == COLOR_RED:
+            self.red_tan &= keep
+
+    def move(self, card_id, from_bit, to_bit):
+        """花札が移動した"""
+        flip = from_bit | to_bit
+        self.card_masks[card_id] ^= flip
+        if CARD_IN_MONTH[card_id] == 1:
+            self.first_masks[CARD_MONTH[card_id]] ^= flip
+        color = CARD_COLOR[card_id]
+        if color == COLOR_BLUE:
+            self.blue_tan ^= flip
+        elif color == COLOR_RED:
+            self.red_tan ^= flip
@@ -0,0 +1,129 @@
+"""花札の属性テーブル
+
+札ID（1-48、月ごとに4枚ずつ）で引ける平坦なタプルを起動時に一度だけ作る。
+ルール・描画の処理はすべてここのテーブルを添字で読む（添字0は空マス用）。
+"""
+
+CARD_COUNT = 48
+
+# 札の種類
+TYPE_NONE = 0
+TYPE_HIKARI = 1  # 光札
+TYPE_TAN = 2     # 短冊
+TYPE_TANE = 3    # 種札
+TYPE_KASU = 4    # カス札
+TYPE_NAMES = ("", "光", "短", "種", "カス")
+
+# 短冊の色
+COLOR_NORMAL = 0
+COLOR_RED = 1    # 赤短
+COLOR_BLUE = 2   # 青短
+COLOR_NAMES = ("通常", "赤", "青")
+
+# 役に関わる札のビット（各月1枚目・短冊の色で決まる）
+YAKU_GOKO = 1          # 五光・雨四光・四光・三光（1,3,8,11,12月の1枚目）
+YAKU_RAIN = 2          # 雨四光の必須札（11月1枚目）
+YAKU_INOSHIKACHO = 4   # 猪鹿蝶（6,7,10月の1枚目）
+YAKU_HANAMI = 8        # 花見で一杯（3,9月の1枚目）
+YAKU_TSUKIMI = 16      # 月見で一杯（8,9月の1枚目）
+YAKU_AKATAN = 32       # 赤短
+YAKU_AOTAN = 64        # 青短
+
+# 画像の配置（イメージバンク0、2か月で1行、1枚 20x32）
+CARD_IMAGE_WIDTH = 20
+CARD_IMAGE_HEIGHT = 32
+
+
+def get_card_type(month, card):
+    """カードタイプを取得"""
+    # 光札（ひかりふだ）
+    if card == 1 and month in (1, 3, 8, 11, 12):
+        return TYPE_HIKARI
+    # 短冊（たんざく）
+    elif card == 2:
+        return TYPE_TAN
+    # 種札（たねふだ）
+    elif card == 3:
+        return TYPE_TANE
+    # カス札
+    else:
+        return TYPE_KASU
+
+
+def get_card_color(month, card):
+    """カードの色を取得"""
+    # 赤短
+    if month in (1, 2, 3) and card == 2:
+        return COLOR_RED
+    # 青短
+    elif month in (6, 9, 10) and card == 2:
+        return COLOR_BLUE
+    else:
+        return COLOR_NORMAL
+
+
+def get_card_yaku(month, card):
+    """カードが関わる役のビットを取得"""
+    yaku = 0
+    if card == 1:
+        if month in (1, 3, 8, 11, 12):
+            yaku |= YAKU_GOKO
+        if month == 11:
+            yaku |= YAKU_RAIN
+        if month in (6, 7, 10):
+            yaku |= YAKU_INOSHIKACHO
+        if month in (3, 9):
+            yaku |= YAKU_HANAMI
+        if month in (8, 9):
+            yaku |= YAKU_TSUKIMI
+    color = get_card_color(month, card)
+    if color == COLOR_RED:
+        yaku |= YAKU_AKATAN
+    elif color == COLOR_BLUE:
+        yaku |= YAKU_AOTAN
+    return yaku
+
+
+def get_card_image_pos(month, card):
+    """カードの画像位置を取得"""
+    # 1月1枚目(0,0),2枚目(20,0),3枚目(40,0),4枚目(60,0)
+    # 2月1枚目(80,0),2枚目(100,0),3枚目(120,0),4枚目(140,0)
+    # 3月1枚目(0,32),2枚目(20,32),...
+    row = (month - 1) // 2  # 2月ごとに行が変わる
+    col_offset = ((month - 1) % 2) * 4  # 奇数月は0、偶数月は4列目から
+    u = (col_offset + card - 1) * CARD_IMAGE_WIDTH
+    v = row * CARD_IMAGE_HEIGHT
+    return 0, u, v  # 全てイメージバンク0に配置
+
+
+def build_tables():
+    """全属性テーブルを作成"""
+    month_t = [0]
+    card_t = [0]
+    type_t = [TYPE_NONE]
+    color_t = [COLOR_NORMAL]
+    yaku_t = [0]
+    bank_t = [0]
+    u_t = [0]
+    v_t = [0]
+    for month in range(1, 13):
+        for card in range(1, 5):
+            month_t.append(month)
+            card_t.append(card)
+            type_t.append(get_card_type(month, card))
+            color_t.append(get_card_color(month, card))
+            yaku_t.append(get_card_yaku(month, card))
+            bank, u, v = get_card_image_pos(month, card)
+            bank_t.append(bank)
+            u_t.append(u)
+            v_t.append(v)
+    return (tuple(month_t), tuple(card_t), tuple(type_t), tuple(color_t),
+            tuple(yaku_t), tuple(bank_t), tuple(u_t), tuple(v_t))
+
+
+# 札ID -> 月 / 月内の番号(1-4) / 種類 / 色 / 役ビット / イメージバンク / 画像u / 画像v
+(CARD_MONTH, CARD_IN_MONTH, CARD_TYPE, CARD_COLOR,
+ CARD_YAKU, CARD_BANK, CARD_U, CARD_V) = build_tables()
+
+# 月 -> その月の1枚目の札ID
+MONTH_FIRST_CARD = (0,) + tuple((month - 1) * 4 + 1 for month in range(1, 13))
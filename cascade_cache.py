@@ -0,0 +1,126 @@
+"""連鎖の解決結果のキャッシュ
+
+置いた直後の盤面（Zobrist ハッシュ）・調べ始めるマス・ボーナスタイム中かどうかが
+同じなら、連鎖の結果（各段の消去マス・得点・役・最終盤面）は必ず同じになる。
+探索やリプレイで同じ盤面が何度も現れるので、結果を LRU で保持して使い回す。
+ロックで守っているので、同じプロセス内のスレッドで1つのキャッシュを共有できる。
+"""
+
+import random
+import threading
+from collections import OrderedDict
+
+
+class ZobristHasher:
+    """盤面（マス × 札ID）の Zobrist ハッシュ"""
+
+    def __init__(self, width, height, seed=0x5EED):
+        rng = random.Random(seed)
+        self.width = width
+        self.height = height
+        # table[マス][札ID]（札ID 0 は空マスなので0）
+        self.table = [[0] + [rng.getrandbits(64) for _ in range(48)] for _ in range(width * height)]
+        # 置く札の並び（何手目にどの札か）を区別するための値
+        self.card_keys = [[rng.getrandbits(64) for _ in range(49)] for _ in range(4)]
+
+    def hash_field(self, field):
+        table = self.table
+        w = self.width
+        h = 0
+        for y, row in enumerate(field):
+            base = y * w
+            for x, card_id in enumerate(row):
+                if card_id:
+                    h ^= table[base + x][card_id]
+        return h
+
+    def toggle(self, h, x, y, card_id):
+        """(x, y) の札を置いた／取り除いたあとのハッシュ"""
+        return h ^ self.table[y * self.width + x][card_id]
+
+
+class CascadeResult:
+    """1回の連鎖の解決結果"""
+
+    __slots__ = ("steps", "yaku", "score", "field", "field_hash")
+
+    def __init__(self, steps, yaku, score, field):
+        self.steps = steps    # 各段の (消去したマスの frozenset, その段の得点)
+        self.yaku = yaku      # 成立した役の (役ビット, ボーナス) の並び
+        self.score = score    # 役のボーナスを含む得点の合計
+        self.field = field    # 連鎖が終わったあとの盤面（タプルのタプル）
+        self.field_hash = None  # 最終盤面の Zobrist ハッシュ（キャッシュに入れたときに求める）
+
+    @property
+    def combo(self):
+        """連鎖数（消去が起きた段数）"""
+        return len(self.steps)
+
+    @property
+    def removed(self):
+        """消した枚数の合計"""
+        return sum(len(positions) for positions, _ in self.steps)
+
+
+class CascadeCache:
+    """連鎖の解決結果の LRU キャッシュ"""
+
+    def __init__(self, capacity=65536, width=8, height=6):
+        self.capacity = capacity
+        self.hasher = ZobristHasher(width, height)
+        self.entries = OrderedDict()  # キー -> (置いた直後の盤面, CascadeResult)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, field, dirty_mask, bonus, field_hash=None):
+        """キャッシュのキー（field_hash が分かっていれば計算を省く）"""
+        if field_hash is None:
+            field_hash = self.hasher.hash_field(field)
+        return (field_hash, dirty_mask, bonus)
+
+    def get(self, key, field):
+        """キャッシュ済みの結果（盤面が一致しなければハッシュの衝突として扱い None）"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == tuple(map(tuple, field)):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, field, result):
+        if result.field_hash is None:
+            result.field_hash = self.hasher.hash_field(result.field)
+        start = tuple(map(tuple, field))
+        with self.lock:
+            entries = self.entries
+            entries[key] = (start, result)
+            entries.move_to_end(key)
+            while len(entries) > self.capacity:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self.entries), 'capacity': self.capacity,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+_shared = {}
+
+
+def shared_cache(width=8, height=6):
+    """このプロセスで共有するキャッシュ（盤面の大きさごとに1つ）"""
+    cache = _shared.get((width, height))
+    if cache is None:
+        cache = _shared[(width, height)] = CascadeCache(width=width, height=height)
+    return cache
@@ -0,0 +1,59 @@
+"""連鎖の台本
+
+花札を置いた時点で連鎖を最後まで解決しておき、各段の消去マス・得点・落下後の盤面・
+落下後に成立した役を順に並べたもの。エンジンの消去演出（点滅 → 消去 → 落下）は
+この台本を1段ずつ再生するだけで、ルールの判定はやり直さない。
+
+1段は STAGE_FRAMES フレーム（点滅 MARK_FRAMES → 消去 → 落下）で、
+置いたフレームから数えて start + k * STAGE_FRAMES + MARK_FRAMES + 1 で k 段目が消える。
+"""
+
+MARK_FRAMES = 30                # 消去前に点滅させるフレーム数
+STAGE_FRAMES = MARK_FRAMES + 2  # 1段あたりのフレーム数（点滅・消去・落下）
+
+
+class CascadeStage:
+    """連鎖の1段"""
+
+    __slots__ = ("positions", "points", "state", "yaku")
+
+    def __init__(self, positions, points, state, yaku):
+        self.positions = positions  # 消えるマスの frozenset
+        self.points = points        # 連鎖倍率・ボーナスタイムを含むこの段の得点
+        self.state = state          # 落下後の盤面（HanafudaEngine.save_state の値）
+        self.yaku = yaku            # 落下後に成立した役の (役ビット, ボーナス) の並び
+
+    @property
+    def field(self):
+        """落下後の盤面（タプルのタプル）"""
+        return self.state[0]
+
+
+class CascadeScript:
+    """置いた時点で解決した連鎖全体"""
+
+    __slots__ = ("start_frame", "stages")
+
+    def __init__(self, start_frame, stages):
+        self.start_frame = start_frame  # 花札を置いたフレーム
+        self.stages = stages            # CascadeStage のタプル
+
+    @property
+    def combo(self):
+        """連鎖数"""
+        return len(self.stages)
+
+    @property
+    def score(self):
+        """置いたあとに増える得点（落下後の役のボーナスを含み、置いた時点の役は含まない）"""
+        return sum(stage.points + sum(bonus for _, bonus in stage.yaku) for stage in self.stages)
+
+    @property
+    def field(self):
+        """連鎖が終わったあとの盤面"""
+        return self.stages[-1].field
+
+    @property
+    def end_frame(self):
+        """最後の落下のフレーム（この次のフレームから消去後の一時停止が進む）"""
+        return self.start_frame + len(self.stages) * STAGE_FRAMES
@@ -0,0 +1,104 @@
+"""固定ステップのゲーム時計
+
+ルールのタイマー（drop_speed, spawn_delay, pause_time, bonus_time, 消去前の点滅）は
+すべて「ティック」（HanafudaEngine.step の呼び出し回数）で数え、1秒は TICK_RATE ティック。
+描画のフレームレートとは切り離し、経過時間を貯めて（アキュムレータ）1ティックぶん
+たまるごとにルールを1回進める。描画が遅れても時間の流れは変わらず、1フレームで
+複数ティックを進めて追いつく（進めるのは max_ticks まで、それ以上の遅れは捨てる）。
+描画は端数の時間（alpha）で1ティック先までを補間する。
+
+ヘッドレスでは経過時間を引数で渡せば、実時間と無関係に任意の速さで回せる。
+どの速さで回してもティックの列は同じなので、ルール上の時間の意味は変わらない。
+
+    python clock.py   # いろいろなフレーム間隔で、経過時間どおりのティック数になるかを確かめる
+"""
+
+import sys
+import time
+
+TICK_RATE = 60    # 1秒あたりのティック数（ルールのタイマーはこの単位）
+MAX_CATCH_UP = 8  # 1フレームで進める最大ティック数（これを超える遅れは捨てる）
+SNAP = 0.1        # フレーム間隔がティックの整数倍からこの割合以内ならちょうどに丸める
+
+
+class FixedStepClock:
+    """経過時間をティック数に変換するアキュムレータ"""
+
+    def __init__(self, tick_rate=TICK_RATE, max_ticks=MAX_CATCH_UP, time_source=time.perf_counter):
+        self.tick_rate = tick_rate
+        self.step = 1.0 / tick_rate  # 1ティックの秒数
+        self.max_ticks = max_ticks
+        self.time_source = time_source
+        self.last = None          # 前回 advance したときの時刻
+        self.accumulator = 0.0    # まだティックにしていない経過時間（秒）
+        self.ticks = 0            # 進めたティック数の合計
+        self.frames = 0           # advance した（描画した）フレーム数
+        self.dropped = 0          # 追いつけずに捨てたティック数
+
+    def reset(self):
+        """次の advance から計り直す（貯めていた時間は捨てる）"""
+        self.last = None
+        self.accumulator = 0.0
+
+    def advance(self, elapsed=None):
+        """前回からの経過時間を足し、このフレームで進めるティック数を返す
+
+        elapsed を省くと time_source で計る（最初の呼び出しでは1ティックぶんとみなす）。
+        """
+        if elapsed is None:
+            now = self.time_source()
+            elapsed = self.step if self.last is None else now - self.last
+            self.last = now
+        # 表示のフレーム間隔の揺らぎで 0 ティックと 2 ティックが交互にならないように丸める
+        # （1ティックより短い間隔は丸めずに貯める、0 に丸めると時間が消えて進まなくなる）
+        step = self.step
+        whole = round(elapsed / step)
+        if whole >= 1 and abs(elapsed - whole * step) < step * SNAP:
+            elapsed = whole * step
+
+        self.accumulator += elapsed
+        ticks = int(self.accumulator / step + 1e-9)
+        self.accumulator = max(0.0, self.accumulator - ticks * step)
+        if ticks > self.max_ticks:
+            self.dropped += ticks - self.max_ticks
+            ticks = self.max_ticks
+        self.ticks += ticks
+        self.frames += 1
+        return ticks
+
+    @property
+    def alpha(self):
+        """次のティックまでの進み具合（0以上1未満、描画の補間に使う）"""
+        return min(self.accumulator / self.step, 1.0)
+
+    @property
+    def seconds(self):
+        """進めたティック数を秒に換算したゲーム内の時間"""
+        return self.ticks / self.tick_rate
+
+
+def check(seconds=10.0):
+    """いろいろなフレーム間隔で seconds 秒ぶん回し、ティック数が経過時間と食い違った
+    (fps, 進んだティック数, 期待値) のリストを返す（SNAP で丸まらない間隔だけを試す）"""
+    failures = []
+    expected = round(seconds * TICK_RATE)
+    for fps in (30, 45, 60, 75, 120, 144, 240, 700, 1000, 5000):
+        clock = FixedStepClock(max_ticks=1 << 30)
+        frame_time = 1.0 / fps
+        for _ in range(round(seconds * fps)):
+            clock.advance(frame_time)
+        if abs(clock.ticks - expected) > 1:
+            failures.append((fps, clock.ticks, expected))
+    return failures
+
+
+def main():
+    failures = check()
+    for fps, ticks, expected in failures:
+        print("fps %g: %d ticks (expected %d)" % (fps, ticks, expected))
+    print("ok" if not failures else "MISMATCH")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
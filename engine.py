@@ -0,0 +1,776 @@
+import random
+from itertools import chain
+
+from bitboard import make_bitboard, popcount, value_masks
+from card_index import CardIndex
+from cards import CARD_MONTH
+from cascade_cache import CascadeResult
+from cascade_script import MARK_FRAMES, CascadeScript, CascadeStage
+from game_state import GameState
+
+# 入力アクション（ビットフラグ、1フレーム分の入力を表す）
+ACTION_NONE = 0
+ACTION_LEFT = 1      # 左移動（押した瞬間）
+ACTION_RIGHT = 2     # 右移動（押した瞬間）
+ACTION_DOWN = 4      # 高速落下（押しっぱなし）
+ACTION_RESTART = 8   # リスタート（押した瞬間）
+ACTION_HARD_DROP = 16  # 即時落下（押した瞬間、着地する行まで落としてそのティックで固定）
+
+# 特殊役（yaku イベントでは成立した役を 1 << AWARD_* のビットで表す）
+AWARD_GOKO = 0         # 五光
+AWARD_AME_SHIKO = 1    # 雨四光
+AWARD_SHIKO = 2        # 四光
+AWARD_SANKO = 3        # 三光
+AWARD_INOSHIKACHO = 4  # 猪鹿蝶
+AWARD_HANAMI = 5       # 花見で一杯
+AWARD_TSUKIMI = 6      # 月見で一杯
+AWARD_AOTAN = 7        # 青短
+AWARD_AKATAN = 8       # 赤短
+YAKU_NAMES = ("goko", "ame_shiko", "shiko", "sanko", "inoshikacho",
+              "hanami", "tsukimi", "aotan", "akatan")
+YAKU_BONUS = (3000, 1500, 1200, 800, 1000, 400, 400, 500, 500)
+
+
+def board_size(text):
+    """"WxH" 形式の盤面の大きさ（argparse の type 用）"""
+    width, height = (int(value) for value in text.lower().split("x"))
+    if width < 1 or height < 1:
+        raise ValueError("盤面の大きさは1以上にしてください: %s" % text)
+    return width, height
+
+
+def yaku_names(awarded):
+    """役ビットを役名のリストに変換"""
+    return [name for i, name in enumerate(YAKU_NAMES) if awarded >> i & 1]
+
+
+class HanafudaEngine:
+    """花札テトリスのルールエンジン（Pyxelに依存しない）
+
+    step() 1回が元のゲームの update 1フレームに相当する。
+    描画・サウンドは行わず、起きた出来事を events に記録する。
+    盤面の大きさは width x height で変えられる（既定は元のゲームと同じ 8x6）。
+
+    出来事はタプルで、先頭が種類：
+        ("spawn", 札ID) ("move", x, y) ("hard_drop", x, 落とした段数) ("lock", x, y)
+        ("match", マスの集合, 月のビット) ("combo", 連鎖数) ("remove", マスの集合)
+        ("yaku", 役ビット, ボーナス) ("bonus", フレーム数) ("garbage", 行数)
+        ("game_over",) ("restart",)
+    """
+
+    def __init__(self, rng=None, verify_incremental=False, cascade_cache=None, width=8, height=6):
+        # ゲームフィールド設定
+        self.FIELD_WIDTH = width
+        self.FIELD_HEIGHT = height
+
+        # 乱数（シミュレーション毎に独立させられるようにする）
+        self.rng = rng if rng is not None else random.Random()
+
+        # 盤面のビットボード（field と常に同じ内容を保つ、大きい盤面では行ごとに探索するもの）
+        self.board = make_bitboard(self.FIELD_WIDTH, self.FIELD_HEIGHT)
+
+        # 札の位置索引（役判定用、field と常に同じ内容を保つ）
+        self.card_index = CardIndex()
+
+        # True なら差分判定の結果を毎回全体走査と照合する（検証用）
+        self.verify_incremental = verify_incremental
+
+        # resolve_chain の結果を使い回すキャッシュ（CascadeCache、None なら毎回計算）
+        self.cascade_cache = cascade_cache
+
+        # このフレームで起きた出来事（("lock", x, y) など）
+        self.events = []
+
+        # field が変わるたびに増える番号（描画側のキャッシュ判定用、状態を戻したときも増やす）
+        self.field_version = 0
+
+        # 列ごとの一番上の花札の行（column_tops）と、それを作ったときの field_version
+        self.tops = None
+        self.tops_version = -1
+
+        self.reset()
+
+    def reset(self):
+        """ゲームを開始状態に戻す（各状態の意味は GameState を参照）"""
+        self.restore_snapshot(GameState(self.FIELD_WIDTH, self.FIELD_HEIGHT))
+        self.events = []
+        self.next_card = self.rng.randint(1, 48)
+        self.spawn_new_card()
+
+    def snapshot(self, rng=True):
+        """今の状態を GameState に写す（restore_snapshot で戻せる、rng=False なら乱数の状態は含めない）"""
+        state = GameState.__new__(GameState)
+        state.width = self.FIELD_WIDTH
+        state.height = self.FIELD_HEIGHT
+        state.cells = bytes(chain.from_iterable(self.field))
+        state.masks = (self.board.state(), self.card_index.state())
+        state.rng_state = self.rng.getstate() if rng else None
+        state.frame = self.frame
+        state.score = self.score
+        state.combo = self.combo
+        state.bonus_time = self.bonus_time
+        state.pause_time = self.pause_time
+        state.spawn_delay = self.spawn_delay
+        state.drop_timer = self.drop_timer
+        state.drop_speed = self.drop_speed
+        state.falling_card = self.falling_card
+        state.falling_x = self.falling_x
+        state.falling_y = self.falling_y
+        state.next_card = self.next_card
+        state.removal_state = self.removal_state
+        state.removal_timer = self.removal_timer
+        state.removal_flash_frame = self.removal_flash_frame
+        state.cards_to_remove = frozenset(self.cards_to_remove)
+        state.cascade_script = self.cascade_script
+        state.garbage_queue = tuple(self.garbage_queue)
+        state.game_over = self.game_over
+        return state
+
+    def restore_snapshot(self, state):
+        """snapshot で写した状態に戻す（盤面の大きさが同じエンジンに限る）"""
+        width = self.FIELD_WIDTH
+        if state.width != width or state.height != self.FIELD_HEIGHT:
+            raise ValueError("盤面の大きさが違います: %dx%d" % (state.width, state.height))
+        cells = state.cells
+        self.field = [list(cells[i:i + width]) for i in range(0, len(cells), width)]
+        if state.masks is None:
+            self.rebuild_masks()
+        else:
+            board, index = state.masks
+            self.board.restore(board)
+            self.card_index.restore(index)
+        if state.rng_state is not None:
+            self.rng.setstate(state.rng_state)
+        self.frame = state.frame
+        self.score = state.score
+        self.combo = state.combo
+        self.bonus_time = state.bonus_time
+        self.pause_time = state.pause_time
+        self.spawn_delay = state.spawn_delay
+        self.drop_timer = state.drop_timer
+        self.drop_speed = state.drop_speed
+        self.falling_card = state.falling_card
+        self.falling_x = state.falling_x
+        self.falling_y = state.falling_y
+        self.next_card = state.next_card
+        self.removal_state = state.removal_state
+        self.removal_timer = state.removal_timer
+        self.removal_flash_frame = state.removal_flash_frame
+        self.cards_to_remove = state.cards_to_remove
+        self.cascade_script = state.cascade_script
+        self.garbage_queue = list(state.garbage_queue)
+        self.game_over = state.game_over
+        self.dirty_mask = 0
+        self.field_version += 1
+
+    def spawn_new_card(self):
+        """新しい花札を生成"""
+        self.falling_card = self.next_card
+        self.falling_x = self.FIELD_WIDTH // 2
+        self.falling_y = 0
+        self.next_card = self.rng.randint(1, 48)
+        self.events.append(("spawn", self.falling_card))
+
+        # 連鎖の演出中でなければ、溜まっているおじゃま行をせり上げる
+        if self.garbage_queue and self.removal_state == "none":
+            self.raise_garbage()
+            if self.game_over:
+                return
+
+        # ゲームオーバーチェック
+        if self.field[0][self.falling_x] != 0:
+            self.game_over = True
+            self.events.append(("game_over",))
+
+    def queue_garbage(self, hole, offset=0):
+        """おじゃま行を1行予約する（hole の列は空ける、offset は札の月の選び方をずらす）"""
+        self.garbage_queue.append((hole % self.FIELD_WIDTH, offset))
+
+    def raise_garbage(self):
+        """予約したおじゃま行を下からせり上げる（最上段に花札があればゲームオーバー）
+
+        おじゃま札は役に関わらないカス札で、左隣・真上と違う月を選ぶので
+        せり上げただけでは3枚の連結も役もできない（安定した盤面のまま）。
+        """
+        field = [row[:] for row in self.field]
+        width = self.FIELD_WIDTH
+        raised = 0
+        for hole, offset in self.garbage_queue:
+            if any(field[0]):
+                self.game_over = True
+                self.events.append(("game_over",))
+                break
+            above = field[-1]
+            del field[0]
+            row = [0] * width
+            for x in range(width):
+                if x == hole:
+                    continue
+                avoid = (CARD_MONTH[row[x - 1]] if x > 0 and row[x - 1] else 0,
+                         CARD_MONTH[above[x]] if above[x] else 0)
+                month = offset % 12 + 1
+                while month in avoid:
+                    month = month % 12 + 1
+                row[x] = (month - 1) * 4 + 4
+                offset += 1
+            field.append(row)
+            raised += 1
+        self.events.append(("garbage", raised))
+        self.garbage_queue = []
+        self.load_field(field)
+
+    def load_field(self, field):
+        """盤面を指定の内容に置き換える（ベンチマーク・探索用、落下中の花札はそのまま）"""
+        self.field = [list(row) for row in field]
+        board = self.board
+        index = self.card_index
+        if board.large:
+            self.rebuild_masks()
+        else:
+            board.clear_all()
+            index.clear()
+            for y, row in enumerate(self.field):
+                for x, card_id in enumerate(row):
+                    if card_id != 0:
+                        board.place(x, y, CARD_MONTH[card_id])
+                        index.add(card_id, board.bit(x, y))
+        self.removal_state = "none"
+        self.cards_to_remove = set()
+        self.dirty_mask = 0
+        self.field_version += 1
+
+    def rebuild_masks(self):
+        """field からビットボードと札の位置索引をまとめて作り直す（大きい盤面用、マス数に比例）"""
+        card_masks = value_masks(self.field, 49)
+        self.card_index.load(card_masks)
+        month_masks = [0] * 13
+        for card_id in range(1, 49):
+            month_masks[CARD_MONTH[card_id]] |= card_masks[card_id]
+        self.board.load_months(month_masks)
+
+    def bulk_update(self, count):
+        """count マスを動かすとき、1マスずつ更新するより作り直す方が速いか"""
+        return self.board.large and count * 16 > self.board.size
+
+    def save_state(self):
+        """盤面・ビットボード・位置索引の状態（restore_state で戻せる）"""
+        return tuple(map(tuple, self.field)), self.board.state(), self.card_index.state()
+
+    def restore_state(self, state):
+        """save_state で保存した盤面に戻す（作り直さないので load_field より速い）"""
+        field, board, index = state
+        self.field = [list(row) for row in field]
+        self.board.restore(board)
+        self.card_index.restore(index)
+        self.field_version += 1
+
+    def input_enabled(self):
+        """入力・落下を受け付ける状態か"""
+        return self.pause_time <= 0 and self.spawn_delay <= 0 and self.removal_state == "none"
+
+    def input_ready(self):
+        """次の step で入力を受け付けるか（タイマーが進んだあとで判定されるので、残り1でもよい）
+
+        消去演出の途中は、最後の落下のあとに一時停止が入るので次の step では受け付けない。
+        """
+        return (not self.game_over and self.removal_state == "none" and
+                self.pause_time <= 1 and self.spawn_delay <= 1)
+
+    def step(self, action=ACTION_NONE):
+        """1フレーム進める（戻り値はこのフレームの events）"""
+        self.events = []
+        if self.game_over:
+            return self.events
+        self.frame += 1
+
+        # ボーナスタイム・一時停止時間・生成遅延時間の更新
+        if self.bonus_time > 0:
+            self.bonus_time -= 1
+        if self.pause_time > 0:
+            self.pause_time -= 1
+        if self.spawn_delay > 0:
+            self.spawn_delay -= 1
+            # 生成遅延が終了したら新しい花札を生成
+            if self.spawn_delay == 0 and self.falling_card is None:
+                self.spawn_new_card()
+
+        # 消去処理の状態管理
+        self.update_removal_process()
+
+        # 入力処理（一時停止中や生成遅延中、消去処理中は入力を制限）
+        if self.input_enabled():
+            self.handle_input(action)
+
+        # 花札の落下処理（一時停止中や生成遅延中、消去処理中は落下しない）
+        if self.input_enabled():
+            self.drop_timer += 1
+            if self.drop_timer >= self.drop_speed:
+                self.drop_card()
+                self.drop_timer = 0
+
+        # 落下速度の調整
+        self.drop_speed = max(10, 60 - self.score // 1000)
+        return self.events
+
+    def idle_frames(self):
+        """この先、入力を受け付けず出来事も起きない（タイマーが進むだけの）フレーム数"""
+        if self.game_over:
+            return 0
+        if self.removal_state == "marking":
+            # 点滅が終わるフレームは消去に移るので数えない
+            frames = MARK_FRAMES - 1 - self.removal_timer
+        elif self.removal_state == "none":
+            # 一時停止・生成遅延のどちらかが残っている間は入力を受け付けない
+            frames = max(self.pause_time, self.spawn_delay) - 1
+        else:
+            return 0
+        if self.spawn_delay > 0:
+            # 新しい花札が出現するフレームの手前まで
+            frames = min(frames, self.spawn_delay - 1)
+        return max(0, frames)
+
+    def fast_forward(self, limit=None):
+        """タイマーが進むだけのフレームを一度に進め、進めたフレーム数を返す
+
+        入力は無視されるフレームなので、毎フレーム step() するのと結果は変わらない。
+        limit を指定すると frame がそれを超えないところで止める。
+        """
+        frames = self.idle_frames()
+        if limit is not None:
+            frames = min(frames, limit - self.frame)
+        if frames <= 0:
+            return 0
+        self.events = []
+        self.frame += frames
+        self.bonus_time = max(0, self.bonus_time - frames)
+        self.pause_time = max(0, self.pause_time - frames)
+        if self.spawn_delay > 0:
+            self.spawn_delay -= frames
+        if self.removal_state == "marking":
+            self.removal_flash_frame += frames
+            self.removal_timer += frames
+        self.drop_speed = max(10, 60 - self.score // 1000)
+        return frames
+
+    def update_removal_process(self):
+        """消去処理の状態管理（置いた時点で作った連鎖の台本を1段ずつ再生する）"""
+        if self.removal_state == "marking":
+            # マーキング状態：消去対象の花札を点滅表示
+            self.removal_flash_frame += 1
+            self.removal_timer += 1
+
+            # 1秒間（30フレーム）点滅させる
+            if self.removal_timer >= MARK_FRAMES:
+                self.removal_state = "removing"
+                self.removal_timer = 0
+
+        elif self.removal_state == "removing":
+            # 消去状態：実際に花札を削除（得点は台本で計算済み）
+            stage = self.cascade_script.stages[self.combo - 1]
+            self.score += stage.points
+
+            self.remove_cards(self.cards_to_remove)
+            self.events.append(("remove", self.cards_to_remove))
+
+            self.removal_state = "dropping"
+            self.removal_timer = 0
+
+        elif self.removal_state == "dropping":
+            # 落下状態：台本の落下後の盤面にする
+            stages = self.cascade_script.stages
+            stage = stages[self.combo - 1]
+            self.restore_state(stage.state)
+            self.removal_state = "none"
+            for awarded, bonus in stage.yaku:
+                self.apply_yaku(awarded, bonus)
+
+            # 連鎖が続くなら次の段の点滅へ
+            if self.combo < len(stages):
+                self.start_removal_process(stages[self.combo].positions)
+                self.combo += 1
+                self.events.append(("combo", self.combo))
+            else:
+                self.combo = 0
+                self.cascade_script = None
+                # 花札消去完了時に0.5秒間の一時停止を設定
+                self.pause_time = 30  # 60fps × 0.5秒 = 30フレーム
+
+    def remove_cards(self, positions):
+        """指定マスの花札を盤面から取り除く"""
+        board = self.board
+        index = self.card_index
+        field = self.field
+        if self.bulk_update(len(positions)):
+            for x, y in positions:
+                field[y][x] = 0
+            self.rebuild_masks()
+        else:
+            for x, y in positions:
+                index.remove(field[y][x], board.bit(x, y))
+                field[y][x] = 0
+            board.remove_mask(board.mask_of(positions))
+        self.field_version += 1
+
+    def start_removal_process(self, cards_to_remove):
+        """消去プロセスを開始"""
+        self.cards_to_remove = cards_to_remove
+        self.removal_state = "marking"
+        self.removal_timer = 0
+        self.removal_flash_frame = 0
+
+        # 揃ったマスと、その花札の月（特殊役では複数の月が混ざる）
+        field = self.field
+        months = 0
+        for x, y in cards_to_remove:
+            months |= 1 << CARD_MONTH[field[y][x]]
+        self.events.append(("match", cards_to_remove, months))
+
+    def find_cards_to_remove(self, dirty_mask=None):
+        """消去対象の花札を検索（dirty_mask 指定時はそのマスを含む連結だけを調べる）"""
+        board = self.board
+        if dirty_mask is None:
+            # 同じ月で3枚以上連結された花札（ビットボード上で一括判定）
+            groups = board.matching_groups(3)
+        else:
+            # 安定した盤面に3枚以上の連結は残らないので、変化したマスを含む連結だけを探す
+            groups = board.matching_groups_touching(dirty_mask, 3)
+            if self.verify_incremental:
+                full = board.matching_groups(3)
+                if groups != full:
+                    raise AssertionError(
+                        "差分判定が全体走査と一致しません: %#x != %#x" % (groups, full))
+
+        # 特殊役のチェック
+        groups |= self.check_special_combinations()
+
+        return set(board.positions(groups))
+
+    def handle_input(self, action):
+        """入力処理"""
+        # 左右移動
+        if action & ACTION_LEFT and self.falling_x > 0:
+            if self.can_move(self.falling_x - 1, self.falling_y):
+                self.falling_x -= 1
+                self.events.append(("move", self.falling_x, self.falling_y))
+        if action & ACTION_RIGHT and self.falling_x < self.FIELD_WIDTH - 1:
+            if self.can_move(self.falling_x + 1, self.falling_y):
+                self.falling_x += 1
+                self.events.append(("move", self.falling_x, self.falling_y))
+
+        # 高速落下
+        if action & ACTION_DOWN:
+            self.drop_timer = self.drop_speed
+
+        # 即時落下（着地する行まで移し、このティックの落下処理で固定する）
+        if action & ACTION_HARD_DROP and self.falling_card is not None:
+            y = self.landing_row()
+            self.events.append(("hard_drop", self.falling_x, y - self.falling_y))
+            self.falling_y = y
+            self.drop_timer = self.drop_speed
+
+        # リスタート（画面遷移はフロントエンド側で行う）
+        if action & ACTION_RESTART:
+            self.events.append(("restart",))
+
+    def can_move(self, x, y):
+        """移動可能かチェック"""
+        if x < 0 or x >= self.FIELD_WIDTH or y >= self.FIELD_HEIGHT:
+            return False
+        if y < 0:
+            return True
+        return self.field[y][x] == 0
+
+    def column_tops(self):
+        """列ごとの一番上の花札の行（空の列は FIELD_HEIGHT、field が変わったときだけ作り直す）"""
+        if self.tops_version != self.field_version:
+            self.tops = self.board.column_tops()
+            self.tops_version = self.field_version
+        return self.tops
+
+    def landing_row(self, x=None, y=None):
+        """(x, y)（省略時は落下中の花札の位置）から落としたときに固定される行"""
+        if x is None:
+            x, y = self.falling_x, self.falling_y
+        top = self.column_tops()[x]
+        if y < top:
+            return top - 1
+        # おじゃま行の穴の上に浮いた花札より下にいるときは、ビットボードで探す
+        return self.board.landing_row(x, y)
+
+    def drop_card(self):
+        """花札を1マス下に落とす"""
+        if self.can_move(self.falling_x, self.falling_y + 1):
+            self.falling_y += 1
+        else:
+            # 花札を固定
+            self.place_card(self.falling_x, self.falling_y, self.falling_card)
+            self.events.append(("lock", self.falling_x, self.falling_y))
+
+            # 消去チェック
+            self.check_and_remove_cards()
+
+            # 新しい花札を生成（0.5秒の遅延付き）
+            self.spawn_delay = 30  # 60fps × 0.5秒 = 30フレーム
+            self.falling_card = None  # 一時的に落下中の花札を無効化
+
+    def place_card(self, x, y, card_id):
+        """花札を盤面に置く（ゲームオーバー直後は出現位置が埋まっていることがあるので置き換える）"""
+        bit = self.board.bit(x, y)
+        replaced = self.field[y][x]
+        if replaced != 0:
+            self.board.remove(x, y, CARD_MONTH[replaced])
+            self.card_index.remove(replaced, bit)
+        self.field[y][x] = card_id
+        self.board.place(x, y, CARD_MONTH[card_id])
+        self.card_index.add(card_id, bit)
+        self.dirty_mask = bit
+        if self.tops_version == self.field_version:
+            # 列の高さの索引は置いたマスだけ直す
+            self.tops[x] = min(self.tops[x], y)
+            self.tops_version += 1
+        self.field_version += 1
+
+    def resolve_chain(self):
+        """置いた直後の盤面の連鎖を演出なしで最後まで解決する（探索用）
+
+        得点は実際のゲームと同じ計算で score に加え、CascadeResult を返す。
+        フレームは進まないので、ボーナスタイムは開始時点の値（と役で増えた分）で扱う。
+        """
+        cache = self.cascade_cache
+        if cache is not None:
+            key = cache.key(self.field, self.dirty_mask, self.bonus_time > 0)
+            result = cache.get(key, self.field)
+            if result is not None:
+                self.apply_cascade(result)
+                return result
+            start = [row[:] for row in self.field]
+
+        score_before = self.score
+        steps = []
+        events = self.events
+        mark = len(events)
+        to_remove = self.find_cards_to_remove(self.dirty_mask)
+        while to_remove:
+            points = self.calculate_points(to_remove)
+            points *= (len(steps) + 2) * (2 if self.bonus_time > 0 else 1)
+            self.score += points
+            steps.append((frozenset(to_remove), points))
+            self.remove_cards(to_remove)
+            self.drop_cards()
+            to_remove = self.find_cards_to_remove(self.dirty_mask)
+        # 役の成立は find_cards_to_remove が events に積んでいる
+        yaku = [event[1:] for event in events[mark:] if event[0] == "yaku"]
+
+        result = CascadeResult(tuple(steps), tuple(yaku), self.score - score_before,
+                               tuple(map(tuple, self.field)))
+        if cache is not None:
+            cache.put(key, start, result)
+        return result
+
+    def apply_cascade(self, result):
+        """キャッシュしていた連鎖の結果を盤面・得点に反映する"""
+        self.load_field(result.field)
+        # result.score は役のボーナスも含むので、役の分は apply_yaku で足す（出来事もキャッシュなしと揃える）
+        self.score += result.score - sum(bonus for _, bonus in result.yaku)
+        for awarded, bonus in result.yaku:
+            self.apply_yaku(awarded, bonus)
+
+    def build_cascade_script(self, positions):
+        """置いた直後に消える positions から連鎖を最後まで解決し、CascadeScript を返す
+
+        各段の得点・役のボーナスは、その段が実際に消える（落ちる）フレームの
+        ボーナスタイムで計算する。盤面・得点・ボーナスタイム・events は元に戻す。
+        """
+        start = self.save_state()
+        score, bonus_time, events, dirty_mask = self.score, self.bonus_time, self.events, self.dirty_mask
+        self.events = []
+        stages = []
+        while positions:
+            # 点滅のあとのフレームで消え、その次のフレームで落ちる
+            self.bonus_time = max(0, self.bonus_time - (MARK_FRAMES + 1))
+            points = self.calculate_points(positions) * (len(stages) + 2) * (2 if self.bonus_time > 0 else 1)
+            self.remove_cards(positions)
+            self.drop_cards()
+            self.bonus_time = max(0, self.bonus_time - 1)
+            mark = len(self.events)
+            next_positions = self.find_cards_to_remove(self.dirty_mask)
+            yaku = tuple(event[1:] for event in self.events[mark:] if event[0] == "yaku")
+            stages.append(CascadeStage(frozenset(positions), points, self.save_state(), yaku))
+            positions = next_positions
+
+        self.restore_state(start)
+        self.score, self.bonus_time, self.events, self.dirty_mask = score, bonus_time, events, dirty_mask
+        return CascadeScript(self.frame, tuple(stages))
+
+    def find_connected_cards(self, start_x, start_y):
+        """指定マスの花札と同じ月で連結された領域を探索（ビットシフトによるフラッドフィル）"""
+        card_id = self.field[start_y][start_x]
+        if card_id == 0:
+            return []
+        board = self.board
+        return board.positions(board.flood_fill(board.bit(start_x, start_y),
+                                                board.month_masks[CARD_MONTH[card_id]]))
+
+    def check_and_remove_cards(self):
+        """花札の消去チェック（縦横連結判定）"""
+        cards_to_remove = self.find_cards_to_remove(self.dirty_mask)
+
+        if cards_to_remove:
+            # 連鎖は置いた時点で最後まで解決しておき、演出はそれを再生する
+            self.cascade_script = self.build_cascade_script(cards_to_remove)
+            self.start_removal_process(self.cascade_script.stages[0].positions)
+            self.combo = 1  # 初回コンボ
+            self.events.append(("combo", 1))
+        else:
+            self.combo = 0
+
+    def check_special_combinations(self):
+        """特殊役のチェック（消去対象の位置マスクを返す）"""
+        to_remove = 0
+        awarded = 0  # 成立した役のビット
+
+        # 各月1枚目の位置（札の位置索引から読むだけで盤面は走査しない）
+        first = self.card_index.first_masks
+
+        # 五光チェック（1月1枚目＋3月1枚目＋8月1枚目＋11月1枚目＋12月1枚目）
+        goko_positions = first[1] | first[3] | first[8] | first[11] | first[12]
+        goko_count = popcount(goko_positions)
+
+        if goko_count >= 5:
+            to_remove |= goko_positions
+            awarded |= 1 << AWARD_GOKO
+
+        # 雨四光チェック（11月1枚目(必須)＋1月1枚目or3月1枚目or8月1枚目or12月1枚目から3枚）
+        elif first[11]:
+            if goko_count >= 4:
+                to_remove |= goko_positions
+                awarded |= 1 << AWARD_AME_SHIKO
+
+        # 四光チェック（1月1枚目or3月1枚目or8月1枚目or12月1枚目の4枚）
+        elif goko_count >= 4:
+            to_remove |= goko_positions
+            awarded |= 1 << AWARD_SHIKO
+
+        # 三光チェック（1月1枚目or3月1枚目or8月1枚目or12月1枚目から3枚）
+        elif goko_count >= 3:
+            to_remove |= goko_positions
+            awarded |= 1 << AWARD_SANKO
+
+        # 猪鹿蝶チェック（6月1枚目＋7月1枚目＋10月1枚目）
+        if first[6] and first[7] and first[10]:
+            to_remove |= first[6] | first[7] | first[10]
+            awarded |= 1 << AWARD_INOSHIKACHO
+
+        # 花見で一杯チェック（3月1枚目＋9月1枚目）
+        if first[3] and first[9]:
+            to_remove |= first[3] | first[9]
+            awarded |= 1 << AWARD_HANAMI
+
+        # 月見で一杯チェック（8月1枚目＋9月1枚目）
+        if first[8] and first[9]:
+            to_remove |= first[8] | first[9]
+            awarded |= 1 << AWARD_TSUKIMI
+
+        # 青短・赤短のチェック
+        blue_tan = self.card_index.blue_tan
+        red_tan = self.card_index.red_tan
+        if blue_tan and popcount(blue_tan) >= 3:
+            to_remove |= blue_tan
+            awarded |= 1 << AWARD_AOTAN
+        if red_tan and popcount(red_tan) >= 3:
+            to_remove |= red_tan
+            awarded |= 1 << AWARD_AKATAN
+
+        # 特殊役ボーナスをスコアに加算
+        if awarded:
+            special_bonus = 0
+            for i in range(len(YAKU_BONUS)):
+                if awarded >> i & 1:
+                    special_bonus += YAKU_BONUS[i]
+            special_bonus *= (2 if self.bonus_time > 0 else 1)
+            self.apply_yaku(awarded, special_bonus)
+
+        return to_remove
+
+    def apply_yaku(self, awarded, bonus):
+        """成立した役のボーナスを加算する"""
+        self.score += bonus
+        self.events.append(("yaku", awarded, bonus))
+        # 特殊役達成時はボーナスタイムを追加
+        if self.bonus_time <= 0:
+            self.events.append(("bonus", 300))
+        self.bonus_time += 300  # 5秒間
+
+    def calculate_points(self, removed_positions):
+        """得点計算"""
+        count = len(removed_positions)
+
+        # 基本得点
+        if count == 3:
+            return 100
+        elif count == 4:
+            return 200
+        elif count >= 5:
+            return 300
+
+        return 0
+
+    def drop_cards(self):
+        """花札を重力で落下"""
+        if self.board.large:
+            self.drop_columns()
+            return
+        # 真下が空いている花札をビットボード上で1段ずつ落とし、field も同じ手順で動かす
+        field = self.field
+        board = self.board
+        index = self.card_index
+        w = self.FIELD_WIDTH
+        moved = 0  # 落下した花札の現在位置
+        while True:
+            moving = board.fall_step()
+            if not moving:
+                break
+            moved = (moved & ~moving) | (moving << w)
+            for x, y in board.positions(moving):
+                card_id = field[y][x]
+                field[y + 1][x] = card_id
+                field[y][x] = 0
+                bit = 1 << (y * w + x)
+                index.move(card_id, bit, bit << w)
+        self.dirty_mask = moved
+        if moved:
+            self.field_version += 1
+
+    def drop_columns(self):
+        """花札を列ごとに下へ詰める（大きい盤面用、1段ずつ落とさないのでマス数に比例する手間で済む）"""
+        field = self.field
+        board = self.board
+        index = self.card_index
+        floating = board.floating()
+        if not floating:
+            self.dirty_mask = 0
+            return
+        moves = []   # (札ID, x, 元の y)
+        landed = []  # 落ちた先の (x, y)
+        for x in sorted({x for x, _ in board.positions(floating)}):
+            bottom = self.FIELD_HEIGHT - 1
+            for y in range(bottom, -1, -1):
+                card_id = field[y][x]
+                if card_id:
+                    if y != bottom:
+                        field[bottom][x] = card_id
+                        field[y][x] = 0
+                        moves.append((card_id, x, y))
+                        landed.append((x, bottom))
+                    bottom -= 1
+        if self.bulk_update(len(moves)):
+            self.rebuild_masks()
+        else:
+            for (card_id, x, y), (_, to_y) in zip(moves, landed):
+                from_bit = board.bit(x, y)
+                to_bit = board.bit(x, to_y)
+                board.occupied ^= from_bit | to_bit
+                board.month_masks[CARD_MONTH[card_id]] ^= from_bit | to_bit
+                index.move(card_id, from_bit, to_bit)
+        self.dirty_mask = board.mask_of(landed)
+        self.field_version += 1
@@ -0,0 +1,442 @@
+"""ゲームの出来事の配信と記録
+
+エンジンの events（種類は HanafudaEngine の docstring を参照）を EventBus で購読者に配る。
+EventLogWriter は受け取ったティックごとの出来事を deque に積むだけで返り（フレームの処理では
+符号化もファイル書き込みもしない）、別スレッドが flush_interval ごとにまとめて符号化して
+追記専用のログファイルに書く。ファイルが max_bytes を超えたら path.1, path.2 ... に回す。
+read_logs はファイルを少しずつ読んで出来事を1つずつ返すので、ログ全体をメモリに載せない。
+
+ファイル形式（整数は LEB128 の可変長）:
+    b"HFEV" / バージョン(1バイト) / [種類(1バイト) ティック 中身...] の繰り返し
+        start      ゲーム番号（書いたプロセスの中での通し番号） シード 幅 高さ
+        spawn      札ID
+        move       x y
+        lock       x y
+        match      月のビット マス数 (y * 幅 + x) × マス数
+        combo      連鎖数
+        yaku       役ビット ボーナス
+        bonus      フレーム数
+        garbage    行数
+        game_over
+        end        最終スコア
+        hard_drop  x 落とした段数（後から足した種類なので番号は end の次）
+        continue   start と同じ中身（回した新しいファイルの先頭に入れる、前のファイルのゲームの続き）
+remove（match と同じマス）と restart（画面遷移）は記録しない。
+既存のファイルには追記するので、別々に起動した記録が1つのファイルに続けて入ることがある
+（ゲーム番号は起動ごとに0から数え直すので、ゲームの区切りは start で判断する）。
+
+    python event_log.py record last_replay.hfr --out events.log   # リプレイから記録を作る
+    python event_log.py summary events.log.1 events.log            # 古い順に並べて集計
+    python event_log.py check last_replay.hfr                       # 追記・回したログを読み戻して照合
+"""
+
+import argparse
+import atexit
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from itertools import chain
+
+from engine import YAKU_NAMES, yaku_names
+from replay import Replay, ReplayError, new_engine, read_varint, write_varint
+
+MAGIC = b"HFEV"
+VERSION = 1
+
+KINDS = ("start", "spawn", "move", "lock", "match", "combo", "yaku", "bonus", "garbage", "game_over", "end",
+         "hard_drop", "continue")
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
+
+class EventBus:
+    """エンジンの出来事を購読者に配る（購読者がいなければほとんど何もしない）"""
+
+    def __init__(self):
+        self.listeners = []  # 1ティック分の出来事をまとめて受け取る callback(ティック, 出来事のリスト)
+        self.handlers = {}   # 種類 -> 1つずつ受け取る callback(ティック, 出来事) のリスト
+
+    def subscribe(self, callback, kinds=None):
+        """kinds（種類の並び）を省くと、出来事のあるティックごとにまとめて呼ぶ"""
+        if kinds is None:
+            self.listeners.append(callback)
+        else:
+            for kind in kinds:
+                self.handlers.setdefault(kind, []).append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+        for kind, handlers in list(self.handlers.items()):
+            if callback in handlers:
+                handlers.remove(callback)
+                if not handlers:
+                    del self.handlers[kind]
+
+    def publish(self, tick, events):
+        if not events:
+            return
+        for listener in self.listeners:
+            listener(tick, events)
+        handlers = self.handlers
+        if handlers:
+            for event in events:
+                for handler in handlers.get(event[0], ()):
+                    handler(tick, event)
+
+
+def encode_event(out, tick, event, width):
+    """出来事1つを out（bytearray）に追加し、追加したかを返す（記録しない種類なら何もしない）"""
+    code = KIND_CODES.get(event[0])
+    if code is None:
+        return False
+    out.append(code)
+    write_varint(out, tick)
+    if code == 4:  # match
+        positions = event[1]
+        write_varint(out, event[2])
+        write_varint(out, len(positions))
+        for x, y in sorted(positions, key=lambda p: (p[1], p[0])):
+            write_varint(out, y * width + x)
+    else:
+        for value in event[1:]:
+            write_varint(out, value)
+    return True
+
+
+# 種類ごとの中身の整数の数（match は可変長なので別扱い）
+_FIELD_COUNTS = {'start': 4, 'spawn': 1, 'move': 2, 'lock': 2, 'combo': 1, 'yaku': 2, 'bonus': 1,
+                 'garbage': 1, 'game_over': 0, 'end': 1, 'hard_drop': 2,
+                 'continue': 4}
+
+
+def decode_event(data, pos, width):
+    """data の pos から出来事1つを読み、(ティック, 出来事, 次の位置) を返す（途中で切れていれば ReplayError）"""
+    if pos >= len(data):
+        raise ReplayError("ログが途中で切れています")
+    code = data[pos]
+    if code >= len(KINDS):
+        raise ValueError("ログの種類が不正です: %d" % code)
+    kind = KINDS[code]
+    tick, pos = read_varint(data, pos + 1)
+    if kind == "match":
+        months, pos = read_varint(data, pos)
+        count, pos = read_varint(data, pos)
+        positions = []
+        for _ in range(count):
+            cell, pos = read_varint(data, pos)
+            positions.append((cell % width, cell // width))
+        return tick, (kind, frozenset(positions), months), pos
+    values = [kind]
+    for _ in range(_FIELD_COUNTS[kind]):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return tick, tuple(values), pos
+
+
+class EventLogWriter:
+    """出来事を別スレッドでまとめてログファイルに追記する（サイズで回す）"""
+
+    def __init__(self, path, max_bytes=1 << 20, backups=5, flush_interval=0.5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.queue = deque()  # (ティック, 出来事の並び)、ゲームのスレッドが積みログのスレッドが取り出す
+        self.file = None
+        self.size = 0
+        self.games = 0
+        self.width = 8
+        self.game_start = None  # 書き込み中のゲームの continue の符号（回した新しいファイルの先頭に入れる）
+        self.records = 0
+        self.batches = 0
+        self.rotations = 0
+        self.closed = False
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # ゲームのスレッドから呼ぶもの（積むだけ）
+
+    def begin_game(self, seed, width, height):
+        self.queue.append((0, (("start", seed, width, height),)))
+
+    def write(self, tick, events):
+        """1ティック分の出来事を積む（EventBus の購読者として使える、events はそのまま持つのでコピーしない）"""
+        if events:
+            self.queue.append((tick, events))
+
+    def end_game(self, tick, score):
+        """ゲームの終わり（すぐに書き出す）"""
+        self.queue.append((tick, (("end", score),)))
+        self.wake.set()
+
+    def close(self):
+        """残りを書き出してスレッドを止める"""
+        if self.closed:
+            return
+        self.closed = True
+        self.wake.set()
+        self.thread.join()
+
+    # ログのスレッド
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            closing = self.closed
+            try:
+                self.flush()
+            except OSError:
+                pass  # 書けなければ捨てる（ゲームは止めない）
+            if closing:
+                break
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def flush(self):
+        """溜まっている出来事を符号化して1回で書く"""
+        queue = self.queue
+        if not queue:
+            return
+        carried_start = self.game_start
+        out = bytearray()
+        records = 0
+        while queue:
+            tick, events = queue.popleft()
+            for event in events:
+                if event[0] == "start":
+                    self.width = event[2]
+                    mark = len(out)
+                    encode_event(out, tick, ("start", self.games) + tuple(event[1:]), self.width)
+                    self.game_start = bytes((KIND_CODES['continue'],)) + bytes(out[mark + 1:])
+                    self.games += 1
+                    records += 1
+                elif encode_event(out, tick, event, self.width):
+                    records += 1
+        if not out:
+            return
+        if self.file is None:
+            self._open()
+        elif self.size + len(out) > self.max_bytes and self.size > len(MAGIC) + 1:
+            self._rotate()
+            if carried_start is not None and out[0] != KIND_CODES['start']:
+                self._write(carried_start)
+        self._write(out)
+        self.file.flush()
+        self.records += records
+        self.batches += 1
+
+    def _open(self):
+        self.file = open(self.path, "ab")
+        self.size = self.file.tell()
+        if self.size == 0:
+            self._write(MAGIC + bytes((VERSION,)))
+
+    def _write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+
+    def _rotate(self):
+        """path を path.1 に、path.1 を path.2 に…回し、新しい path を開く"""
+        self.file.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                older = "%s.%d" % (self.path, i)
+                if os.path.exists(older):
+                    os.replace(older, "%s.%d" % (self.path, i + 1))
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+        self.file = None
+        self._open()
+
+
+def read_log(path, chunk_size=1 << 16):
+    """ログファイル1つの出来事を (ティック, 出来事) で順に返す（chunk_size ずつ読む）
+
+    書き込みの途中で止まったファイルの末尾の切れた出来事は読み飛ばす。
+    """
+    with open(path, "rb") as f:
+        header = f.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError("イベントログではありません: %s" % path)
+        if header[len(MAGIC)] != VERSION:
+            raise ValueError("対応していないバージョンです: %d" % header[len(MAGIC)])
+        data = b""
+        pos = 0
+        width = 8
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            data = data[pos:] + chunk
+            pos = 0
+            while True:
+                try:
+                    tick, event, end = decode_event(data, pos, width)
+                except ReplayError:
+                    break  # 残りは次の読み込みとつなげる
+                if event[0] in ("start", "continue"):
+                    width = event[3]
+                pos = end
+                yield tick, event
+
+
+def read_logs(paths, chunk_size=1 << 16):
+    """古い順に並べたログファイルを続けて読み、(ゲーム番号, ティック, 出来事) を返す
+
+    ゲーム番号は読んだ start の通し番号（0から）。回した新しいファイルの先頭の continue は
+    前のゲームの続きなので返さない（最初のファイルが continue で始まるときだけ start として返す）。
+    """
+    game = -1
+    for path in paths:
+        for tick, event in read_log(path, chunk_size):
+            kind = event[0]
+            if kind == "continue":
+                if game >= 0:
+                    continue
+                event = ("start",) + event[1:]
+                kind = "start"
+            if kind == "start":
+                game += 1
+            yield game, tick, event
+
+
+class LogSummary:
+    """ログの出来事の集計"""
+
+    def __init__(self):
+        self.events = Counter()   # 種類 -> 数
+        self.games = 0
+        self.scores = []          # end の最終スコア
+        self.frames = []          # end のティック
+        self.yaku = Counter()     # 役名 -> 成立回数
+        self.match_sizes = Counter()
+        self.months = Counter()   # 揃った月 -> 回数
+        self.max_combo = 0
+
+    def add(self, game, tick, event):
+        kind = event[0]
+        self.events[kind] += 1
+        if kind == "start":
+            self.games += 1
+        elif kind == "end":
+            self.scores.append(event[1])
+            self.frames.append(tick)
+        elif kind == "yaku":
+            self.yaku.update(yaku_names(event[1]))
+        elif kind == "match":
+            self.match_sizes[len(event[1])] += 1
+            months = event[2]
+            for month in range(1, 13):
+                if months >> month & 1:
+                    self.months[month] += 1
+        elif kind == "combo":
+            self.max_combo = max(self.max_combo, event[1])
+
+    def report(self):
+        lines = ["games %d  finished %d  mean score %.0f  max score %d  mean ticks %.0f  max combo %d" % (
+            self.games, len(self.scores), sum(self.scores) / len(self.scores) if self.scores else 0.0,
+            max(self.scores, default=0), sum(self.frames) / len(self.frames) if self.frames else 0.0,
+            self.max_combo)]
+        lines.append("events  " + "  ".join("%s %d" % (kind, self.events[kind]) for kind in KINDS
+                                            if self.events[kind]))
+        spawns = self.events['spawn']
+        if spawns:
+            lines.append("moves per card %.2f" % (self.events['move'] / spawns))
+        if self.match_sizes:
+            lines.append("match sizes  " + "  ".join("%d:%d" % item for item in sorted(self.match_sizes.items())))
+            lines.append("months  " + "  ".join("%d:%d" % item for item in sorted(self.months.items())))
+        if self.yaku:
+            lines.append("yaku  " + "  ".join("%s %d" % (name, self.yaku[name]) for name in YAKU_NAMES
+                                              if self.yaku[name]))
+        return "\n".join(lines)
+
+
+def check(replays, sessions=2, max_bytes=1 << 11, backups=100):
+    """replays を sessions 回に分けて起動し直した記録で同じファイルに追記し、回したファイルを
+    read_logs で読み戻して、エンジンの出来事と同じ並び（ゲームの区切りも含む）になるかを返す"""
+    expected = []
+    game = -1
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "events.log")
+        rotations = 0
+        for _ in range(sessions):
+            writer = EventLogWriter(path, max_bytes, backups, flush_interval=0.01)
+            for number, replay in enumerate(replays):
+                engine = new_engine(replay.seed, replay.width, replay.height)
+                writer.begin_game(replay.seed, replay.width, replay.height)
+                game += 1
+                expected.append((game, 0, ("start", number, replay.seed, replay.width, replay.height)))
+                # 最初の1つは reset で出た最初の花札の spawn
+                for events in chain((engine.events,), map(engine.step, replay.actions())):
+                    writer.write(engine.frame, events)
+                    for event in events:
+                        if event[0] in KIND_CODES:
+                            if event[0] == "match":
+                                event = (event[0], frozenset(event[1]), event[2])
+                            expected.append((game, engine.frame, event))
+                writer.end_game(engine.frame, engine.score)
+                expected.append((game, engine.frame, ("end", engine.score)))
+            writer.close()
+            rotations += writer.rotations
+        paths = ["%s.%d" % (path, i) for i in range(backups, 0, -1) if os.path.exists("%s.%d" % (path, i))]
+        actual = list(read_logs(paths + [path]))
+    return actual == expected, len(expected), rotations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ゲームの出来事のログ")
+    sub = parser.add_subparsers(dest="command", required=True)
+    record = sub.add_parser("record", help="リプレイを再生して出来事をログに書く")
+    record.add_argument("replays", nargs="+")
+    record.add_argument("--out", required=True)
+    record.add_argument("--max-bytes", type=int, default=1 << 20)
+    record.add_argument("--backups", type=int, default=5)
+    summary = sub.add_parser("summary", help="ログを読んで集計する（ファイルは古い順に並べる）")
+    summary.add_argument("logs", nargs="+")
+    checker = sub.add_parser("check", help="起動し直して追記し、回したログを読み戻してリプレイの出来事と照合する")
+    checker.add_argument("replays", nargs="+")
+    checker.add_argument("--sessions", type=int, default=2)
+    checker.add_argument("--max-bytes", type=int, default=1 << 11)
+    args = parser.parse_args(argv)
+
+    if args.command == "check":
+        ok, records, rotations = check([Replay.load(path) for path in args.replays], args.sessions,
+                                       args.max_bytes)
+        print("%s  records %d  rotations %d" % ("ok" if ok else "MISMATCH", records, rotations))
+        return 0 if ok else 1
+
+    if args.command == "record":
+        writer = EventLogWriter(args.out, args.max_bytes, args.backups)
+        start = time.perf_counter()
+        for path in args.replays:
+            replay = Replay.load(path)
+            engine = new_engine(replay.seed, replay.width, replay.height)
+            writer.begin_game(replay.seed, replay.width, replay.height)
+            writer.write(engine.frame, engine.events)  # reset で出た最初の花札の spawn
+            for action in replay.actions():
+                events = engine.step(action)
+                writer.write(engine.frame, events)
+            writer.end_game(engine.frame, engine.score)
+        writer.close()
+        print("games %d  records %d  batches %d  rotations %d  %.2f s" % (
+            writer.games, writer.records, writer.batches, writer.rotations, time.perf_counter() - start))
+        return 0
+
+    total = LogSummary()
+    for game, tick, event in read_logs(args.logs):
+        total.add(game, tick, event)
+    print(total.report())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""ゲームの状態の記録（スナップショット）
+
+HanafudaEngine.snapshot() でエンジンの状態を GameState に写し、restore_snapshot() で戻す。
+盤面は1マス1バイトのバイト列（8x6 なら48バイト）に詰め、ほかの値もすべて変更しない
+値（整数・タプル・frozenset・連鎖の台本）で持つので、clone は参照を写すだけで済み、
+同じスナップショットから何度戻してもよい。ビットボードと札の位置索引の状態も一緒に
+持っておくので、戻すときに盤面を走査して作り直さない。
+
+to_bytes / from_bytes で固定レイアウトのバイナリにできる（チェックポイントの保存、
+ネットワーク越しの巻き戻し用）。ビットボードと位置索引は保存せず、読み込むときに作る。
+
+形式（整数はリトルエンディアン）:
+    b"HFGS" / バージョン(1バイト) / 幅(2) / 高さ(2) / 盤面(幅×高さバイト) /
+    SCALARS の値 / 消去対象のマス(2バイト × 個数) / おじゃま行の(穴, ずらし)(4+4 × 個数) /
+    [得点(8) マス数(2) マス(2 × マス数) 役の数(1) (役ビット(2) ボーナス(4)) × 役の数 盤面] × 段数 /
+    乱数の状態（フラグがあるときだけ、RNG_STATE）
+"""
+
+import struct
+from itertools import chain
+
+from bitboard import value_masks
+from card_index import CardIndex
+from cards import CARD_MONTH
+from cascade_script import CascadeScript, CascadeStage
+
+MAGIC = b"HFGS"
+VERSION = 1
+
+REMOVAL_STATES = ("none", "marking", "removing", "dropping")
+REMOVAL_CODES = {state: code for code, state in enumerate(REMOVAL_STATES)}
+
+FLAG_GAME_OVER = 1
+FLAG_RNG = 2  # 乱数の状態を含む
+FLAG_CASCADE = 4  # 連鎖の台本を含む
+
+HEADER = struct.Struct("<4sBHH")
+# frame score combo bonus_time pause_time spawn_delay drop_timer drop_speed
+# removal_timer removal_flash_frame falling_card falling_x falling_y next_card
+# removal_state フラグ 消去対象の数 おじゃま行の数 段数 台本の開始フレーム
+SCALARS = struct.Struct("<iqiiiiiiiiBHHBBBHHHi")
+STAGE = struct.Struct("<qH")
+YAKU = struct.Struct("<Hi")
+RNG_STATE = struct.Struct("<625I?d")  # random.Random.getstate() のバージョン3の中身
+
+
+class GameStateError(ValueError):
+    """スナップショットのデータが壊れている・形式が違う"""
+
+
+def field_masks(rows):
+    """盤面の行からビットボードと札の位置索引の状態を作る（HanafudaEngine.save_state の後ろ2つ）"""
+    card_masks = value_masks(rows, 49)
+    index = CardIndex()
+    index.load(card_masks)
+    month_masks = [0] * 13
+    for card_id in range(1, 49):
+        month_masks[CARD_MONTH[card_id]] |= card_masks[card_id]
+    occupied = 0
+    for mask in month_masks:
+        occupied |= mask
+    return (occupied, tuple(month_masks)), index.state()
+
+
+class GameState:
+    """1ティックの区切りでのゲームの状態（引数なしで作ると開始直前の空の盤面）"""
+
+    __slots__ = ("width", "height", "cells", "masks", "rng_state",
+                 "frame", "score", "combo", "bonus_time", "pause_time", "spawn_delay",
+                 "drop_timer", "drop_speed", "falling_card", "falling_x", "falling_y", "next_card",
+                 "removal_state", "removal_timer", "removal_flash_frame", "cards_to_remove",
+                 "cascade_script", "garbage_queue", "game_over")
+
+    def __init__(self, width=8, height=6):
+        self.width = width
+        self.height = height
+        self.cells = bytes(width * height)  # 盤面（y * width + x 番目が札ID、0は空）
+        self.masks = None      # (ビットボードの状態, 位置索引の状態)、None なら戻すときに作る
+        self.rng_state = None  # random.Random.getstate() の値、None なら乱数は戻さない
+
+        self.frame = 0
+        self.score = 0
+        self.combo = 0
+        self.bonus_time = 0
+        self.pause_time = 0
+        self.spawn_delay = 0
+
+        # 落下中の花札
+        self.drop_timer = 0
+        self.drop_speed = 60  # フレーム数
+        self.falling_card = None
+        self.falling_x = width // 2
+        self.falling_y = 0
+        self.next_card = None
+
+        # 消去演出（none, marking, removing, dropping）と置いた時点で解決した連鎖（CascadeScript）
+        self.removal_state = "none"
+        self.removal_timer = 0
+        self.removal_flash_frame = 0
+        self.cards_to_remove = frozenset()
+        self.cascade_script = None
+
+        # 次の出現時にせり上がるおじゃま行の (穴の列, 月のずらし)
+        self.garbage_queue = ()
+        self.game_over = False
+
+    def clone(self, **changes):
+        """同じ状態の GameState（changes で一部の値を変えられる、値は共有するだけでコピーしない）"""
+        state = GameState.__new__(GameState)
+        for name in GameState.__slots__:
+            setattr(state, name, getattr(self, name))
+        for name, value in changes.items():
+            setattr(state, name, value)
+        return state
+
+    @property
+    def field(self):
+        """盤面（タプルのタプル）"""
+        cells = self.cells
+        width = self.width
+        return tuple(tuple(cells[i:i + width]) for i in range(0, len(cells), width))
+
+    def to_bytes(self):
+        width = self.width
+        script = self.cascade_script
+        stages = script.stages if script is not None else ()
+        flags = ((FLAG_GAME_OVER if self.game_over else 0) |
+                 (FLAG_RNG if self.rng_state is not None else 0) |
+                 (FLAG_CASCADE if script is not None else 0))
+        parts = [
+            HEADER.pack(MAGIC, VERSION, width, self.height),
+            self.cells,
+            SCALARS.pack(self.frame, self.score, self.combo, self.bonus_time, self.pause_time,
+                         self.spawn_delay, self.drop_timer, self.drop_speed, self.removal_timer,
+                         self.removal_flash_frame, self.falling_card or 0, self.falling_x, self.falling_y,
+                         self.next_card or 0, REMOVAL_CODES[self.removal_state], flags,
+                         len(self.cards_to_remove), len(self.garbage_queue), len(stages),
+                         script.start_frame if script is not None else 0),
+            _pack_positions(self.cards_to_remove, width),
+            struct.pack("<%di" % (2 * len(self.garbage_queue)), *chain.from_iterable(self.garbage_queue)),
+        ]
+        for stage in stages:
+            parts.append(STAGE.pack(stage.points, len(stage.positions)))
+            parts.append(_pack_positions(stage.positions, width))
+            parts.append(bytes((len(stage.yaku),)))
+            for awarded, bonus in stage.yaku:
+                parts.append(YAKU.pack(awarded, bonus))
+            parts.append(bytes(chain.from_iterable(stage.field)))
+        if self.rng_state is not None:
+            version, internal, gauss = self.rng_state
+            parts.append(RNG_STATE.pack(*internal, gauss is not None, gauss or 0.0))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        try:
+            return cls._parse(memoryview(data))
+        except (struct.error, IndexError, KeyError) as e:
+            raise GameStateError("スナップショットのデータが壊れています: %s" % e)
+
+    @classmethod
+    def _parse(cls, data):
+        magic, version, width, height = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise GameStateError("スナップショットではありません")
+        if version != VERSION:
+            raise GameStateError("対応していないバージョンです: %d" % version)
+        size = width * height
+        pos = HEADER.size
+        state = cls(width, height)
+        state.cells = bytes(data[pos:pos + size])
+        if len(state.cells) != size:
+            raise GameStateError("スナップショットのデータが途中で切れています")
+        pos += size
+        (state.frame, state.score, state.combo, state.bonus_time, state.pause_time,
+         state.spawn_delay, state.drop_timer, state.drop_speed, state.removal_timer,
+         state.removal_flash_frame, falling_card, state.falling_x, state.falling_y,
+         next_card, removal_code, flags, remove_count, garbage_count, stage_count,
+         start_frame) = SCALARS.unpack_from(data, pos)
+        pos += SCALARS.size
+        state.falling_card = falling_card or None
+        state.next_card = next_card or None
+        state.removal_state = REMOVAL_STATES[removal_code]
+        state.game_over = bool(flags & FLAG_GAME_OVER)
+
+        state.cards_to_remove, pos = _unpack_positions(data, pos, remove_count, width)
+        garbage = struct.unpack_from("<%di" % (2 * garbage_count), data, pos)
+        pos += 8 * garbage_count
+        state.garbage_queue = tuple(zip(garbage[0::2], garbage[1::2]))
+
+        if flags & FLAG_CASCADE:
+            stages = []
+            for _ in range(stage_count):
+                points, count = STAGE.unpack_from(data, pos)
+                positions, pos = _unpack_positions(data, pos + STAGE.size, count, width)
+                yaku = []
+                for _ in range(data[pos]):
+                    yaku.append(YAKU.unpack_from(data, pos + 1 + len(yaku) * YAKU.size))
+                pos += 1 + len(yaku) * YAKU.size
+                cells = bytes(data[pos:pos + size])
+                if len(cells) != size:
+                    raise GameStateError("スナップショットのデータが途中で切れています")
+                pos += size
+                field = tuple(tuple(cells[i:i + width]) for i in range(0, size, width))
+                stages.append(CascadeStage(positions, points, (field,) + field_masks((cells,)), tuple(yaku)))
+            state.cascade_script = CascadeScript(start_frame, tuple(stages))
+
+        if flags & FLAG_RNG:
+            values = RNG_STATE.unpack_from(data, pos)
+            pos += RNG_STATE.size
+            state.rng_state = (3, values[:625], values[626] if values[625] else None)
+        if pos != len(data):
+            raise GameStateError("スナップショットの後ろに余分なデータがあります")
+        state.masks = field_masks((state.cells,))
+        return state
+
+
+def _pack_positions(positions, width):
+    """マスの集合を y * width + x の2バイト整数の並びにする（順序は揃える）"""
+    return struct.pack("<%dH" % len(positions), *sorted(y * width + x for x, y in positions))
+
+
+def _unpack_positions(data, pos, count, width):
+    cells = struct.unpack_from("<%dH" % count, data, pos)
+    return frozenset((i % width, i // width) for i in cells), pos + 2 * count
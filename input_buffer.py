@@ -0,0 +1,221 @@
+"""入力のバッファと遅延の計測
+
+押した瞬間の左右移動を毎フレーム時刻つきで溜め、エンジンが入力を受け付けるティック
+（HanafudaEngine.input_ready）で1つずつ渡す。生成遅延や消去演出の間に押した移動は
+捨てずに残り、次の花札が出現したティックからそのまま効く。
+押してからルールに渡すまでの時間（ミリ秒）とティック数を記録し、分布を報告する。
+
+渡した入力はリプレイにもそのまま記録されるので、エンジン側のルールは変わらない。
+
+    python input_buffer.py --games 50   # 溜めない場合と比べた、捨てた入力と狙った列に着くまでのティック数
+"""
+
+import argparse
+import random
+import sys
+import time
+from collections import deque
+
+from clock import TICK_RATE
+from engine import ACTION_NONE, ACTION_LEFT, ACTION_RIGHT, ACTION_DOWN, HanafudaEngine, board_size
+
+MOVE_ACTIONS = (ACTION_LEFT, ACTION_RIGHT)
+MAX_BUFFERED = 8        # 溜めておく移動の数（これを超えた分は捨てる）
+LATENCY_SAMPLES = 1000  # 分布を計算する直近の入力の数
+
+
+def percentile(values, p):
+    """p（0〜100）パーセンタイル（values は並べ替え済み）"""
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class InputBuffer:
+    """押した瞬間の移動を溜め、エンジンが受け付けるティックで渡す"""
+
+    def __init__(self, capacity=MAX_BUFFERED):
+        self.capacity = capacity
+        self.queue = deque()  # (アクション, 押した時刻, 押したときに済んでいたティック数)
+        self.latency_ms = deque(maxlen=LATENCY_SAMPLES)
+        self.latency_ticks = deque(maxlen=LATENCY_SAMPLES)
+        self.presses = 0
+        self.immediate = 0  # 押した直後のティックで渡せた数
+        self.buffered = 0   # 受け付けない間に押され、溜めてから渡した数（溜めなければ捨てていた入力）
+        self.overflow = 0   # 溜めきれずに捨てた数
+
+    def clear(self):
+        """溜めている入力を捨てる（ゲームの開始・リスタート時、統計は残す）"""
+        self.queue.clear()
+
+    def press(self, action, now, tick):
+        """このフレームで押した入力を溜める（tick はその時点で済んでいたティック数）"""
+        for bit in MOVE_ACTIONS:
+            if action & bit:
+                self.presses += 1
+                if len(self.queue) >= self.capacity:
+                    self.overflow += 1
+                else:
+                    self.queue.append((bit, now, tick))
+
+    def take(self, engine, now, tick):
+        """ティック tick（1から数えた通し番号）でエンジンに渡す移動（受け付けない間は溜めたまま）
+
+        同じフレームで押した左右は元の入力と同じく1ティックでまとめて渡し、
+        別のフレームの入力は1ティックに1つずつ渡す。
+        """
+        queue = self.queue
+        if not queue or not engine.input_ready():
+            return ACTION_NONE
+        action = ACTION_NONE
+        pressed = queue[0][2]
+        while queue and queue[0][2] == pressed and not action & queue[0][0]:
+            bit, pressed_at, _ = queue.popleft()
+            action |= bit
+            waited = tick - pressed - 1
+            if waited:
+                self.buffered += 1
+            else:
+                self.immediate += 1
+            self.latency_ticks.append(waited)
+            self.latency_ms.append((now - pressed_at) * 1000.0)
+        return action
+
+    def merge(self, other):
+        """other の統計を足し合わせる（複数ゲームの集計用）"""
+        self.presses += other.presses
+        self.immediate += other.immediate
+        self.buffered += other.buffered
+        self.overflow += other.overflow
+        self.latency_ms.extend(other.latency_ms)
+        self.latency_ticks.extend(other.latency_ticks)
+
+    def stats(self):
+        ms = sorted(self.latency_ms)
+        ticks = sorted(self.latency_ticks)
+        return {'presses': self.presses, 'immediate': self.immediate, 'buffered': self.buffered,
+                'overflow': self.overflow, 'pending': len(self.queue),
+                'latency_ms_p50': percentile(ms, 50), 'latency_ms_p95': percentile(ms, 95),
+                'latency_ms_max': ms[-1] if ms else 0,
+                'latency_ticks_p50': percentile(ticks, 50), 'latency_ticks_p95': percentile(ticks, 95),
+                'latency_ticks_max': ticks[-1] if ticks else 0}
+
+    def report_line(self):
+        s = self.stats()
+        return ("input presses %(presses)d  immediate %(immediate)d  buffered %(buffered)d  "
+                "overflow %(overflow)d  latency p50 %(latency_ms_p50).1f ms p95 %(latency_ms_p95).1f ms "
+                "max %(latency_ms_max).1f ms  ticks p50 %(latency_ticks_p50)d p95 %(latency_ticks_p95)d "
+                "max %(latency_ticks_max)d" % s)
+
+
+class TappingPlayer:
+    """人の操作の模型：花札が固定されると次の花札の狙う列を決め、反応時間のあとで必要な回数だけ
+    左右を叩き、出現後に狙いからずれていれば叩き直して、狙いに着いたら高速落下する"""
+
+    def __init__(self, rng, reaction=(6, 24), interval=(5, 9), give_up=120):
+        self.rng = rng
+        self.reaction = reaction  # 固定から叩き始めるまでのティック数の範囲
+        self.interval = interval  # 叩く間隔のティック数の範囲
+        self.give_up = give_up    # 出現からこのティック数で狙いに着かなければ諦めて落とす
+        self.target = None
+        self.taps = 0             # 先読みで叩く残りの回数（負なら左）
+        self.next_tap = 0
+        self.spawn_tick = None
+        self.last_x = None        # 前に見た落下中の花札の列（動いている間は叩き直さない）
+        self.arrived = []         # 出現から狙いの列に着くまでのティック数
+
+    def on_lock(self, engine, tick):
+        self.target = self.rng.randrange(engine.FIELD_WIDTH)
+        self.taps = self.target - engine.FIELD_WIDTH // 2
+        self.next_tap = tick + self.rng.randint(*self.reaction)
+        self.spawn_tick = None
+
+    def on_spawn(self, tick):
+        self.spawn_tick = tick
+
+    def action(self, engine, tick):
+        """このティックの入力（押した瞬間の左右と、押しっぱなしの下）"""
+        if self.target is None:
+            return ACTION_NONE
+        if self.spawn_tick is not None and engine.falling_card is not None:
+            if engine.falling_x == self.target:
+                if self.spawn_tick >= 0:
+                    self.arrived.append(tick - self.spawn_tick)
+                    self.spawn_tick = -1  # 着いた記録は1回だけ
+                return ACTION_DOWN
+            if tick - self.spawn_tick > self.give_up or self.spawn_tick < 0:
+                return ACTION_DOWN
+            if engine.falling_x != self.last_x:
+                self.last_x = engine.falling_x
+                self.next_tap = max(self.next_tap, tick + self.rng.randint(*self.interval))
+            if not self.taps and tick >= self.next_tap and engine.input_enabled():
+                # 出現した花札が狙いからずれているのを見て叩き直す
+                self.taps = self.target - engine.falling_x
+        if self.taps and tick >= self.next_tap:
+            self.next_tap = tick + self.rng.randint(*self.interval)
+            if self.taps > 0:
+                self.taps -= 1
+                return ACTION_RIGHT
+            self.taps += 1
+            return ACTION_LEFT
+        return ACTION_NONE
+
+
+def play_tapping(seed, buffered, board=(8, 6), max_ticks=20000):
+    """TappingPlayer で1ゲーム遊び、(InputBuffer か None, 捨てた入力の数, 狙いに着くまでのティック数) を返す"""
+    engine = HanafudaEngine(rng=random.Random(seed), width=board[0], height=board[1])
+    player = TappingPlayer(random.Random(seed + 1))
+    buffer = InputBuffer() if buffered else None
+    dropped = 0
+    player.on_lock(engine, 0)
+    player.on_spawn(0)
+    tick = 0
+    while not engine.game_over and tick < max_ticks:
+        tick += 1
+        action = player.action(engine, tick)
+        moves = action & (ACTION_LEFT | ACTION_RIGHT)
+        if buffer is not None:
+            now = tick / TICK_RATE
+            buffer.press(moves, now, tick - 1)
+            action = (action & ACTION_DOWN) | buffer.take(engine, now, tick)
+        elif moves and not engine.input_ready():
+            dropped += 1
+        for event in engine.step(action):
+            if event[0] == "lock":
+                player.on_lock(engine, tick)
+            elif event[0] == "spawn":
+                player.on_spawn(tick)
+    return buffer, dropped, player.arrived
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="入力のバッファの有無で操作の遅れを比べる")
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--board", type=board_size, default=(8, 6), metavar="WxH",
+                        help="盤面の大きさ（既定: 8x6）")
+    args = parser.parse_args(argv)
+
+    for buffered in (False, True):
+        start = time.perf_counter()
+        arrived = []
+        dropped = 0
+        total = InputBuffer()
+        for i in range(args.games):
+            buffer, lost, times = play_tapping(args.seed * 1000003 + i, buffered, args.board)
+            dropped += lost
+            arrived.extend(times)
+            if buffer is not None:
+                dropped += buffer.overflow
+                total.merge(buffer)
+        arrived.sort()
+        print("%-9s dropped %5d  spawn->target ticks mean %.1f p50 %d p95 %d  (%d cards, %.1f s)" % (
+            "buffered" if buffered else "direct", dropped, sum(arrived) / len(arrived) if arrived else 0.0,
+            percentile(arrived, 50), percentile(arrived, 95), len(arrived), time.perf_counter() - start))
+        if buffered:
+            print("          " + total.report_line())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
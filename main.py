@@ -1,68 +1,132 @@
+import time
+IMPORT_START = time.perf_counter()  # 起動時間の計測の起点（以下のモジュールの読み込みも含める）
+
+import argparse
 import pyxel
 import random
 import math
+import sys
+
+from engine import (HanafudaEngine, ACTION_NONE, ACTION_LEFT, ACTION_RIGHT, ACTION_DOWN, ACTION_RESTART,
+                    ACTION_HARD_DROP, board_size)
+from cards import CARD_MONTH, CARD_BANK, CARD_U, CARD_V
+from particles import ParticlePool
+from input_buffer import InputBuffer
+from event_log import EventBus, EventLogWriter
+from replay import ReplayRecorder, new_seed, new_engine
+from profiler import FrameProfiler, StartupTimer
+from clock import FixedStepClock, TICK_RATE
+from spectate import SpectatorClient
+
+IMPORT_MS = (time.perf_counter() - IMPORT_START) * 1000.0
+
+RESOURCE_FILE = "my_resource.pyxres"
+
+# 描画キャッシュに使うイメージバンク（0番は花札の画像）
+FIELD_LAYER_BANK = 1    # 固定済みの花札とフィールドの枠
+OVERLAY_LAYER_BANK = 2  # 変化の少ない文字（ゲーム中はスコア等、タイトルでは説明文）
+
+# プロファイラで計測するエンジンのメソッド（メソッド名 -> フェーズ名）
+ENGINE_PHASES = {
+    "update_removal_process": "removal",
+    "handle_input": "input",
+    "drop_card": "drop",
+}
+
+# 一度に表示するマス数（盤面がこれより大きいときはスクロールして一部だけを描く）
+VIEW_COLUMNS = 8
+VIEW_ROWS = 6
 
 class HanafudaTetris:
-    def __init__(self):
+    def __init__(self, headless=False, field_width=8, field_height=6, fps=TICK_RATE, startup_report=False,
+                 watch=None, input_report=False, event_log=None):
+        # 起動の段階ごとの時間（最初のフレームまで。startup_report=True なら音の読み込み後に表示）
+        self.startup = StartupTimer()
+        self.startup.add("import", IMPORT_MS)
+        self.startup_report = startup_report
+        
         # 画面サイズ
         self.WIDTH = 256
         self.HEIGHT = 240
         
+        # ルールエンジン（盤面・スコア・タイマーはすべてこちらが持つ）
+        self.engine = HanafudaEngine(width=field_width, height=field_height)
+        
         # ゲームフィールド設定
-        self.FIELD_WIDTH = 8
-        self.FIELD_HEIGHT = 6  # 高さを調整
+        self.FIELD_WIDTH = self.engine.FIELD_WIDTH
+        self.FIELD_HEIGHT = self.engine.FIELD_HEIGHT
         self.CARD_WIDTH = 20   # 新しい画像サイズ
         self.CARD_HEIGHT = 32  # 新しい画像サイズ
-        self.FIELD_X = (self.WIDTH - self.FIELD_WIDTH * self.CARD_WIDTH) // 2
+        
+        # 表示範囲（大きい盤面では VIEW_COLUMNS x VIEW_ROWS マスだけを描き、落下中の花札を追う）
+        self.VIEW_WIDTH = min(self.FIELD_WIDTH, VIEW_COLUMNS)
+        self.VIEW_HEIGHT = min(self.FIELD_HEIGHT, VIEW_ROWS)
+        self.view_x = 0
+        self.view_y = 0
+        self.view_follow = True  # False の間（手動でスクロールした後）は落下中の花札を追わない
+        self.FIELD_X = (self.WIDTH - self.VIEW_WIDTH * self.CARD_WIDTH) // 2
         self.FIELD_Y = 30
         
         # ゲーム状態
-        self.game_state = "title"  # title, playing, game_over
-        self.score = 0
-        self.combo = 0
-        self.bonus_time = 0
-        self.pause_time = 0
-        self.spawn_delay = 0
-        
-        # 消去演出用の状態管理
-        self.removal_state = "none"  # none, marking, removing, dropping
-        self.removal_timer = 0
-        self.cards_to_remove = set()
-        self.removal_flash_frame = 0
+        self.game_state = "title"  # title, playing, game_over, watching
+        
+        # 観戦（watch に SpectatorClient を渡すと、配信された状態をエンジンの代わりに描く）
+        self.watch = watch
+        self.watch_marked = frozenset()  # 前のティックに点滅していたマス（消えたら演出を出す）
+        self.watch_error = None
+        if watch is not None:
+            self.game_state = "watching"
         
         # タイトル画面用のアニメーション
         self.title_animation_frame = 0
         self.title_demo_cards = self.generate_demo_cards()
         
-        # フィールド（0は空、1-48は花札の種類）
-        self.field = [[0 for _ in range(self.FIELD_WIDTH)] for _ in range(self.FIELD_HEIGHT)]
-        
-        # 落下中の花札
-        self.falling_card = None
-        self.falling_x = self.FIELD_WIDTH // 2
-        self.falling_y = 0
-        self.drop_timer = 0
-        self.drop_speed = 60  # フレーム数
+        # 演出用（固定容量のパーティクルプール）
+        self.particles = ParticlePool()
         
-        # 花札データ（月ごとに4枚ずつ）
-        self.hanafuda_data = self.create_hanafuda_data()
+        # 描画キャッシュの状態（内容が変わったら描き直す）
+        self.field_layer_key = None
+        self.overlay_layer_key = None
         
-        # 次の花札
-        self.next_card = random.randint(1, 48)
+        # フェーズ別の処理時間計測（F1で計測と表示の切り替え、F2でトレースを書き出し）
+        self.profiler = FrameProfiler()
         
-        # 演出用
-        self.effect_particles = []
+        # ルールは固定ステップの時計で進める（描画のフレームレート fps とは独立に毎秒 TICK_RATE 回）
+        # ヘッドレスでは実時間を使わず、update 1回を 1/fps 秒として進める（結果が決定的になる）
+        self.clock = FixedStepClock()
+        self.frame_time = 1.0 / fps if headless else None
+        self.pending_action = ACTION_NONE  # まだティックに渡していない「押した瞬間」の入力
         
-        # Pyxelを初期化
-        pyxel.init(self.WIDTH, self.HEIGHT, title="Hanafuda Tetris")
+        # プレイ中の左右移動は時刻つきで溜め、エンジンが受け付けるティックで渡す
+        # （生成遅延・消去演出の間に押した移動も捨てない。input_report=True ならゲームごとに遅延を表示）
+        self.input = InputBuffer()
+        self.input_report = input_report
         
-        # リソースファイルを読み込み（新しいファイル名）
-        pyxel.load("my_resource.pyxres")
+        # エンジンの出来事の配信（event_log にパスを渡すと、別スレッドでバイナリのログに追記する）
+        self.bus = EventBus()
+        self.event_log = None
+        if event_log is not None:
+            self.event_log = EventLogWriter(event_log)
+            self.bus.subscribe(self.event_log.write)
         
         # 花札の色データを設定
         self.setup_colors()
+        self.startup.mark("setup")
         
-        pyxel.run(self.update, self.draw)
+        # Pyxelを初期化（headless=True ならウィンドウを開かず、ループも回さない：計測用）
+        if headless:
+            pyxel.init(self.WIDTH, self.HEIGHT, title="Hanafuda Tetris", fps=fps, headless=True)
+        else:
+            pyxel.init(self.WIDTH, self.HEIGHT, title="Hanafuda Tetris", fps=fps)
+        self.startup.mark("pyxel.init")
+        
+        # 最初のフレームに要る画像だけを先に読み込む（効果音と音楽は最初のフレームの後で読む）
+        pyxel.load(RESOURCE_FILE, exclude_tilemaps=True, exclude_sounds=True, exclude_musics=True)
+        self.audio_loaded = False
+        self.startup.mark("images")
+        
+        if not headless:
+            pyxel.run(self.update, self.draw)
     
     def generate_demo_cards(self):
         """タイトル画面用のデモカード配置を生成"""
@@ -92,48 +156,6 @@ class HanafudaTetris:
             'カス': 6   # グレー
         }
     
-    def create_hanafuda_data(self):
-        """花札データを作成"""
-        # 月ごとの花札（1月=1-4, 2月=5-8, ...）
-        data = {}
-        for month in range(1, 13):
-            for card in range(1, 5):
-                card_id = (month - 1) * 4 + card
-                data[card_id] = {
-                    'month': month,
-                    'type': self.get_card_type(month, card),
-                    'color': self.get_card_color(month, card)
-                }
-        return data
-    
-    def get_card_type(self, month, card):
-        """カードタイプを取得"""
-        # 光札（ひかりふだ）
-        if (month == 1 and card == 1) or (month == 3 and card == 1) or \
-           (month == 8 and card == 1) or (month == 11 and card == 1) or \
-           (month == 12 and card == 1):
-            return "光"
-        # 短冊（たんざく）
-        elif card == 2:
-            return "短"
-        # 種札（たねふだ）
-        elif card == 3:
-            return "種"
-        # カス札
-        else:
-            return "カス"
-    
-    def get_card_color(self, month, card):
-        """カードの色を取得"""
-        # 赤短
-        if month in [1, 2, 3] and card == 2:
-            return "赤"
-        # 青短
-        elif month in [6, 9, 10] and card == 2:
-            return "青"
-        else:
-            return "通常"
-    
     def get_card_season_color(self, month):
         """季節による色を取得"""
         if month <= 3:
@@ -145,72 +167,111 @@ class HanafudaTetris:
         else:
             return '冬'
     
-    def get_card_image_pos(self, card_id):
-        """カードIDから画像位置を取得（新しい配置方式）"""
-        # card_id: 1-48
-        # 1-4: 1月, 5-8: 2月, ...
-        month = ((card_id - 1) // 4) + 1
-        card_in_month = ((card_id - 1) % 4) + 1
-        
-        # 新しい配置方式での座標計算
-        # 1月1枚目(0,0),2枚目(20,0),3枚目(40,0),4枚目(60,0)
-        # 2月1枚目(80,0),2枚目(100,0),3枚目(120,0),4枚目(140,0)
-        # 3月1枚目(0,32),2枚目(20,32),3枚目(40,32),4枚目(60,32)
-        # 4月1枚目(80,32),2枚目(100,32),3枚目(120,32),4枚目(140,32)
-        
-        # 行と列の計算
-        row = (month - 1) // 2  # 2月ごとに行が変わる
-        col_offset = ((month - 1) % 2) * 4  # 奇数月は0、偶数月は4列目から
-        
-        # 座標計算
-        x = (col_offset + card_in_month - 1) * 20
-        y = row * 32
-        
-        # 全てイメージバンク0に配置
-        bank = 0
-        
-        return bank, x, y
+    def load_audio(self):
+        """効果音と音楽を読み込む（最初のフレームを描いた次の update か、初めて鳴らすとき）"""
+        if self.audio_loaded:
+            return
+        pyxel.load(RESOURCE_FILE, exclude_images=True, exclude_tilemaps=True)
+        self.audio_loaded = True
+        self.startup.mark("audio")
+        if self.startup_report:
+            sys.stderr.write(self.startup.report() + "\n")
+    
+    def play_sound(self, ch, snd):
+        self.load_audio()
+        pyxel.play(ch, snd)
+    
+    def play_music(self, msc):
+        self.load_audio()
+        pyxel.playm(msc)
     
     def start_game(self):
         """ゲームを開始"""
         self.game_state = "playing"
-        self.score = 0
-        self.combo = 0
-        self.bonus_time = 0
-        self.pause_time = 0
-        self.spawn_delay = 0
-        self.removal_state = "none"
-        self.removal_timer = 0
-        self.cards_to_remove = set()
-        self.field = [[0 for _ in range(self.FIELD_WIDTH)] for _ in range(self.FIELD_HEIGHT)]
-        self.drop_timer = 0
-        self.drop_speed = 60
-        self.effect_particles = []
-        self.next_card = random.randint(1, 48)
-        self.spawn_new_card()
-        pyxel.playm(0, )
-    
-    def spawn_new_card(self):
-        """新しい花札を生成"""
-        self.falling_card = self.next_card
-        self.falling_x = self.FIELD_WIDTH // 2
-        self.falling_y = 0
-        self.next_card = random.randint(1, 48)
-        
-        # ゲームオーバーチェック
-        if self.field[0][self.falling_x] != 0:
-            self.game_state = "game_over"
-            pyxel.play(1, 0)
+        # ゲームごとのシードと入力を記録しておけば同じゲームを再現できる
+        seed = new_seed()
+        self.engine = new_engine(seed, self.FIELD_WIDTH, self.FIELD_HEIGHT)
+        self.recorder = ReplayRecorder(seed, self.FIELD_WIDTH, self.FIELD_HEIGHT)
+        if self.event_log is not None:
+            self.event_log.begin_game(seed, self.FIELD_WIDTH, self.FIELD_HEIGHT)
+        # reset で出た最初の花札の spawn は次の step で消えるので、ここで配る
+        self.bus.publish(self.engine.frame, self.engine.events)
+        self.particles.clear()
+        self.input.clear()
+        self.view_follow = True
+        self.follow_falling_card()
+        self.field_layer_key = None
+        self.overlay_layer_key = None
+        self.attach_profiler()
+        self.play_music(0)
     
     def update(self):
+        profiler = self.profiler
+        if self.startup.first_frame_ms is None:
+            self.startup.mark("run")  # pyxel.run がループを始めるまで（ウィンドウの表示など）
+        elif not self.audio_loaded:
+            self.load_audio()
+        if pyxel.btnp(pyxel.KEY_F1):
+            self.toggle_profiler()
+        if pyxel.btnp(pyxel.KEY_F2) and profiler.enabled:
+            try:
+                profiler.export_chrome_trace("frame_trace.json")
+            except OSError:
+                pass  # Web版など書き込めない環境では保存しない
+        
+        profiler.begin_frame()
+        with profiler.phase("update"):
+            # 押した瞬間の入力は次のティックまで持ち越す（ティックのないフレームでも取りこぼさない）
+            action = self.read_action()
+            # 押した時刻（ヘッドレスでは実時間でなく、フレーム数から換算した時刻）
+            now = time.perf_counter() if self.frame_time is None else self.clock.frames * self.frame_time
+            done = self.clock.ticks
+            if self.game_state == "playing":
+                self.input.press(action, now, done)
+                # 即時落下は溜めない（受け付けない間に押すと次の花札をいきなり落としてしまうため）
+                self.pending_action |= action & (ACTION_RESTART | ACTION_HARD_DROP)
+            else:
+                self.pending_action |= action & ~ACTION_DOWN
+            for i in range(self.clock.advance(self.frame_time)):
+                tick_action = self.pending_action | (action & ACTION_DOWN)
+                if self.game_state == "playing":
+                    tick_action |= self.input.take(self.engine, now, done + i + 1)
+                self.tick(tick_action)
+                self.pending_action = ACTION_NONE
+            
+            # 表示範囲のスクロール（I/J/K/L で手動、それ以外は落下中の花札を追う）
+            if self.game_state in ("playing", "watching"):
+                self.update_view()
+    
+    def tick(self, action):
+        """ルールと演出を1ティック進める"""
         if self.game_state == "title":
-            self.update_title()
+            self.update_title(action)
         elif self.game_state == "playing":
-            self.update_game()
+            self.update_game(action)
         elif self.game_state == "game_over":
-            self.update_game_over()
-    
-    def update_title(self):
+            self.update_game_over(action)
+        elif self.game_state == "watching":
+            self.update_watch()
+    
+    def toggle_profiler(self):
+        """処理時間の計測と画面表示を切り替える"""
+        profiler = self.profiler
+        if profiler.enabled:
+            profiler.disable()
+        else:
+            profiler.enable()
+            profiler.instrument(pyxel)
+            self.attach_profiler()
+    
+    def attach_profiler(self):
+        """今のエンジンのフェーズを計測対象にする"""
+        profiler = self.profiler
+        if profiler.enabled:
+            profiler.unwrap_all()
+            profiler.wrap_methods(self.engine, ENGINE_PHASES)
+    
+    def update_title(self, action):
         """タイトル画面の更新"""
         self.title_animation_frame += 1
         
@@ -231,446 +292,231 @@ class HanafudaTetris:
                 card['y'] = -self.CARD_HEIGHT
         
         # 入力処理
-        if pyxel.btnp(pyxel.GAMEPAD1_BUTTON_A) or pyxel.btnp(pyxel.KEY_SPACE):
+        if action & ACTION_RESTART:
             self.start_game()
     
-    def update_game(self):
-        # ボーナスタイム・一時停止時間・生成遅延時間の更新
-        if self.bonus_time > 0:
-            self.bonus_time -= 1
-        if self.pause_time > 0:
-            self.pause_time -= 1
-        if self.spawn_delay > 0:
-            self.spawn_delay -= 1
-            # 生成遅延が終了したら新しい花札を生成
-            if self.spawn_delay == 0 and self.falling_card is None:
-                self.spawn_new_card()
-        
-        # 消去処理の状態管理
-        self.update_removal_process()
-        
-        # 入力処理（一時停止中や生成遅延中、消去処理中は入力を制限）
-        if self.pause_time <= 0 and self.spawn_delay <= 0 and self.removal_state == "none":
-            self.handle_input()
-        
-        # 花札の落下処理（一時停止中や生成遅延中、消去処理中は落下しない）
-        if self.pause_time <= 0 and self.spawn_delay <= 0 and self.removal_state == "none":
-            self.drop_timer += 1
-            if self.drop_timer >= self.drop_speed:
-                self.drop_card()
-                self.drop_timer = 0
+    def update_game(self, action):
+        # F キーを押している間は消去演出・待ち時間を早送りする（入力を受け付けないフレームだけ）
+        if pyxel.btn(pyxel.KEY_F):
+            skipped = self.engine.fast_forward()
+            if skipped:
+                self.recorder.record(ACTION_NONE, skipped)
+        
+        # ルールを1ティック進め、起きた出来事を演出に反映
+        self.recorder.record(action)
+        events = self.engine.step(action)
+        self.bus.publish(self.engine.frame, events)
+        self.handle_events(events)
         
         # 演出パーティクルの更新
+        with self.profiler.phase("particles"):
+            self.update_particles()
+    
+    def update_watch(self):
+        """観戦：届いた差分を反映し、消えたマスに演出を出す"""
+        self.watch.poll()
+        state = self.watch.state
+        if state is not None and self.watch_error is None:
+            if (state.FIELD_WIDTH, state.FIELD_HEIGHT) != (self.FIELD_WIDTH, self.FIELD_HEIGHT):
+                self.watch_error = "BOARD %dx%d (USE --board)" % (state.FIELD_WIDTH, state.FIELD_HEIGHT)
+            else:
+                if self.engine is not state:
+                    self.engine = state
+                    self.field_layer_key = None
+                    self.overlay_layer_key = None
+                if state.removal_state == "marking":
+                    self.watch_marked = state.cards_to_remove
+                elif self.watch_marked:
+                    self.play_sound(3, 4)
+                    for x, y in self.watch_marked:
+                        if self.in_view(x, y):
+                            self.create_particles(x, y)
+                    self.watch_marked = frozenset()
         self.update_particles()
-        
-        # 落下速度の調整
-        self.drop_speed = max(10, 60 - self.score // 1000)
     
-    def update_removal_process(self):
-        """消去処理の状態管理"""
-        if self.removal_state == "marking":
-            # マーキング状態：消去対象の花札を点滅表示
-            self.removal_flash_frame += 1
-            self.removal_timer += 1
-            
-            # 1秒間（30フレーム）点滅させる
-            if self.removal_timer >= 30:
-                self.removal_state = "removing"
-                self.removal_timer = 0
-                
-        elif self.removal_state == "removing":
-            # 消去状態：実際に花札を削除してパーティクルを生成
-            # 得点計算
-            points = self.calculate_points(self.cards_to_remove)
-            combo_multiplier = self.combo + 1
-            self.score += points * combo_multiplier * (2 if self.bonus_time > 0 else 1)
-            pyxel.play(3, 4)
-            
-            # 演出パーティクルを生成
-            for x, y in self.cards_to_remove:
-                self.create_particles(x, y)
-                self.field[y][x] = 0
-            
-            self.removal_state = "dropping"
-            self.removal_timer = 0
-            
-        elif self.removal_state == "dropping":
-            # 落下状態：花札を重力で落下させる
-            self.drop_cards()
-            self.removal_state = "none"
-            
-            # 再度消去チェック（連鎖のため）
-            new_removals = self.find_cards_to_remove()
-            if new_removals:
-                self.start_removal_process(new_removals)
-                self.combo += 1
-            else:
-                self.combo = 0
-                # 花札消去完了時に0.5秒間の一時停止を設定
-                self.pause_time = 30  # 60fps × 0.5秒 = 30フレーム
-    
-    def start_removal_process(self, cards_to_remove):
-        """消去プロセスを開始"""
-        self.cards_to_remove = cards_to_remove
-        self.removal_state = "marking"
-        self.removal_timer = 0
-        self.removal_flash_frame = 0
-    
-    def find_cards_to_remove(self):
-        """消去対象の花札を検索"""
-        to_remove = set()
-        visited = set()
-        
-        # 全てのマスをチェック
-        for y in range(self.FIELD_HEIGHT):
-            for x in range(self.FIELD_WIDTH):
-                if self.field[y][x] != 0 and (x, y) not in visited:
-                    card_month = self.hanafuda_data[self.field[y][x]]['month']
-                    
-                    # 連結された同じ月の花札を探索
-                    connected = self.find_connected_cards(x, y, card_month, visited)
-                    
-                    # 3枚以上連結されていれば消去対象に追加
-                    if len(connected) >= 3:
-                        to_remove.update(connected)
-        
-        # 特殊役のチェック
-        special_removes = self.check_special_combinations()
-        to_remove.update(special_removes)
-        
-        return to_remove
-    
-    def handle_input(self):
-        """入力処理"""
-        # 左右移動
-        if (pyxel.btnp(pyxel.GAMEPAD1_BUTTON_DPAD_LEFT) or pyxel.btnp(pyxel.KEY_LEFT)) and self.falling_x > 0:
-            if self.can_move(self.falling_x - 1, self.falling_y):
-                self.falling_x -= 1
-        if (pyxel.btnp(pyxel.GAMEPAD1_BUTTON_DPAD_RIGHT) or pyxel.btnp(pyxel.KEY_RIGHT)) and self.falling_x < self.FIELD_WIDTH - 1:
-            if self.can_move(self.falling_x + 1, self.falling_y):
-                self.falling_x += 1
-        
-        # 高速落下
-        if (pyxel.btn(pyxel.GAMEPAD1_BUTTON_DPAD_DOWN) or pyxel.btn(pyxel.KEY_DOWN)):
-            self.drop_timer = self.drop_speed
-        
-        # リスタート
+    def read_action(self):
+        """Pyxelの入力をエンジンのアクションに変換"""
+        action = ACTION_NONE
+        if pyxel.btnp(pyxel.GAMEPAD1_BUTTON_DPAD_LEFT) or pyxel.btnp(pyxel.KEY_LEFT):
+            action |= ACTION_LEFT
+        if pyxel.btnp(pyxel.GAMEPAD1_BUTTON_DPAD_RIGHT) or pyxel.btnp(pyxel.KEY_RIGHT):
+            action |= ACTION_RIGHT
+        if pyxel.btn(pyxel.GAMEPAD1_BUTTON_DPAD_DOWN) or pyxel.btn(pyxel.KEY_DOWN):
+            action |= ACTION_DOWN
+        if pyxel.btnp(pyxel.GAMEPAD1_BUTTON_DPAD_UP) or pyxel.btnp(pyxel.KEY_UP):
+            action |= ACTION_HARD_DROP
         if pyxel.btnp(pyxel.GAMEPAD1_BUTTON_A) or pyxel.btnp(pyxel.KEY_SPACE):
-            self.restart_game()
-    
-    def can_move(self, x, y):
-        """移動可能かチェック"""
-        if x < 0 or x >= self.FIELD_WIDTH or y >= self.FIELD_HEIGHT:
-            return False
-        if y < 0:
-            return True
-        return self.field[y][x] == 0
-    
-    def drop_card(self):
-        """花札を1マス下に落とす"""
-        if self.can_move(self.falling_x, self.falling_y + 1):
-            self.falling_y += 1
-        else:
-            # 花札を固定
-            self.field[self.falling_y][self.falling_x] = self.falling_card
-            pyxel.play(3, 5)
-            
-            # 消去チェック
-            self.check_and_remove_cards()
-            
-            # 新しい花札を生成（0.5秒の遅延付き）
-            self.spawn_delay = 30  # 60fps × 0.5秒 = 30フレーム
-            self.falling_card = None  # 一時的に落下中の花札を無効化
-    
-    def find_connected_cards(self, start_x, start_y, target_month, visited):
-        """指定された月の花札で連結された領域を探索（フラッドフィル）"""
-        # 範囲外チェック
-        if (start_x < 0 or start_x >= self.FIELD_WIDTH or 
-            start_y < 0 or start_y >= self.FIELD_HEIGHT):
-            return []
-        
-        # 既に訪問済みかチェック
-        if (start_x, start_y) in visited:
-            return []
-        
-        # 空のマスまたは異なる月の花札はスキップ
-        if self.field[start_y][start_x] == 0:
-            return []
-        
-        card_month = self.hanafuda_data[self.field[start_y][start_x]]['month']
-        if card_month != target_month:
-            return []
-        
-        # 現在の位置を訪問済みに追加
-        visited.add((start_x, start_y))
-        connected = [(start_x, start_y)]
-        
-        # 4方向（上下左右）を探索
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-        for dx, dy in directions:
-            new_x, new_y = start_x + dx, start_y + dy
-            connected.extend(self.find_connected_cards(new_x, new_y, target_month, visited))
-        
-        return connected
-    
-    def check_and_remove_cards(self):
-        """花札の消去チェック（縦横連結判定）"""
-        cards_to_remove = self.find_cards_to_remove()
-        
-        if cards_to_remove:
-            self.start_removal_process(cards_to_remove)
-            self.combo = 1  # 初回コンボ
-        else:
-            self.combo = 0
-    
-    def check_special_combinations(self):
-        """特殊役のチェック"""
-        to_remove = set()
-        special_bonus = 0
-        
-        # フィールド上の全ての花札を収集
-        cards_on_field = {}  # card_id -> [(x, y), ...]
-        for y in range(self.FIELD_HEIGHT):
-            for x in range(self.FIELD_WIDTH):
-                if self.field[y][x] != 0:
-                    card_id = self.field[y][x]
-                    if card_id not in cards_on_field:
-                        cards_on_field[card_id] = []
-                    cards_on_field[card_id].append((x, y))
-        
-        # 光札の位置を取得
-        hikari_cards = {}  # month -> [(x, y), ...]
-        for card_id, positions in cards_on_field.items():
-            month = ((card_id - 1) // 4) + 1
-            card_in_month = ((card_id - 1) % 4) + 1
-            if card_in_month == 1:  # 各月の1枚目
-                hikari_cards[month] = positions
-        
-        # 五光チェック（1月1枚目＋3月1枚目＋8月1枚目＋11月1枚目＋12月1枚目）
-        goko_months = [1, 3, 8, 11, 12]
-        goko_positions = []
-        for month in goko_months:
-            if month in hikari_cards:
-                goko_positions.extend(hikari_cards[month])
-        
-        if len(goko_positions) >= 5:
-            to_remove.update(goko_positions)
-            special_bonus += 3000
-        
-        # 雨四光チェック（11月1枚目(必須)＋1月1枚目or3月1枚目or8月1枚目or12月1枚目から3枚）
-        elif 11 in hikari_cards:
-            ame_shiko_positions = hikari_cards[11][:]
-            ame_shiko_months = [1, 3, 8, 12]
-            for month in ame_shiko_months:
-                if month in hikari_cards:
-                    ame_shiko_positions.extend(hikari_cards[month])
-            
-            if len(ame_shiko_positions) >= 4:
-                to_remove.update(ame_shiko_positions)
-                special_bonus += 1500
-        
-        # 四光チェック（1月1枚目or3月1枚目or8月1枚目or12月1枚目の4枚）
-        elif len(goko_positions) >= 4:
-            to_remove.update(goko_positions)
-            special_bonus += 1200
-        
-        # 三光チェック（1月1枚目or3月1枚目or8月1枚目or12月1枚目から3枚）
-        elif len(goko_positions) >= 3:
-            to_remove.update(goko_positions)
-            special_bonus += 800
-        
-        # 猪鹿蝶チェック（6月1枚目＋7月1枚目＋10月1枚目）
-        inoshikacho_months = [6, 7, 10]
-        inoshikacho_positions = []
-        inoshikacho_found = True
-        for month in inoshikacho_months:
-            if month in hikari_cards:
-                inoshikacho_positions.extend(hikari_cards[month])
-            else:
-                inoshikacho_found = False
-                break
-        
-        if inoshikacho_found and len(inoshikacho_positions) >= 3:
-            to_remove.update(inoshikacho_positions)
-            special_bonus += 1000
-        
-        # 花見で一杯チェック（3月1枚目＋9月1枚目）
-        hanami_months = [3, 9]
-        hanami_positions = []
-        hanami_found = True
-        for month in hanami_months:
-            if month in hikari_cards:
-                hanami_positions.extend(hikari_cards[month])
-            else:
-                hanami_found = False
-                break
-        
-        if hanami_found and len(hanami_positions) >= 2:
-            to_remove.update(hanami_positions)
-            special_bonus += 400
-        
-        # 月見で一杯チェック（8月1枚目＋9月1枚目）
-        tsukimi_months = [8, 9]
-        tsukimi_positions = []
-        tsukimi_found = True
-        for month in tsukimi_months:
-            if month in hikari_cards:
-                tsukimi_positions.extend(hikari_cards[month])
-            else:
-                tsukimi_found = False
-                break
-        
-        if tsukimi_found and len(tsukimi_positions) >= 2:
-            to_remove.update(tsukimi_positions)
-            special_bonus += 400
-        
-        # 青短・赤短のチェック
-        blue_tan = []
-        red_tan = []
-        
-        for y in range(self.FIELD_HEIGHT):
-            for x in range(self.FIELD_WIDTH):
-                if self.field[y][x] != 0:
-                    card_data = self.hanafuda_data[self.field[y][x]]
-                    if card_data['type'] == '短' and card_data['color'] == '青':
-                        blue_tan.append((x, y))
-                    elif card_data['type'] == '短' and card_data['color'] == '赤':
-                        red_tan.append((x, y))
-        
-        if len(blue_tan) >= 3:
-            to_remove.update(blue_tan)
-            special_bonus += 500
-        if len(red_tan) >= 3:
-            to_remove.update(red_tan)
-            special_bonus += 500
-        
-        # 特殊役ボーナスをスコアに加算
-        if special_bonus > 0:
-            self.score += special_bonus * (2 if self.bonus_time > 0 else 1)
-            # 特殊役達成時はボーナスタイムを追加
-            self.bonus_time += 300  # 5秒間
-        
-        return to_remove
-    
-    def calculate_points(self, removed_positions):
-        """得点計算"""
-        count = len(removed_positions)
-        
-        # 基本得点
-        if count == 3:
-            return 100
-        elif count == 4:
-            return 200
-        elif count >= 5:
-            return 300
-        
-        return 0
-    
-    def drop_cards(self):
-        """花札を重力で落下"""
-        for x in range(self.FIELD_WIDTH):
-            # 下から上へスキャン
-            write_y = self.FIELD_HEIGHT - 1
-            for read_y in range(self.FIELD_HEIGHT - 1, -1, -1):
-                if self.field[read_y][x] != 0:
-                    self.field[write_y][x] = self.field[read_y][x]
-                    if write_y != read_y:
-                        self.field[read_y][x] = 0
-                    write_y -= 1
+            action |= ACTION_RESTART
+        return action
+    
+    def update_view(self):
+        """表示範囲のスクロール"""
+        dx = dy = 0
+        if pyxel.btnp(pyxel.KEY_J, 8, 2):
+            dx -= 1
+        if pyxel.btnp(pyxel.KEY_L, 8, 2):
+            dx += 1
+        if pyxel.btnp(pyxel.KEY_I, 8, 2):
+            dy -= 1
+        if pyxel.btnp(pyxel.KEY_K, 8, 2):
+            dy += 1
+        if dx or dy:
+            self.view_follow = False
+            self.scroll_view(self.view_x + dx, self.view_y + dy)
+        elif self.view_follow:
+            self.follow_falling_card()
+    
+    def scroll_view(self, view_x, view_y):
+        """表示範囲の左上のマスを盤面の中に収めて設定"""
+        self.view_x = max(0, min(view_x, self.FIELD_WIDTH - self.VIEW_WIDTH))
+        self.view_y = max(0, min(view_y, self.FIELD_HEIGHT - self.VIEW_HEIGHT))
+    
+    def follow_falling_card(self):
+        """落下中の花札が表示範囲に入るようにスクロール"""
+        engine = self.engine
+        if engine.falling_card is None:
+            return
+        x, y = engine.falling_x, engine.falling_y
+        view_x, view_y = self.view_x, self.view_y
+        if not view_x <= x < view_x + self.VIEW_WIDTH:
+            view_x = x - self.VIEW_WIDTH // 2
+        if not view_y <= y < view_y + self.VIEW_HEIGHT:
+            view_y = y - self.VIEW_HEIGHT + 1 if y >= view_y else y
+        self.scroll_view(view_x, view_y)
+    
+    def in_view(self, x, y):
+        """盤面のマスが表示範囲に入っているか"""
+        return (self.view_x <= x < self.view_x + self.VIEW_WIDTH and
+                self.view_y <= y < self.view_y + self.VIEW_HEIGHT)
+    
+    def handle_events(self, events):
+        """エンジンの出来事に合わせてサウンド・演出を再生"""
+        for event in events:
+            kind = event[0]
+            if kind == "spawn":
+                # 新しい花札が出たら手動スクロールをやめて追いかける
+                self.view_follow = True
+            elif kind == "lock":
+                self.play_sound(3, 5)
+            elif kind == "remove":
+                self.play_sound(3, 4)
+                # 演出パーティクルを生成（表示範囲の外は省く）
+                for x, y in event[1]:
+                    if self.in_view(x, y):
+                        self.create_particles(x, y)
+            elif kind == "game_over":
+                self.game_state = "game_over"
+                self.play_sound(1, 0)
+                self.save_replay()
+                self.input.clear()
+                if self.input_report:
+                    sys.stderr.write(self.input.report_line() + "\n")
+            elif kind == "restart":
+                self.restart_game()
+                return
+    
+    def save_replay(self):
+        """終わったゲームのリプレイを保存"""
+        # ゲームオーバーのフレームでもスコアが変わることがあるので、フレーム処理後の値を使う
+        self.last_replay = self.recorder.finish(self.engine.score)
+        if self.event_log is not None:
+            self.event_log.end_game(self.engine.frame, self.engine.score)
+        try:
+            self.last_replay.save("last_replay.hfr")
+        except OSError:
+            pass  # Web版など書き込めない環境では保存しない
     
     def create_particles(self, x, y):
         """パーティクル生成"""
+        center_x = (x - self.view_x) * self.CARD_WIDTH + self.FIELD_X + self.CARD_WIDTH // 2
+        center_y = (y - self.view_y) * self.CARD_HEIGHT + self.FIELD_Y + self.CARD_HEIGHT // 2
         for _ in range(5):
-            self.effect_particles.append({
-                'x': x * self.CARD_WIDTH + self.FIELD_X + self.CARD_WIDTH // 2,
-                'y': y * self.CARD_HEIGHT + self.FIELD_Y + self.CARD_HEIGHT // 2,
-                'vx': random.uniform(-2, 2),
-                'vy': random.uniform(-3, -1),
-                'life': 30,
-                'max_life': 30
-            })
+            self.particles.emit(center_x, center_y, random.uniform(-2, 2), random.uniform(-3, -1))
     
     def update_particles(self):
-        """パーティクル更新"""
-        for particle in self.effect_particles[:]:
-            particle['x'] += particle['vx']
-            particle['y'] += particle['vy']
-            particle['vy'] += 0.1  # 重力
-            particle['life'] -= 1
-            
-            if particle['life'] <= 0:
-                self.effect_particles.remove(particle)
+        """パーティクル更新（移動・重力・寿命切れの削除はプールが行う）"""
+        self.particles.update()
     
-    def update_game_over(self):
+    def update_game_over(self, action):
         """ゲームオーバー時の更新"""
-        if pyxel.btnp(pyxel.GAMEPAD1_BUTTON_A) or pyxel.btnp(pyxel.KEY_SPACE):
+        if action & ACTION_RESTART:
             self.restart_game()
             #pyxel.playm(0, )
     
     def restart_game(self):
         """ゲームリスタート"""
         self.game_state = "title"
-        self.score = 0
-        self.combo = 0
-        self.bonus_time = 0
-        self.pause_time = 0
-        self.removal_state = "none"
-        self.removal_timer = 0
-        self.cards_to_remove = set()
-        self.field = [[0 for _ in range(self.FIELD_WIDTH)] for _ in range(self.FIELD_HEIGHT)]
-        self.drop_timer = 0
-        self.drop_speed = 60
-        self.effect_particles = []
-        self.next_card = random.randint(1, 48)
-        self.spawn_new_card()
+        self.engine = HanafudaEngine(width=self.FIELD_WIDTH, height=self.FIELD_HEIGHT)
+        self.particles.clear()
         #pyxel.playm(0, )
     
     def draw(self):
-        pyxel.cls(0)
-        
-        if self.game_state == "title":
-            self.draw_title()
-        elif self.game_state == "playing":
-            self.draw_game()
-        elif self.game_state == "game_over":
-            self.draw_game_over()
+        profiler = self.profiler
+        with profiler.phase("draw"):
+            pyxel.cls(0)
+            
+            if self.game_state == "title":
+                self.draw_title()
+            elif self.game_state == "playing":
+                self.draw_game()
+            elif self.game_state == "game_over":
+                self.draw_game_over()
+            elif self.game_state == "watching":
+                self.draw_watch()
+        profiler.end_frame()
+        if self.startup.first_frame_ms is None:
+            self.startup.first_frame()
+        
+        if profiler.enabled:
+            profiler.draw_overlay(pyxel)
     
     def draw_title(self):
         """タイトル画面を描画"""
         # 背景のデモカード（薄く表示）
         for card in self.title_demo_cards:
-            bank, img_x, img_y = self.get_card_image_pos(card['card_id'])
+            card_id = card['card_id']
             # 薄く表示するため、透明度を下げる（グレーアウト）
-            pyxel.blt(int(card['x']), int(card['y']), bank, img_x, img_y, 
+            pyxel.blt(int(card['x']), int(card['y']), CARD_BANK[card_id], CARD_U[card_id], CARD_V[card_id],
                      self.CARD_WIDTH, self.CARD_HEIGHT, 0)
         
         # タイトルロゴ
-        title_color = pyxel.frame_count % 16 #14 if (self.title_animation_frame // 30) % 2 == 0 else 10
+        title_color = self.clock.ticks % 16 #14 if (self.title_animation_frame // 30) % 2 == 0 else 10
         pyxel.text(self.WIDTH // 2 - 20, 60, "HANAFUDA", title_color)
         pyxel.text(self.WIDTH // 2 - 16, 75, "TETRIS", title_color)
         
+        # 変化しない文字はまとめて描いた画像を1回で転送
+        if self.overlay_layer_key != "title":
+            self.build_title_layer(pyxel.images[OVERLAY_LAYER_BANK])
+            self.overlay_layer_key = "title"
+        pyxel.blt(0, 0, OVERLAY_LAYER_BANK, 0, 0, self.WIDTH, self.HEIGHT, 0)
+        
+        # 開始案内（点滅効果）
+        text = "Press A or SPACE to Start"
+        color = 14 if (self.title_animation_frame // 20) % 2 == 0 else 6
+        pyxel.text(self.WIDTH // 2 - len(text) * 2, 130 + 7 * 8, text, color)
+    
+    def build_title_layer(self, layer):
+        """タイトル画面の変化しない文字を描画"""
+        layer.cls(0)
+        
         # サブタイトル
-        pyxel.text(self.WIDTH // 2 - 45, 100, "Japanese Card Puzzle", 7)
+        layer.text(self.WIDTH // 2 - 45, 100, "Japanese Card Puzzle", 7)
         
-        # 説明文
+        # 説明文（最後の開始案内は点滅するので毎フレーム描く）
         instructions = [
             "Match 3+ cards of same month",
             "Special combos for bonus!",
             "",
             "Controls:",
             "L/R: Move   DOWN: Drop",
+            "UP: Hard drop",
             "A or SPACE: Restart",
-            "",
-            "Press A or SPACE to Start"
         ]
         
         start_y = 130
         for i, text in enumerate(instructions):
-            color = 7 if text != "" else 0
-            if "Press A" in text:
-                # 点滅効果
-                color = 14 if (self.title_animation_frame // 20) % 2 == 0 else 6
-            pyxel.text(self.WIDTH // 2 - len(text) * 2, start_y + i * 8, text, color)
+            if text != "":
+                layer.text(self.WIDTH // 2 - len(text) * 2, start_y + i * 8, text, 7)
         
         # 特殊役の説明（小さく）
         special_info = [
@@ -682,138 +528,234 @@ class HanafudaTetris:
         
         for i, text in enumerate(special_info):
             color = 6 if i == 0 else 5
-            pyxel.text(5, 200 + i * 8, text, color)
+            layer.text(5, 200 + i * 8, text, color)
         
         # クレジット表示
-        pyxel.text(190, 217, "(V)1.5", 7)
-        pyxel.text(190, 225, "(C)2025 Saizo", 7)
+        layer.text(190, 217, "(V)1.5", 7)
+        layer.text(190, 225, "(C)2025 Saizo", 7)
 
     def draw_game(self):
         """ゲーム画面描画"""
+        engine = self.engine
+        profiler = self.profiler
+        
+        with profiler.phase("field"):
+            # 固定済みの盤面は変化したとき（スクロールしたとき）だけ描き直し、画像を1回で転送
+            field_key = (engine.field_version, self.view_x, self.view_y)
+            if field_key != self.field_layer_key:
+                self.build_field_layer(pyxel.images[FIELD_LAYER_BANK])
+                self.field_layer_key = field_key
+            pyxel.blt(0, 0, FIELD_LAYER_BANK, 0, 0, self.WIDTH, self.HEIGHT)
+            
+            # 消去対象の花札は点滅表示（6ティック周期で点滅）
+            field = engine.field
+            if engine.removal_state == "marking" and (engine.removal_flash_frame // 6) % 2 == 1:
+                self.draw_flash(engine.cards_to_remove)
+            
+            # 落下中の花札と、そのまま落としたときに止まる位置の枠
+            falling = engine.falling_card is not None and self.in_view(engine.falling_x, engine.falling_y)
+            if engine.falling_card is not None and self.game_state == "playing":
+                self.draw_ghost(engine.falling_x, engine.landing_row())
+            if falling:
+                self.draw_card(pyxel, engine.falling_x, engine.falling_y, engine.falling_card)
+            
+            # デバッグ用：月数を表示
+            if pyxel.btn(pyxel.KEY_D):
+                for y in range(self.view_y, self.view_y + self.VIEW_HEIGHT):
+                    for x in range(self.view_x, self.view_x + self.VIEW_WIDTH):
+                        if field[y][x] != 0:
+                            self.draw_card_month(x, y, field[y][x])
+                if falling:
+                    self.draw_card_month(engine.falling_x, engine.falling_y, engine.falling_card)
+        
+        # パーティクル描画（生きている先頭 count 個だけ、次のティックまでの進み具合で位置を補間）
+        with profiler.phase("effects"):
+            particles = self.particles
+            xs, ys, vxs, vys, lives = particles.x, particles.y, particles.vx, particles.vy, particles.life
+            half_life = particles.max_life / 2
+            alpha = self.clock.alpha
+            for i in range(particles.count):
+                color = 14 if lives[i] > half_life else 6
+                pyxel.pset(int(xs[i] + vxs[i] * alpha), int(ys[i] + vys[i] * alpha), color)
+        
+        # UI描画（値が変わったときだけ描き直す文字は透過で重ねる）
+        with profiler.phase("hud"):
+            overlay_key = (engine.score, engine.combo, engine.next_card)
+            if overlay_key != self.overlay_layer_key:
+                self.build_ui_layer(pyxel.images[OVERLAY_LAYER_BANK])
+                self.overlay_layer_key = overlay_key
+            pyxel.blt(0, 0, OVERLAY_LAYER_BANK, 0, 0, self.WIDTH, self.HEIGHT, 0)
+            self.draw_ui()
+    
+    def build_field_layer(self, layer):
+        """フィールドの枠と固定済みの花札を画像に描画"""
+        layer.cls(0)
+        
         # フィールドの枠
-        pyxel.rectb(self.FIELD_X - 1, self.FIELD_Y - 1, 
-                   self.FIELD_WIDTH * self.CARD_WIDTH + 2, 
-                   self.FIELD_HEIGHT * self.CARD_HEIGHT + 2, 7)
-        
-        # フィールドの花札
-        for y in range(self.FIELD_HEIGHT):
-            for x in range(self.FIELD_WIDTH):
-                if self.field[y][x] != 0:
-                    self.draw_card(x, y, self.field[y][x])
-        
-        # 落下中の花札
-        if self.falling_card is not None:
-            self.draw_card(self.falling_x, self.falling_y, self.falling_card)
-        
-        # パーティクル描画
-        for particle in self.effect_particles:
-            alpha = particle['life'] / particle['max_life']
-            color = 14 if alpha > 0.5 else 6
-            pyxel.pset(int(particle['x']), int(particle['y']), color)
-        
-        # UI描画
-        self.draw_ui()
-    
-    def draw_card(self, x, y, card_id):
-        """花札を描画"""
-        screen_x = self.FIELD_X + x * self.CARD_WIDTH
-        screen_y = self.FIELD_Y + y * self.CARD_HEIGHT
-        
-        # 消去対象の花札は点滅表示
-        is_marked_for_removal = (x, y) in self.cards_to_remove and self.removal_state == "marking"
-        
-        # 点滅効果（6フレーム周期で点滅）
-        if is_marked_for_removal and (self.removal_flash_frame // 6) % 2 == 1:
-            # 点滅時は白い枠を描画
-            pyxel.rectb(screen_x - 1, screen_y - 1, 
-                       self.CARD_WIDTH + 2, self.CARD_HEIGHT + 2, 7)
-            pyxel.rectb(screen_x - 2, screen_y - 2, 
-                       self.CARD_WIDTH + 4, self.CARD_HEIGHT + 4, 14)
-        
-        # 画像位置を取得
-        bank, img_x, img_y = self.get_card_image_pos(card_id)
-        
-        # 花札画像を描画
-        pyxel.blt(screen_x, screen_y, bank, img_x, img_y, 
-                 self.CARD_WIDTH, self.CARD_HEIGHT, 0)
-        
-        # デバッグ用：月数を表示
-        if pyxel.btn(pyxel.KEY_D):
-            month = self.hanafuda_data[card_id]['month']
-            pyxel.text(screen_x + 2, screen_y + 2, str(month), 7)
-    
-    def draw_ui(self):
-        """UI描画"""
+        layer.rectb(self.FIELD_X - 1, self.FIELD_Y - 1, 
+                   self.VIEW_WIDTH * self.CARD_WIDTH + 2, 
+                   self.VIEW_HEIGHT * self.CARD_HEIGHT + 2, 7)
+        
+        # フィールドの花札（表示範囲のマスだけ）
+        field = self.engine.field
+        for y in range(self.view_y, self.view_y + self.VIEW_HEIGHT):
+            for x in range(self.view_x, self.view_x + self.VIEW_WIDTH):
+                if field[y][x] != 0:
+                    self.draw_card(layer, x, y, field[y][x])
+        
+        # 盤面の一部だけを表示しているときは位置を示す
+        if (self.VIEW_WIDTH, self.VIEW_HEIGHT) != (self.FIELD_WIDTH, self.FIELD_HEIGHT):
+            text = f"VIEW {self.view_x},{self.view_y} / {self.FIELD_WIDTH}x{self.FIELD_HEIGHT}"
+            layer.text(self.FIELD_X + self.VIEW_WIDTH * self.CARD_WIDTH - len(text) * 4,
+                       self.FIELD_Y + self.VIEW_HEIGHT * self.CARD_HEIGHT + 3, text, 6)
+    
+    def draw_card(self, target, x, y, card_id):
+        """花札を描画（target は pyxel か描画先の Image、x, y は盤面のマス）"""
+        screen_x = self.FIELD_X + (x - self.view_x) * self.CARD_WIDTH
+        screen_y = self.FIELD_Y + (y - self.view_y) * self.CARD_HEIGHT
+        
+        # 花札画像を描画（画像位置は事前計算したテーブルから取得）
+        target.blt(screen_x, screen_y, CARD_BANK[card_id], CARD_U[card_id], CARD_V[card_id],
+                  self.CARD_WIDTH, self.CARD_HEIGHT, 0)
+    
+    def draw_ghost(self, x, y):
+        """落下中の花札が止まる位置に枠を描画（表示範囲の外なら描かない）"""
+        if y <= self.engine.falling_y or not self.in_view(x, y):
+            return
+        screen_x = self.FIELD_X + (x - self.view_x) * self.CARD_WIDTH
+        screen_y = self.FIELD_Y + (y - self.view_y) * self.CARD_HEIGHT
+        pyxel.rectb(screen_x, screen_y, self.CARD_WIDTH, self.CARD_HEIGHT, 13)
+    
+    def draw_flash(self, marked):
+        """消去対象の花札に点滅枠を描画
+        
+        枠は隣のマスにはみ出すので、消去対象とその周囲のマスだけを
+        盤面と同じ順（上の行から左→右）で描き直して重なり方を揃える。
+        """
+        field = self.engine.field
+        left, top = self.view_x, self.view_y
+        right, bottom = left + self.VIEW_WIDTH, top + self.VIEW_HEIGHT
+        cells = set()
+        for mx, my in marked:
+            # 表示範囲の外の消去対象は描かない
+            if not self.in_view(mx, my):
+                continue
+            for y in range(max(top, my - 1), min(bottom, my + 2)):
+                for x in range(max(left, mx - 1), min(right, mx + 2)):
+                    cells.add((y, x))
+        
+        for y, x in sorted(cells):
+            if (x, y) in marked:
+                screen_x = self.FIELD_X + (x - left) * self.CARD_WIDTH
+                screen_y = self.FIELD_Y + (y - top) * self.CARD_HEIGHT
+                
+                # 点滅時は白い枠を描画
+                pyxel.rectb(screen_x - 1, screen_y - 1, 
+                           self.CARD_WIDTH + 2, self.CARD_HEIGHT + 2, 7)
+                pyxel.rectb(screen_x - 2, screen_y - 2, 
+                           self.CARD_WIDTH + 4, self.CARD_HEIGHT + 4, 14)
+            if field[y][x] != 0:
+                self.draw_card(pyxel, x, y, field[y][x])
+    
+    def draw_card_month(self, x, y, card_id):
+        """デバッグ用：花札の月数を描画"""
+        screen_x = self.FIELD_X + (x - self.view_x) * self.CARD_WIDTH
+        screen_y = self.FIELD_Y + (y - self.view_y) * self.CARD_HEIGHT
+        pyxel.text(screen_x + 2, screen_y + 2, str(CARD_MONTH[card_id]), 7)
+    
+    def build_ui_layer(self, layer):
+        """スコア・コンボ・次の花札・操作説明を画像に描画"""
+        engine = self.engine
+        layer.cls(0)
+        
         # スコア
-        pyxel.text(5, 5, f"SCORE: {self.score}", 7)
+        layer.text(5, 5, f"SCORE: {engine.score}", 7)
         
         # コンボ
-        if self.combo > 0:
-            color = 14 if self.combo < 5 else 8
-            pyxel.text(5, 15, f"COMBO: {self.combo}", color)
-        
-        # ボーナスタイム
-        if self.bonus_time > 0:
-            color = 14 if (self.bonus_time // 10) % 2 == 0 else 8
-            pyxel.text(5, 25, "BONUS TIME", color)
-        
-        # 消去処理中の表示
-        if self.removal_state == "marking":
-            color = pyxel.frame_count % 16
-            pyxel.text(self.WIDTH // 2 - 25, self.HEIGHT // 2 - 50, "MATCH FOUND!", color)
+        if engine.combo > 0:
+            color = 14 if engine.combo < 5 else 8
+            layer.text(5, 15, f"COMBO: {engine.combo}", color)
         
         # 次の花札表示
-        pyxel.text(self.WIDTH - 40, 5, "NEXT:", 7)
-        if self.next_card:
-            bank, img_x, img_y = self.get_card_image_pos(self.next_card)
-            pyxel.blt(self.WIDTH - 40, 15, bank, img_x, img_y, 
+        layer.text(self.WIDTH - 40, 5, "NEXT:", 7)
+        next_card = engine.next_card
+        if next_card:
+            layer.blt(self.WIDTH - 40, 15, CARD_BANK[next_card], CARD_U[next_card], CARD_V[next_card],
                      self.CARD_WIDTH, self.CARD_HEIGHT, 0)
             
             # 次の花札の月を表示
-            month = self.hanafuda_data[self.next_card]['month']
-            card_type = self.hanafuda_data[self.next_card]['type']
-            pyxel.text(self.WIDTH - 40, 50, f"Month: {month}", 7)
-            #pyxel.text(self.WIDTH - 40, 60, f"Type: {card_type}", 7)
+            layer.text(self.WIDTH - 40, 50, f"Month: {CARD_MONTH[next_card]}", 7)
+            #layer.text(self.WIDTH - 40, 60, f"Type: {TYPE_NAMES[CARD_TYPE[next_card]]}", 7)
         
         # 操作説明
         controls = [
             "L/R: Move",
-            "DOWN: Drop",
+            "DOWN: Drop  UP: Hard drop",
             "A or SPACE: Restart"
         ]
+        if (self.VIEW_WIDTH, self.VIEW_HEIGHT) != (self.FIELD_WIDTH, self.FIELD_HEIGHT):
+            controls.insert(0, "IJKL: Scroll")
         
         for i, text in enumerate(controls):
-            pyxel.text(5, self.HEIGHT - 30 + i * 8, text, 6)
+            layer.text(5, self.HEIGHT - 30 + i * 8, text, 6)
+    
+    def draw_ui(self):
+        """UI描画（毎フレーム変化する表示）"""
+        engine = self.engine
+        
+        # ボーナスタイム
+        if engine.bonus_time > 0:
+            color = 14 if (engine.bonus_time // 10) % 2 == 0 else 8
+            pyxel.text(5, 25, "BONUS TIME", color)
+        
+        # 消去処理中の表示
+        if engine.removal_state == "marking":
+            color = self.clock.ticks % 16
+            pyxel.text(self.WIDTH // 2 - 25, self.HEIGHT // 2 - 50, "MATCH FOUND!", color)
         
         # 一時停止中の表示
         #if self.pause_time > 0:
-            #color = pyxel.frame_count % 16 #14 if (self.bonus_time // 10) % 2 == 0 else 8
+            #color = pyxel.frame_count % 16 #14 if (engine.bonus_time // 10) % 2 == 0 else 8
             #pyxel.text(self.WIDTH // 2 - 10, self.HEIGHT // 2, "NICE!", color)
     
+    def draw_watch(self):
+        """観戦画面描画（最初の状態が届くまでは待ち表示）"""
+        if self.watch_error is not None:
+            pyxel.text(self.WIDTH // 2 - len(self.watch_error) * 2, self.HEIGHT // 2, self.watch_error, 8)
+        elif self.engine is self.watch.state:
+            self.draw_game()
+            if self.engine.game_over:
+                pyxel.text(self.WIDTH // 2 - 18, self.FIELD_Y - 10, "GAME OVER", 8)
+        else:
+            text = "CONNECTION CLOSED" if self.watch.closed else "WAITING FOR STREAM"
+            pyxel.text(self.WIDTH // 2 - len(text) * 2, self.HEIGHT // 2, text, 6)
+    
     def draw_game_over(self):
         """ゲームオーバー画面描画"""
+        engine = self.engine
+        
         # 背景を暗く
         pyxel.cls(0)
         
         # ゲームオーバーメッセージ
         pyxel.text(self.WIDTH // 2 - 35, self.HEIGHT // 2 - 20, "GAME OVER", 8)
-        pyxel.text(self.WIDTH // 2 - 30, self.HEIGHT // 2 - 5, f"SCORE: {self.score}", 7)
-        pyxel.text(self.WIDTH // 2 - 30, self.HEIGHT // 2 + 5, f"COMBO: {self.combo}", 7)
+        pyxel.text(self.WIDTH // 2 - 30, self.HEIGHT // 2 - 5, f"SCORE: {engine.score}", 7)
+        pyxel.text(self.WIDTH // 2 - 30, self.HEIGHT // 2 + 5, f"COMBO: {engine.combo}", 7)
         
         # リスタート案内
-        color = 14 if (pyxel.frame_count // 30) % 2 == 0 else 6
+        color = 14 if (self.clock.ticks // 30) % 2 == 0 else 6
         pyxel.text(self.WIDTH // 2 - 50, self.HEIGHT // 2 + 20, "Press A or SPACE to Restart", color)
         
         # 最終成績
         achievements = []
-        if self.score >= 10000:
+        if engine.score >= 10000:
             achievements.append("Fantastic!")
-        elif self.score >= 5000:
+        elif engine.score >= 5000:
             achievements.append("Excellent!")
-        elif self.score >= 1000:
+        elif engine.score >= 1000:
             achievements.append("Good!")
         
-        if self.combo >= 10:
+        if engine.combo >= 10:
             achievements.append("Combo Master!")
         
         for i, achievement in enumerate(achievements):
@@ -822,4 +764,26 @@ class HanafudaTetris:
 
 # ゲーム実行
 if __name__ == "__main__":
-    HanafudaTetris()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="花札テトリス")
+    parser.add_argument("--board", type=board_size, default=(8, 6),
+                        help="盤面の大きさ WxH（既定: 8x6、大きい盤面はスクロールして表示）")
+    parser.add_argument("--fps", type=int, default=TICK_RATE,
+                        help="描画のフレームレート（既定: %d、ゲームの速さは変わらない）" % TICK_RATE)
+    parser.add_argument("--startup-report", action="store_true",
+                        help="起動の段階ごとの時間を標準エラーに表示する")
+    parser.add_argument("--input-report", action="store_true",
+                        help="ゲームオーバーごとに入力の遅延（押してからルールに渡すまで）を標準エラーに表示する")
+    parser.add_argument("--event-log", metavar="PATH",
+                        help="ゲームの出来事をこのファイルに記録する（event_log.py summary で集計）")
+    parser.add_argument("--watch", metavar="HOST:PORT",
+                        help="観戦の配信（spectate.py / versus.py）に接続して表示する")
+    parser.add_argument("--watch-request", default="WATCH",
+                        help="接続時に送る要求の行（対戦サーバーでは WATCH 対戦ID 側）")
+    args = parser.parse_args()
+    watch = None
+    if args.watch:
+        host, _, port = args.watch.rpartition(":")
+        watch = SpectatorClient(host or "127.0.0.1", int(port), args.watch_request.encode("ascii") + b"\n")
+    HanafudaTetris(field_width=args.board[0], field_height=args.board[1], fps=args.fps,
+                   startup_report=args.startup_report, watch=watch, input_report=args.input_report,
+                   event_log=args.event_log)
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""固定容量のパーティクルプール
+
+x, y, vx, vy, life を別々の配列で持ち、生きているパーティクルを常に先頭
+count 個に詰めておく（寿命が尽きたものは末尾と入れ替えて消す）。
+配列は起動時に確保したものを使い回すので、毎フレームの確保は発生しない。
+NumPy があれば use_numpy=True で配列演算による一括更新に切り替えられる。
+NumPy の読み込みは重い（起動時間の大半を占める）ので、use_numpy=True のときに初めて読み込む。
+"""
+
+np = None
+
+
+def _import_numpy():
+    """NumPy を読み込む（なければ None、Web版などでは入っていない）"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        np = numpy
+    return np
+
+GRAVITY = 0.1
+
+
+class ParticlePool:
+    """構造体の配列（SoA）形式のパーティクルプール"""
+
+    def __init__(self, capacity=512, max_life=30, use_numpy=False):
+        if use_numpy and _import_numpy() is None:
+            raise ImportError("use_numpy=True には NumPy が必要です")
+        self.capacity = capacity
+        self.max_life = max_life
+        self.use_numpy = use_numpy
+        if use_numpy:
+            self.x = np.zeros(capacity, dtype=np.float32)
+            self.y = np.zeros(capacity, dtype=np.float32)
+            self.vx = np.zeros(capacity, dtype=np.float32)
+            self.vy = np.zeros(capacity, dtype=np.float32)
+            self.life = np.zeros(capacity, dtype=np.int32)
+        else:
+            self.x = [0.0] * capacity
+            self.y = [0.0] * capacity
+            self.vx = [0.0] * capacity
+            self.vy = [0.0] * capacity
+            self.life = [0] * capacity
+        self.count = 0  # 生きているパーティクル数（先頭 count 個）
+
+    def clear(self):
+        """全パーティクルを消す"""
+        self.count = 0
+
+    def emit(self, x, y, vx, vy, life=None):
+        """パーティクルを1つ追加（満杯なら捨てる）"""
+        i = self.count
+        if i >= self.capacity:
+            return False
+        self.x[i] = x
+        self.y[i] = y
+        self.vx[i] = vx
+        self.vy[i] = vy
+        self.life[i] = self.max_life if life is None else life
+        self.count = i + 1
+        return True
+
+    def update(self):
+        """移動・重力・寿命を1フレーム進め、寿命が尽きたものを詰める"""
+        if self.count == 0:
+            return
+        if self.use_numpy:
+            self._update_numpy()
+        else:
+            self._update_python()
+
+    def _update_python(self):
+        x, y, vx, vy, life = self.x, self.y, self.vx, self.vy, self.life
+        n = self.count
+        i = 0
+        while i < n:
+            x[i] += vx[i]
+            y[i] += vy[i]
+            vy[i] += GRAVITY
+            life[i] -= 1
+            if life[i] > 0:
+                i += 1
+                continue
+            # 末尾の（まだ更新していない）パーティクルをここへ移して消す
+            n -= 1
+            if i != n:
+                x[i] = x[n]
+                y[i] = y[n]
+                vx[i] = vx[n]
+                vy[i] = vy[n]
+                life[i] = life[n]
+        self.count = n
+
+    def _update_numpy(self):
+        n = self.count
+        x, y, vx, vy, life = self.x[:n], self.y[:n], self.vx[:n], self.vy[:n], self.life[:n]
+        x += vx
+        y += vy
+        vy += GRAVITY
+        life -= 1
+
+        dead = np.flatnonzero(life <= 0)
+        if len(dead) == 0:
+            return
+        alive_count = n - len(dead)
+        # 前半の穴を後半の生きているパーティクルで埋める（入れ替え削除の一括版）
+        holes = dead[dead < alive_count]
+        if len(holes):
+            movers = np.flatnonzero(life[alive_count:] > 0) + alive_count
+            for arr in (self.x, self.y, self.vx, self.vy, self.life):
+                arr[holes] = arr[movers]
+        self.count = alive_count
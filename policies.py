@@ -0,0 +1,95 @@
+"""ヘッドレス対戦用の配置方針
+
+方針は新しい花札が出現するたびに「どの列に置くか」を選び、
+ColumnController がそれを毎フレームの入力（ACTION_*）に変換する。
+"""
+
+from cards import CARD_MONTH
+from engine import ACTION_NONE, ACTION_LEFT, ACTION_RIGHT, ACTION_DOWN, ACTION_HARD_DROP
+from search import SearchPolicy
+
+
+def landing_row(engine, x):
+    """列 x に落としたときに止まる行（列が埋まっていれば -1）"""
+    return engine.landing_row(x, -1)
+
+
+class RandomPolicy:
+    """空いている列から無作為に選ぶ"""
+
+    name = "random"
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choose_column(self, engine):
+        columns = [x for x in range(engine.FIELD_WIDTH) if engine.field[0][x] == 0]
+        if not columns:
+            return engine.falling_x
+        return self.rng.choice(columns)
+
+
+class GreedyPolicy:
+    """置いた位置の上下左右に同じ月の花札が一番多い列を選ぶ"""
+
+    name = "greedy"
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choose_column(self, engine):
+        field = engine.field
+        width, height = engine.FIELD_WIDTH, engine.FIELD_HEIGHT
+        month = CARD_MONTH[engine.falling_card]
+        best_score = -1
+        best = []
+        for x in range(width):
+            y = landing_row(engine, x)
+            if y < 0:
+                continue
+            score = 0
+            for nx, ny in ((x - 1, y), (x + 1, y), (x, y + 1)):
+                if 0 <= nx < width and ny < height and field[ny][nx] != 0 \
+                        and CARD_MONTH[field[ny][nx]] == month:
+                    score += 1
+            # 同点なら低い（埋まっている）列を避け、高さに余裕のある列を優先
+            score = score * 16 + y
+            if score > best_score:
+                best_score = score
+                best = [x]
+            elif score == best_score:
+                best.append(x)
+        if not best:
+            return engine.falling_x
+        return self.rng.choice(best)
+
+
+POLICIES = {
+    RandomPolicy.name: RandomPolicy,
+    GreedyPolicy.name: GreedyPolicy,
+    SearchPolicy.name: SearchPolicy,
+}
+
+
+class ColumnController:
+    """選んだ列へ花札を動かし、揃ったら高速落下（hard_drop なら即時落下）させる入力を作る"""
+
+    def __init__(self, policy, hard_drop=False):
+        self.policy = policy
+        self.hard_drop = hard_drop
+        self.target = None
+
+    def on_spawn(self, engine):
+        """新しい花札が出現したときに置く列を決める"""
+        self.target = self.policy.choose_column(engine)
+
+    def action(self, engine):
+        """このフレームの入力"""
+        if engine.falling_card is None or self.target is None:
+            return ACTION_NONE
+        x, y = engine.falling_x, engine.falling_y
+        if x < self.target and engine.can_move(x + 1, y):
+            return ACTION_RIGHT
+        if x > self.target and engine.can_move(x - 1, y):
+            return ACTION_LEFT
+        return ACTION_HARD_DROP if self.hard_drop else ACTION_DOWN
@@ -0,0 +1,319 @@
+"""フレームのフェーズ別プロファイラ
+
+update / draw の各フェーズ（消去処理・入力・落下・パーティクル・盤面の転送・UI など）
+の所要時間をフレームごとに測り、直近 history フレーム分をリングバッファに持つ。
+度数分布（2のべき乗マイクロ秒の区間）はリングバッファへの出し入れに合わせて
+差分で更新するので、表示のたびに集計し直す必要はない。
+pyxel.blt / text / pset などの呼び出し回数もフレームごとに数える。
+記録したフレームは Chrome のトレース形式（chrome://tracing, Perfetto）で書き出せる。
+起動（最初のフレームを描くまで）の段階ごとの時間は StartupTimer で測る。
+
+    profiler = FrameProfiler()
+    profiler.enable()
+    profiler.instrument(pyxel)
+    profiler.begin_frame()
+    with profiler.phase("update"):
+        ...
+    profiler.end_frame()
+    profiler.export_chrome_trace("frame_trace.json")
+"""
+
+import time
+from collections import deque
+
+HISTOGRAM_BUCKETS = 18  # [0, 2), [2, 4), ... [2^16, ∞) マイクロ秒
+COUNTED_CALLS = ("blt", "text", "pset", "rect", "rectb", "cls")
+
+
+def histogram_bucket(ns):
+    """所要時間（ナノ秒）の度数分布の区間番号"""
+    us = ns // 1000
+    if us < 1:
+        return 0
+    return min(us.bit_length(), HISTOGRAM_BUCKETS - 1)
+
+
+class PhaseStats:
+    """1フェーズ分の直近の所要時間（リングバッファ）と度数分布"""
+
+    def __init__(self, history):
+        self.samples = [0] * history  # ナノ秒
+        self.pos = 0
+        self.filled = 0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+        self.total = 0  # リングバッファ内の合計
+
+    def add(self, ns):
+        """1フレーム分の所要時間を加える（一番古いものは押し出される）"""
+        samples = self.samples
+        pos = self.pos
+        if self.filled == len(samples):
+            old = samples[pos]
+            self.histogram[histogram_bucket(old)] -= 1
+            self.total -= old
+        else:
+            self.filled += 1
+        samples[pos] = ns
+        self.histogram[histogram_bucket(ns)] += 1
+        self.total += ns
+        self.pos = (pos + 1) % len(samples)
+
+    def last(self):
+        return self.samples[self.pos - 1] if self.filled else 0
+
+    def mean(self):
+        return self.total / self.filled if self.filled else 0
+
+    def max(self):
+        return max(self.samples[:self.filled]) if self.filled else 0
+
+    def percentile(self, p):
+        """p パーセンタイル（ナノ秒）"""
+        if not self.filled:
+            return 0
+        values = sorted(self.samples[:self.filled])
+        return values[min(self.filled - 1, int(self.filled * p / 100))]
+
+
+class _NullPhase:
+    """無効時に返す何もしない計測区間"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    """with 文で囲んだ区間を1つのフェーズとして計測する"""
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class FrameProfiler:
+    """フレームのフェーズ別計測・描画呼び出し回数・トレースの記録"""
+
+    def __init__(self, history=300, trace_frames=600):
+        self.history = history
+        self.enabled = False
+        self.phases = {}                  # フェーズ名 -> PhaseStats（初出順）
+        self.calls = dict.fromkeys(COUNTED_CALLS, 0)  # 今のフレームの呼び出し回数
+        self.call_stats = {name: PhaseStats(history) for name in COUNTED_CALLS}
+        self.frame_stats = PhaseStats(history)
+        self.trace = deque(maxlen=trace_frames)  # フレームごとの (開始, 終了, 区間のリスト, 呼び出し回数)
+        self.frame_count = 0
+        self._origin = time.perf_counter_ns()
+        self._frame_start = None
+        self._frame_times = {}
+        self._frame_spans = []
+        self._instrumented = []  # (モジュール, 名前, 元の関数)
+        self._wrapped = []       # (オブジェクト, メソッド名)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        """計測をやめ、差し替えた関数・メソッドを元に戻す"""
+        self.enabled = False
+        self._frame_start = None
+        self.uninstrument()
+        self.unwrap_all()
+
+    def phase(self, name):
+        """with 文で使う計測区間（無効時は何もしない）"""
+        if not self.enabled or self._frame_start is None:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def record(self, name, start, end):
+        """計測した区間を今のフレームに加える"""
+        times = self._frame_times
+        times[name] = times.get(name, 0) + end - start
+        self._frame_spans.append((name, start, end))
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        if self._frame_start is not None:
+            # draw が呼ばれずに次の update が来た（処理落ち）ときは前のフレームを閉じる
+            self.end_frame()
+        self._frame_start = time.perf_counter_ns()
+        self._frame_times = {}
+        self._frame_spans = []
+        calls = self.calls
+        for name in calls:
+            calls[name] = 0
+
+    def end_frame(self):
+        """フレームを閉じて統計とトレースに加える"""
+        start = self._frame_start
+        if not self.enabled or start is None:
+            return
+        end = time.perf_counter_ns()
+        self._frame_start = None
+        self.frame_count += 1
+        self.frame_stats.add(end - start)
+        phases = self.phases
+        for name, ns in self._frame_times.items():
+            stats = phases.get(name)
+            if stats is None:
+                stats = phases[name] = PhaseStats(self.history)
+            stats.add(ns)
+        for name, count in self.calls.items():
+            self.call_stats[name].add(count)
+        self.trace.append((start, end, self._frame_spans, dict(self.calls)))
+
+    def instrument(self, module, names=COUNTED_CALLS):
+        """module の描画関数を呼び出し回数を数えるものに差し替える"""
+        for name in names:
+            original = getattr(module, name, None)
+            if original is None or any(m is module and n == name for m, n, _ in self._instrumented):
+                continue
+            setattr(module, name, self._counting(name, original))
+            self._instrumented.append((module, name, original))
+
+    def _counting(self, name, original):
+        calls = self.calls
+
+        def counted(*args, **kwargs):
+            calls[name] += 1
+            return original(*args, **kwargs)
+        return counted
+
+    def uninstrument(self):
+        for module, name, original in reversed(self._instrumented):
+            setattr(module, name, original)
+        self._instrumented = []
+
+    def wrap_methods(self, obj, names):
+        """obj のメソッドをフェーズとして計測する（names はメソッド名 -> フェーズ名）
+
+        インスタンス属性で上書きするので、クラスや他のインスタンスには影響しない。
+        """
+        for method_name, phase_name in names.items():
+            if method_name in vars(obj):
+                continue
+            method = getattr(obj, method_name)
+            setattr(obj, method_name, self._timed(phase_name, method))
+            self._wrapped.append((obj, method_name))
+
+    def _timed(self, phase_name, method):
+        def timed(*args, **kwargs):
+            with self.phase(phase_name):
+                return method(*args, **kwargs)
+        return timed
+
+    def unwrap_all(self):
+        for obj, method_name in self._wrapped:
+            vars(obj).pop(method_name, None)
+        self._wrapped = []
+
+    def summary(self):
+        """フェーズごとの平均・p95・最大（ミリ秒）と呼び出し回数の平均"""
+        def ms(stats):
+            return {
+                'frames': stats.filled,
+                'mean_ms': stats.mean() / 1e6,
+                'p95_ms': stats.percentile(95) / 1e6,
+                'max_ms': stats.max() / 1e6,
+                'histogram_us': stats.histogram[:],
+            }
+        return {
+            'frame': ms(self.frame_stats),
+            'phases': {name: ms(stats) for name, stats in self.phases.items()},
+            'calls_per_frame': {name: stats.mean() for name, stats in self.call_stats.items()},
+        }
+
+    def overlay_lines(self):
+        """画面表示用の文字列"""
+        frame = self.frame_stats
+        lines = ["FRAME %5.2f p95 %5.2f max %5.2f" % (
+            frame.mean() / 1e6, frame.percentile(95) / 1e6, frame.max() / 1e6)]
+        for name, stats in self.phases.items():
+            lines.append("%-9s %5.2f p95 %5.2f" % (
+                name[:9], stats.mean() / 1e6, stats.percentile(95) / 1e6))
+        lines.append("blt %d text %d pset %d" % (
+            self.call_stats["blt"].last(), self.call_stats["text"].last(),
+            self.call_stats["pset"].last()))
+        return lines
+
+    def draw_overlay(self, gfx, x=2, y=2):
+        """gfx（pyxel）に計測結果を重ねて表示する（end_frame の後に呼べば計測に含まれない）"""
+        lines = self.overlay_lines()
+        gfx.rect(x - 1, y - 1, 4 * 31 + 2, len(lines) * 7 + 1, 1)
+        for i, line in enumerate(lines):
+            gfx.text(x, y + i * 7, line, 10 if i == 0 else 7)
+
+    def chrome_trace(self):
+        """記録したフレームを Chrome のトレース形式（dict）にする"""
+        origin = self._origin
+        events = []
+        for start, end, spans, calls in self.trace:
+            events.append({'name': "frame", 'ph': "X", 'pid': 1, 'tid': 1,
+                           'ts': (start - origin) / 1000, 'dur': (end - start) / 1000})
+            for name, span_start, span_end in spans:
+                events.append({'name': name, 'ph': "X", 'pid': 1, 'tid': 1,
+                               'ts': (span_start - origin) / 1000,
+                               'dur': (span_end - span_start) / 1000})
+            events.append({'name': "calls", 'ph': "C", 'pid': 1, 'tid': 1,
+                           'ts': (start - origin) / 1000, 'args': calls})
+        return {'traceEvents': events, 'displayTimeUnit': "ms"}
+
+    def export_chrome_trace(self, path):
+        """Chrome のトレース形式の JSON ファイルに書き出す"""
+        import json  # 書き出すときだけ使うので、起動時には読み込まない
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+class StartupTimer:
+    """起動の段階ごとの所要時間（最初のフレームを描くまでと、その後に回した読み込み）"""
+
+    def __init__(self):
+        self.last = time.perf_counter()
+        self.phases = []             # (段階名, ミリ秒)
+        self.first_frame_ms = None   # 最初のフレームを描き終えるまでの合計（ミリ秒）
+        self._first_frame_phases = None
+
+    def add(self, name, ms):
+        """計測済みの段階を記録（モジュールの読み込みなど、タイマーを作る前の時間）"""
+        self.phases.append((name, ms))
+
+    def mark(self, name):
+        """前回の mark からの時間を name の段階として記録"""
+        now = time.perf_counter()
+        self.phases.append((name, (now - self.last) * 1000.0))
+        self.last = now
+
+    def first_frame(self):
+        """最初のフレームを描き終えた（ここまでが起動時間）"""
+        self.mark("first_frame")
+        self.first_frame_ms = sum(ms for _, ms in self.phases)
+        self._first_frame_phases = len(self.phases)
+
+    def to_dict(self):
+        return {'first_frame_ms': self.first_frame_ms, 'phases': [list(phase) for phase in self.phases]}
+
+    def report(self):
+        """表示用の文字列（最初のフレームより後の段階には * を付ける）"""
+        lines = ["time to first frame %.1f ms" % (self.first_frame_ms or 0.0)]
+        for i, (name, ms) in enumerate(self.phases):
+            after = self._first_frame_phases is not None and i >= self._first_frame_phases
+            lines.append("  %-16s %7.1f ms%s" % (name, ms, " *" if after else ""))
+        return "\n".join(lines)
@@ -0,0 +1,212 @@
+"""入力リプレイの記録と再生
+
+ゲームごとのシードと毎フレームの入力（ACTION_* のビット）を記録し、
+同じ入力をヘッドレスのエンジンに流し直して結果を再現する。
+入力は (アクション, 連続フレーム数) のランレングスで持ち、バイナリに保存する。
+
+ファイル形式（整数は特記なき限り LEB128 の可変長）:
+    b"HFRP" / バージョン(1バイト) / シード(8バイト, ビッグエンディアン) /
+    盤面の幅 / 盤面の高さ / 最終スコア / フレーム数 / ラン数 /
+    [アクション(1バイト) 連続フレーム数] × ラン数
+バージョン1のファイル（盤面の大きさがなく 8x6）も読み込める。
+
+    python replay.py verify last_replay.hfr
+"""
+
+import random
+import struct
+import sys
+import time
+from itertools import islice
+
+from engine import HanafudaEngine
+
+MAGIC = b"HFRP"
+VERSION = 2
+
+
+class ReplayError(ValueError):
+    """リプレイデータが壊れている・形式が違う"""
+
+
+def write_varint(out, value):
+    """out（bytearray）に LEB128 の可変長整数を追加"""
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def read_varint(data, pos):
+    """data の pos から可変長整数を読み、(値, 次の位置) を返す"""
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ReplayError("リプレイデータが途中で切れています")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def new_seed():
+    """セッション用のシードを作る"""
+    return random.SystemRandom().getrandbits(64)
+
+
+def new_engine(seed, width=8, height=6):
+    """シードから決定的に動くエンジンを作る"""
+    return HanafudaEngine(rng=random.Random(seed), width=width, height=height)
+
+
+class Replay:
+    """1ゲーム分のシードと入力のランレングス列"""
+
+    def __init__(self, seed, runs=None, final_score=None, frames=0, width=8, height=6):
+        self.seed = seed
+        self.width = width
+        self.height = height
+        self.runs = runs if runs is not None else []  # [[action, count], ...]
+        self.final_score = final_score
+        self.frames = frames
+
+    def actions(self):
+        """フレームごとの入力を順に返す"""
+        for action, count in self.runs:
+            for _ in range(count):
+                yield action
+
+    def to_bytes(self):
+        """バイナリ形式に変換"""
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        out += struct.pack(">Q", self.seed)
+        write_varint(out, self.width)
+        write_varint(out, self.height)
+        write_varint(out, self.final_score or 0)
+        write_varint(out, self.frames)
+        write_varint(out, len(self.runs))
+        for action, count in self.runs:
+            out.append(action)
+            write_varint(out, count)
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """バイナリ形式から読み込む"""
+        if data[:4] != MAGIC:
+            raise ReplayError("リプレイファイルではありません")
+        if len(data) < 13 or data[4] not in (1, VERSION):
+            raise ReplayError("対応していないリプレイのバージョンです")
+        seed, = struct.unpack_from(">Q", data, 5)
+        pos = 13
+        width, height = 8, 6
+        if data[4] >= 2:
+            width, pos = read_varint(data, pos)
+            height, pos = read_varint(data, pos)
+        final_score, pos = read_varint(data, pos)
+        frames, pos = read_varint(data, pos)
+        run_count, pos = read_varint(data, pos)
+        runs = []
+        for _ in range(run_count):
+            if pos >= len(data):
+                raise ReplayError("リプレイデータが途中で切れています")
+            action = data[pos]
+            count, pos = read_varint(data, pos + 1)
+            runs.append([action, count])
+        if sum(count for _, count in runs) != frames:
+            raise ReplayError("フレーム数が入力の長さと一致しません")
+        return cls(seed, runs, final_score, frames, width, height)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+class ReplayRecorder:
+    """エンジンに渡した入力をフレームごとに記録する"""
+
+    def __init__(self, seed, width=8, height=6):
+        self.replay = Replay(seed, width=width, height=height)
+
+    def record(self, action, count=1):
+        """count フレーム分の入力を記録"""
+        runs = self.replay.runs
+        if runs and runs[-1][0] == action:
+            runs[-1][1] += count
+        else:
+            runs.append([action, count])
+        self.replay.frames += count
+
+    def finish(self, final_score):
+        """最終スコアを記録してリプレイを返す"""
+        self.replay.final_score = final_score
+        return self.replay
+
+
+def play(replay, fast_forward=True):
+    """リプレイをヘッドレスのエンジンで最後まで再生し、エンジンを返す
+
+    fast_forward なら入力が無視されるフレーム（消去演出など）を飛ばす（結果は同じ）。
+    """
+    engine = new_engine(replay.seed, replay.width, replay.height)
+    step = engine.step
+    if not fast_forward:
+        for action, count in replay.runs:
+            for _ in range(count):
+                step(action)
+        return engine
+    last = replay.frames - 1
+    actions = replay.actions()
+    for action in actions:
+        skipped = engine.fast_forward(last)
+        if skipped:
+            # 飛ばしたフレームの入力は使われないので読み捨てる
+            action = next(islice(actions, skipped - 1, None))
+        step(action)
+    return engine
+
+
+def verify(replay):
+    """再生したスコアが記録と一致するか（一致, 再生後のエンジン）"""
+    engine = play(replay)
+    return engine.score == replay.final_score and engine.frame == replay.frames, engine
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] != "verify":
+        print("usage: python replay.py verify FILE [FILE ...]")
+        return 2
+    failed = 0
+    for path in argv[1:]:
+        try:
+            replay = Replay.load(path)
+        except (OSError, ReplayError) as e:
+            print("%s: ERROR %s" % (path, e))
+            failed += 1
+            continue
+        start = time.perf_counter()
+        ok, engine = verify(replay)
+        elapsed = time.perf_counter() - start
+        print("%s: %s score %d (recorded %d), %d frames in %.3f s (%.0f frames/s)" % (
+            path, "OK" if ok else "MISMATCH", engine.score, replay.final_score,
+            engine.frame, elapsed, engine.frame / max(elapsed, 1e-9)))
+        failed += not ok
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
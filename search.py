@@ -0,0 +1,294 @@
+"""先読み探索による自動プレイ
+
+落下中の花札と次の花札（その先は月ごとの代表札の平均）について、置ける列を
+すべて試し、連鎖を最後まで解決した得点と盤面の評価値で列を選ぶ。
+同じ盤面には Zobrist ハッシュの置換表で結果を共有する（サイズ固定、深さ優先で置き換え）。
+連鎖の解決結果はプロセス内で共有する CascadeCache から引く。
+探索は深さ1から順に深くし、時間制限を超えたら直前に探索し終えた深さの結果を使う。
+
+    python simulate.py --policy search --games 1000
+"""
+
+import random
+import time
+
+from cards import CARD_MONTH, CARD_YAKU
+from cascade_cache import shared_cache
+from engine import HanafudaEngine
+
+GAME_OVER_VALUE = -1000000.0
+
+# 先の分からない花札の代わりに試す札（各月4枚目のカス札、役には関わらない）
+UNKNOWN_CARDS = tuple((month - 1) * 4 + 4 for month in range(1, 13))
+
+
+class TranspositionTable:
+    """探索結果の置換表（2のべき乗個のスロット、衝突したら深い方・新しい方を残す）"""
+
+    def __init__(self, size_bits=16):
+        self.mask = (1 << size_bits) - 1
+        self.slots = [None] * (1 << size_bits)  # (キー, 残り深さ, 値, 世代)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def new_search(self):
+        """新しい手の探索を始める（古い世代のエントリは優先して置き換えられる）"""
+        self.generation += 1
+
+    def get(self, key, depth):
+        """残り深さ depth 以上で探索済みなら値を返す"""
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key and entry[1] >= depth:
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        return None
+
+    def put(self, key, depth, value):
+        i = key & self.mask
+        entry = self.slots[i]
+        if entry is not None and entry[0] != key:
+            if entry[3] == self.generation and entry[1] > depth:
+                return  # 同じ探索中の、より深い結果を残す
+            self.evictions += 1
+        self.slots[i] = (key, depth, value, self.generation)
+        self.stores += 1
+
+    def stats(self):
+        used = sum(1 for entry in self.slots if entry is not None)
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores,
+                'evictions': self.evictions, 'used': used, 'size': len(self.slots)}
+
+
+class _Timeout(Exception):
+    pass
+
+
+def reachable_columns(field, x, y):
+    """(x, y) から左右に動いて行ける列（途中の埋まったマスで止まる）"""
+    row = field[y]
+    width = len(row)
+    left = x
+    while left > 0 and row[left - 1] == 0:
+        left -= 1
+    right = x
+    while right < width - 1 and row[right + 1] == 0:
+        right += 1
+    return range(left, right + 1)
+
+
+def landing_row(field, x, y):
+    """(x, y) から落としたときに止まる行"""
+    height = len(field)
+    while y + 1 < height and field[y + 1][x] == 0:
+        y += 1
+    return y
+
+
+def forms_group(field, x, y, month, min_size=3):
+    """(x, y) に month の花札を置くと同じ月の連結が min_size 枚以上になるか"""
+    height = len(field)
+    width = len(field[0])
+    seen = {(x, y)}
+    stack = [(x, y)]
+    while stack:
+        cx, cy = stack.pop()
+        for nx, ny in ((cx - 1, cy), (cx + 1, cy), (cx, cy - 1), (cx, cy + 1)):
+            if 0 <= nx < width and 0 <= ny < height and (nx, ny) not in seen:
+                card_id = field[ny][nx]
+                if card_id and CARD_MONTH[card_id] == month:
+                    seen.add((nx, ny))
+                    if len(seen) >= min_size:
+                        return True
+                    stack.append((nx, ny))
+    return False
+
+
+def evaluate(field, spawn_x):
+    """盤面の評価値（同じ月の隣接が多く、低く、出現位置に余裕があるほど高い）"""
+    height = len(field)
+    width = len(field[0])
+    pairs = 0
+    filled = 0
+    for y in range(height):
+        row = field[y]
+        below = field[y + 1] if y + 1 < height else None
+        for x in range(width):
+            card_id = row[x]
+            if card_id == 0:
+                continue
+            filled += height - y  # 高い位置の花札ほど重く数える
+            month = CARD_MONTH[card_id]
+            if x + 1 < width and row[x + 1] and CARD_MONTH[row[x + 1]] == month:
+                pairs += 1
+            if below is not None and below[x] and CARD_MONTH[below[x]] == month:
+                pairs += 1
+    spawn_height = 0
+    while spawn_height < height and field[height - 1 - spawn_height][spawn_x]:
+        spawn_height += 1
+    danger = max(0, spawn_height - (height - 3))
+    return pairs * 40.0 - filled * 4.0 - danger * danger * 300.0
+
+
+class SearchPolicy:
+    """先読み探索で置く列を選ぶ（POLICIES に "search" として登録）"""
+
+    name = "search"
+
+    def __init__(self, rng, depth=2, time_limit=None, tt_bits=16, cascade_cache=None):
+        self.rng = rng
+        self.depth = depth            # 何枚先まで置いてみるか（3枚目以降は月ごとの平均）
+        self.time_limit = time_limit  # 1手あたりの秒数（None なら深さだけで止める：結果が決定的）
+        self.tt = TranspositionTable(tt_bits)
+        self.cascade_cache = cascade_cache  # None なら盤面の大きさに合わせて shared_cache() を使う
+        self.hasher = None
+        self.sim = None  # 置いて連鎖を解決する作業用のエンジン
+        self.sim_hash = None  # 作業用エンジンに今読み込まれている盤面のハッシュ
+        self.nodes = 0
+        self.completed_depth = 0
+        self.deadline = None
+
+    def choose_column(self, engine):
+        size = (engine.FIELD_WIDTH, engine.FIELD_HEIGHT)
+        if self.hasher is None or (self.hasher.width, self.hasher.height) != size:
+            cache = self.cascade_cache
+            if cache is None or (cache.hasher.width, cache.hasher.height) != size:
+                self.cascade_cache = shared_cache(*size)
+            self.hasher = self.cascade_cache.hasher
+            self.sim = HanafudaEngine(rng=random.Random(0), width=engine.FIELD_WIDTH,
+                                      height=engine.FIELD_HEIGHT)
+            self.sim_hash = None
+        field = self.settled_field(engine)
+        self.tt.new_search()
+        self.nodes = 0
+        deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        cards = (engine.falling_card, engine.next_card)
+        columns = reachable_columns(field, engine.falling_x, engine.falling_y)
+        field_hash = self.hasher.hash_field(field)
+
+        best = [engine.falling_x]
+        self.completed_depth = 0
+        for depth in range(1, self.depth + 1):
+            # 深さ1は時間切れでも最後まで探索する（置く列が決まらないと困るので）
+            self.deadline = deadline if depth > 1 else None
+            try:
+                best = self.search_root(field, field_hash, cards, columns, engine.falling_y, depth)
+            except _Timeout:
+                break
+            self.completed_depth = depth
+        return self.rng.choice(best)
+
+    def settled_field(self, engine):
+        """消去演出の途中なら、連鎖が終わったあとの盤面（探索はこの盤面から始める）"""
+        if engine.removal_state == "none":
+            return [row[:] for row in engine.field]
+        sim = self.sim
+        sim.load_field(engine.field)
+        self.sim_hash = None
+        if engine.removal_state != "dropping":
+            sim.remove_cards(engine.cards_to_remove)
+        sim.drop_cards()
+        sim.resolve_chain()
+        return sim.field
+
+    def search_root(self, field, field_hash, cards, columns, start_y, depth):
+        """深さ depth で各列を評価し、最善の列（同点ならすべて）を返す"""
+        best_value = None
+        best = []
+        for x in columns:
+            value = self.place_value(field, field_hash, cards, 0, x, start_y, depth)
+            if best_value is None or value > best_value:
+                best_value = value
+                best = [x]
+            elif value == best_value:
+                best.append(x)
+        return best
+
+    def node_value(self, field, field_hash, cards, ply, depth):
+        """ply 手目以降を残り depth 手探索した値（3枚目以降は札が分からないので平均）"""
+        if depth == 0:
+            # 評価値は盤面だけで決まるので、盤面のハッシュをそのままキーにする
+            value = self.tt.get(field_hash, 0)
+            if value is None:
+                value = evaluate(field, len(field[0]) // 2)
+                self.tt.put(field_hash, 0, value)
+            return value
+        known = cards[ply:]
+        card_keys = self.hasher.card_keys
+        key = field_hash
+        for i, card_id in enumerate(known[:len(card_keys)]):
+            key ^= card_keys[i][card_id]
+        if len(known) < len(card_keys):
+            # 分からない札の印（札ID 0 の値）を混ぜ、葉の評価値（盤面のハッシュだけのキー）と区別する
+            key ^= card_keys[len(known)][0]
+        value = self.tt.get(key, depth)
+        if value is not None:
+            return value
+
+        columns = reachable_columns(field, len(field[0]) // 2, 0)
+        if known:
+            value = max(self.place_value(field, field_hash, cards, ply, x, 0, depth) for x in columns)
+        else:
+            total = 0.0
+            for card_id in UNKNOWN_CARDS:
+                total += max(self.place_value(field, field_hash, cards + (card_id,), ply, x, 0, depth)
+                             for x in columns)
+            value = total / len(UNKNOWN_CARDS)
+        self.tt.put(key, depth, value)
+        return value
+
+    def place_value(self, field, field_hash, cards, ply, x, start_y, depth):
+        """ply 手目の札を列 x に置き、連鎖を解決した得点＋その先の値"""
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 7 == 0 and time.perf_counter() > self.deadline:
+            raise _Timeout()
+
+        card_id = cards[ply]
+        if field[start_y][x] != 0:
+            return GAME_OVER_VALUE
+        y = landing_row(field, x, start_y)
+        spawn_x = len(field[0]) // 2
+
+        # 役に関わらない札で3枚の連結もできなければ、盤面に置くだけで済む
+        # （探索する盤面は連鎖を解決し終えた安定した盤面なので、他に消えるものはない）
+        if not CARD_YAKU[card_id] and not forms_group(field, x, y, CARD_MONTH[card_id]):
+            if y == 0 and x == spawn_x:
+                return GAME_OVER_VALUE
+            child = [list(row) for row in field]
+            child[y][x] = card_id
+            child_hash = self.hasher.toggle(field_hash, x, y, card_id)
+            return self.node_value(child, child_hash, cards, ply + 1, depth - 1)
+
+        # 次の花札は連鎖の消去より前に出現するので、置いた直後の盤面で判定する
+        if y == 0 and x == spawn_x:
+            return GAME_OVER_VALUE
+        placed = [list(row) for row in field]
+        placed[y][x] = card_id
+        placed_hash = self.hasher.toggle(field_hash, x, y, card_id)
+
+        # 同じ盤面の連鎖は解決済みならキャッシュから（作業用エンジンに盤面を読み込まずに済む）
+        cache = self.cascade_cache
+        key = cache.key(placed, 1 << (y * len(field[0]) + x), False, placed_hash)
+        result = cache.get(key, placed)
+        if result is None:
+            # 作業用エンジンは兄弟の手の間で同じ盤面を使い回す（読み込み直しを減らす）
+            sim = self.sim
+            if self.sim_hash != field_hash:
+                sim.load_field(field)
+                self.sim_hash = field_hash
+            sim.score = 0
+            sim.bonus_time = 0
+            sim.events = []
+            sim.place_card(x, y, card_id)
+            result = sim.resolve_chain()
+            if not result.steps:
+                # 何も消えなければ置いた花札を取り除いて元の盤面に戻す
+                sim.remove_cards(((x, y),))
+                result.field_hash = placed_hash
+            cache.put(key, placed, result)
+            if result.steps:
+                self.sim_hash = result.field_hash  # 作業用エンジンには連鎖後の盤面が残っている
+        return result.score + self.node_value(result.field, result.field_hash, cards, ply + 1, depth - 1)
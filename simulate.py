@@ -0,0 +1,289 @@
+"""モンテカルロ調整用のヘッドレス対戦ランナー
+
+全コアでヘッドレスのゲームを大量に回し、最終スコア・連鎖の長さ・役の出現頻度・
+生存時間（drop_speed = max(10, 60 - score // 1000) の速度曲線の下で何フレーム
+生き残ったか）の分布を集計する。
+
+    python simulate.py --games 100000 --policy greedy --json result.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from clock import TICK_RATE
+from engine import HanafudaEngine, YAKU_NAMES, board_size, yaku_names
+from policies import POLICIES, ColumnController
+
+FPS = TICK_RATE  # 生存時間を秒に換算するときのフレームレート（ルールの1秒のティック数）
+
+
+class SimulationStats:
+    """対戦結果の集計（ワーカー間でマージできる度数分布）"""
+
+    def __init__(self, survival_unit="sec"):
+        self.survival_unit = survival_unit  # 生存時間の単位（sec: 秒, cards: 置いた枚数）
+        self.games = 0
+        self.truncated = 0          # max_frames に達して打ち切ったゲーム数
+        self.frames = 0             # 全ゲームの合計フレーム数
+        self.scores = Counter()     # 最終スコア -> ゲーム数
+        self.survival = Counter()   # 生存時間（survival_unit 単位） -> ゲーム数
+        self.max_combos = Counter() # ゲーム中の最長連鎖 -> ゲーム数
+        self.chains = Counter()     # 連鎖の長さ -> 回数
+        self.yaku = Counter()       # 役名 -> 成立回数
+        self.games_with_yaku = Counter()  # 役名 -> 1回以上成立したゲーム数
+
+    def add_game(self, score, frames, survival, max_combo, chains, yaku, truncated):
+        """1ゲーム分の結果を加える"""
+        self.games += 1
+        self.truncated += truncated
+        self.frames += frames
+        self.scores[score] += 1
+        self.survival[survival] += 1
+        self.max_combos[max_combo] += 1
+        self.chains.update(chains)
+        self.yaku.update(yaku)
+        self.games_with_yaku.update(yaku.keys())
+
+    def merge(self, other):
+        """別の集計を足し込む"""
+        self.games += other.games
+        self.truncated += other.truncated
+        self.frames += other.frames
+        self.scores.update(other.scores)
+        self.survival.update(other.survival)
+        self.max_combos.update(other.max_combos)
+        self.chains.update(other.chains)
+        self.yaku.update(other.yaku)
+        self.games_with_yaku.update(other.games_with_yaku)
+
+    def to_dict(self):
+        """JSON 出力用の辞書"""
+        return {
+            'games': self.games,
+            'truncated': self.truncated,
+            'frames': self.frames,
+            'score': summarize(self.scores),
+            'survival_unit': self.survival_unit,
+            'survival': summarize(self.survival),
+            'max_combo': summarize(self.max_combos),
+            'chain_length': summarize(self.chains),
+            'yaku_per_game': {name: self.yaku[name] / max(1, self.games) for name in YAKU_NAMES},
+            'yaku_game_rate': {name: self.games_with_yaku[name] / max(1, self.games) for name in YAKU_NAMES},
+            'distributions': {
+                'score': sorted(self.scores.items()),
+                'survival': sorted(self.survival.items()),
+                'max_combo': sorted(self.max_combos.items()),
+                'chain_length': sorted(self.chains.items()),
+            },
+        }
+
+
+def summarize(counter):
+    """度数分布から平均・パーセンタイルを求める"""
+    total = sum(counter.values())
+    if total == 0:
+        return {'count': 0}
+    items = sorted(counter.items())
+    result = {
+        'count': total,
+        'mean': sum(value * count for value, count in items) / total,
+        'min': items[0][0],
+        'max': items[-1][0],
+    }
+    targets = [(p, total * p / 100) for p in (5, 25, 50, 75, 95, 99)]
+    seen = 0
+    for value, count in items:
+        seen += count
+        while targets and seen >= targets[0][1]:
+            result['p%d' % targets[0][0]] = value
+            targets.pop(0)
+    return result
+
+
+def play_game(seed, policy_name, max_frames, policy_options=None, fast_forward=True, board=(8, 6),
+              hard_drop=False, verify_incremental=False):
+    """1ゲームを最後まで（または max_frames まで）進めて結果を返す
+
+    fast_forward なら消去演出・生成遅延などタイマーが進むだけのフレームを飛ばす（結果は同じ）。
+    hard_drop なら狙いの列に着いた花札を即時落下で置く（落ちるフレームがなくなるので結果は変わる）。
+    verify_incremental なら消去判定の差分探索を毎回全体走査と照合する（食い違えば AssertionError）。
+    """
+    rng = random.Random(seed)
+    engine = HanafudaEngine(rng=random.Random(rng.getrandbits(64)), verify_incremental=verify_incremental,
+                            width=board[0], height=board[1])
+    policy = POLICIES[policy_name](random.Random(rng.getrandbits(64)), **(policy_options or {}))
+    controller = ColumnController(policy, hard_drop)
+    controller.on_spawn(engine)
+
+    chains = Counter()
+    yaku = Counter()
+    max_combo = 0
+    chain = 0
+    while not engine.game_over and engine.frame < max_frames:
+        if fast_forward:
+            engine.fast_forward(max_frames - 1)
+        for event in engine.step(controller.action(engine)):
+            kind = event[0]
+            if kind == "spawn":
+                controller.on_spawn(engine)
+            elif kind == "yaku":
+                yaku.update(yaku_names(event[1]))
+
+        # 連鎖の長さ（combo が0に戻った時点で確定）
+        combo = engine.combo
+        if combo > chain:
+            chain = combo
+        elif combo == 0 and chain:
+            chains[chain] += 1
+            max_combo = max(max_combo, chain)
+            chain = 0
+    if chain:
+        chains[chain] += 1
+        max_combo = max(max_combo, chain)
+
+    return (engine.score, engine.frame, engine.frame // FPS, max_combo, chains, yaku,
+            not engine.game_over)
+
+
+def run_chunk(args):
+    """ワーカー：シード範囲のゲームをまとめて実行し集計を返す"""
+    policy_name, seeds, max_frames, policy_options, board, hard_drop, verify_incremental = args
+    stats = SimulationStats()
+    for seed in seeds:
+        stats.add_game(*play_game(seed, policy_name, max_frames, policy_options, board=board,
+                                  hard_drop=hard_drop, verify_incremental=verify_incremental))
+    return stats
+
+
+def run_batch_chunk(args):
+    """ワーカー：BatchEngine（配置単位・NumPy）で無作為に置くゲームをまとめて実行"""
+    from batch_engine import BatchEngine
+    import numpy as np
+
+    seed, count, max_placements, board = args
+    engine = BatchEngine(count, seed=seed, width=board[0], height=board[1])
+    rng = np.random.default_rng(seed + 1)
+    while not engine.game_over.all() and engine.placed.max() < max_placements:
+        engine.step(rng.integers(0, engine.FIELD_WIDTH, size=count))
+
+    # 配置単位のシミュレーションなので生存時間は「置いた枚数」で記録する
+    stats = SimulationStats(survival_unit="cards")
+    for i in range(count):
+        yaku = Counter({name: int(n) for name, n in zip(YAKU_NAMES, engine.yaku_counts[i]) if n})
+        stats.add_game(int(engine.score[i]), 0, int(engine.placed[i]), int(engine.max_combo[i]),
+                       Counter(), yaku, not engine.game_over[i])
+    return stats
+
+
+def run(games, policy_name, seed=0, workers=None, chunk_size=200, max_frames=FPS * 60 * 30,
+        engine="frame", progress=None, policy_options=None, board=(8, 6), hard_drop=False,
+        verify_incremental=False):
+    """ゲームを全コアに分配して実行し、マージした集計を返す"""
+    workers = workers or os.cpu_count() or 1
+    if engine == "batch":
+        if policy_name != "random":
+            raise ValueError("batch エンジンは random 方針のみ対応しています")
+        if hard_drop or verify_incremental:
+            raise ValueError("batch エンジンは hard_drop・verify_incremental に対応していません")
+        # 打ち切りは1枚あたり約1秒として枚数に換算する
+        tasks = [(seed * 1000003 + start, min(chunk_size, games - start), max_frames // FPS, board)
+                 for start in range(0, games, chunk_size)]
+        worker = run_batch_chunk
+    else:
+        tasks = [(policy_name, range(seed * 1000003 + start, seed * 1000003 + min(start + chunk_size, games)),
+                  max_frames, policy_options, board, hard_drop, verify_incremental)
+                 for start in range(0, games, chunk_size)]
+        worker = run_chunk
+
+    total = SimulationStats(survival_unit="cards" if engine == "batch" else "sec")
+    if workers == 1:
+        results = map(worker, tasks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(worker, tasks)
+    try:
+        for stats in results:
+            total.merge(stats)
+            if progress:
+                progress(total)
+    finally:
+        if workers != 1:
+            pool.close()
+            pool.join()
+    return total
+
+
+def print_report(stats, elapsed):
+    """集計結果を表示"""
+    data = stats.to_dict()
+    print("games: %d (truncated %d)  %.1f s  %.0f games/s  %.0f frames/s" % (
+        stats.games, stats.truncated, elapsed, stats.games / max(elapsed, 1e-9),
+        stats.frames / max(elapsed, 1e-9)))
+    for key, label in (('score', 'score'), ('survival', 'survival[%s]' % stats.survival_unit),
+                       ('max_combo', 'max combo'), ('chain_length', 'chain')):
+        s = data[key]
+        if not s['count']:
+            continue
+        print("%-12s mean %9.1f  p5 %7s  p25 %7s  p50 %7s  p75 %7s  p95 %7s  max %7s" % (
+            label, s['mean'], s['p5'], s['p25'], s['p50'], s['p75'], s['p95'], s['max']))
+    print("yaku          per game   games with")
+    for name in YAKU_NAMES:
+        print("  %-12s %8.4f   %8.2f%%" % (name, data['yaku_per_game'][name],
+                                           data['yaku_game_rate'][name] * 100))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="花札テトリスのモンテカルロ調整ランナー")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（既定: CPU数）")
+    parser.add_argument("--chunk", type=int, default=200, help="1タスクあたりのゲーム数")
+    parser.add_argument("--max-frames", type=int, default=FPS * 60 * 30,
+                        help="1ゲームの打ち切りフレーム数")
+    parser.add_argument("--engine", choices=("frame", "batch"), default="frame",
+                        help="frame: HanafudaEngine（フレーム単位） / batch: BatchEngine（配置単位）")
+    parser.add_argument("--depth", type=int, default=2, help="search 方針の先読み枚数")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="search 方針の1手あたりの秒数（既定: 制限なし＝結果が決定的）")
+    parser.add_argument("--board", type=board_size, default=(8, 6), metavar="WxH",
+                        help="盤面の大きさ（既定: 8x6）")
+    parser.add_argument("--hard-drop", action="store_true",
+                        help="狙いの列に着いた花札を即時落下で置く（frame エンジンのみ）")
+    parser.add_argument("--verify-incremental", action="store_true",
+                        help="消去判定の差分探索を毎回全体走査と照合する（検証用、frame エンジンのみ）")
+    parser.add_argument("--json", help="集計結果を書き出す JSON ファイル")
+    args = parser.parse_args(argv)
+    policy_options = None
+    if args.policy == "search":
+        policy_options = {'depth': args.depth, 'time_limit': args.time_limit}
+
+    start = time.perf_counter()
+
+    def progress(stats):
+        sys.stderr.write("\r%d/%d games" % (stats.games, args.games))
+        sys.stderr.flush()
+
+    stats = run(args.games, args.policy, seed=args.seed, workers=args.workers,
+                chunk_size=args.chunk, max_frames=args.max_frames, engine=args.engine,
+                progress=progress, policy_options=policy_options, board=args.board,
+                hard_drop=args.hard_drop, verify_incremental=args.verify_incremental)
+    sys.stderr.write("\n")
+    elapsed = time.perf_counter() - start
+    print_report(stats, elapsed)
+    if args.json:
+        data = stats.to_dict()
+        data['config'] = vars(args)
+        data['elapsed_sec'] = elapsed
+        with open(args.json, "w") as f:
+            json.dump(data, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+"""観戦用の差分ストリーム
+
+エンジンの状態をティックごとに1回だけ符号化し、前のティックから変わったところ
+（盤面のマス・落下中の花札・次の花札・得点・連鎖数・消去演出の状態・ボーナスタイム）
+だけをバイナリの差分として配る。一定ティックごとと、新しく来た購読者には全体
+（キーフレーム）を送る。全購読者に同じバイト列を書くので、購読者が増えても符号化は1回で済む。
+
+メッセージ（整数は LEB128 の可変長、各メッセージの前にバイト数）:
+    フラグ(1バイト) / ティック差（キーフレームはティックそのもの） / フラグの立った部分を順に
+    FIELD    差分: 数 / [マス番号 札ID(1バイト)] × 数
+             キーフレーム: 幅 / 高さ / 全マスの札ID(1バイトずつ)
+    FALLING  札ID(1バイト、0 はなし) / x / y
+    NEXT     札ID(1バイト)
+    SCORE    得点
+    COMBO    連鎖数
+    REMOVAL  状態(1バイト) / 点滅中なら 点滅のフレーム数 / 数 / [マス番号] × 数
+    STATUS   ボーナスタイムの残り / ゲームオーバー(1バイト)
+ボーナスタイムは毎ティック1ずつ減るので、受け側の予測とずれたときだけ送る。
+
+    python spectate.py replay last_replay.hfr --port 7651   # リプレイを実時間で配信
+    python spectate.py watch 127.0.0.1:7651                 # 得点などを文字で表示
+    python main.py --watch 127.0.0.1:7651                   # 配信を画面に表示
+"""
+
+import argparse
+import asyncio
+import select
+import socket
+import sys
+import time
+from itertools import chain
+
+from clock import FixedStepClock
+from replay import Replay, ReplayError, new_engine, read_varint, write_varint
+
+DEFAULT_PORT = 7651
+KEYFRAME_TICKS = 600          # この間隔でキーフレームを送る（途中で壊れても10秒で戻る）
+MAX_SUBSCRIBER_BACKLOG = 1 << 16  # 送信待ちがこれを超えた購読者には追いつくまで送らない
+
+FLAG_FIELD = 1
+FLAG_FALLING = 2
+FLAG_NEXT = 4
+FLAG_SCORE = 8
+FLAG_COMBO = 16
+FLAG_REMOVAL = 32
+FLAG_STATUS = 64
+FLAG_KEYFRAME = 128
+
+REMOVAL_STATES = ("none", "marking", "removing", "dropping")
+REMOVAL_CODES = {state: code for code, state in enumerate(REMOVAL_STATES)}
+
+
+class SpectatorState:
+    """配信している状態（受け側では描画でエンジンの代わりに使えるよう同じ属性名にしてある）"""
+
+    def __init__(self, width=8, height=6):
+        self.FIELD_WIDTH = width
+        self.FIELD_HEIGHT = height
+        self.cells = bytearray(width * height)  # 行優先の札ID
+        self.field = [[0] * width for _ in range(height)]
+        self.field_version = 0
+        self.frame = 0
+        self.falling_card = None
+        self.falling_x = 0
+        self.falling_y = 0
+        self.next_card = 0
+        self.score = 0
+        self.combo = 0
+        self.removal_state = "none"
+        self.cards_to_remove = frozenset()
+        self.mark_frame = 0  # 点滅を始めたティック
+        self.bonus_time = 0
+        self.game_over = False
+
+    @property
+    def removal_flash_frame(self):
+        return self.frame - self.mark_frame
+
+    def set_cell(self, i, card_id):
+        self.cells[i] = card_id
+        self.field[i // self.FIELD_WIDTH][i % self.FIELD_WIDTH] = card_id
+
+    def set_marked(self, indices):
+        w = self.FIELD_WIDTH
+        self.cards_to_remove = frozenset((i % w, i // w) for i in indices)
+
+
+class StateEncoder:
+    """エンジンの状態を差分メッセージに符号化する（状態は受け側と同じものを持つ）"""
+
+    def __init__(self, keyframe_ticks=KEYFRAME_TICKS):
+        self.keyframe_ticks = keyframe_ticks
+        self.state = None           # 最後に符号化した状態（SpectatorState）
+        self.field_version = None   # そのときのエンジンの field_version
+        self.marked = None          # そのときのエンジンの cards_to_remove
+        self.last_keyframe = 0
+
+    def reset(self):
+        """次の encode をキーフレームにする"""
+        self.state = None
+
+    def capture(self, engine):
+        """エンジンの状態をそのまま写す"""
+        state = SpectatorState(engine.FIELD_WIDTH, engine.FIELD_HEIGHT)
+        for i, card_id in enumerate(chain.from_iterable(engine.field)):
+            if card_id:
+                state.set_cell(i, card_id)
+        state.frame = engine.frame
+        state.falling_card = engine.falling_card
+        state.falling_x = engine.falling_x
+        state.falling_y = engine.falling_y
+        state.next_card = engine.next_card
+        state.score = engine.score
+        state.combo = engine.combo
+        state.removal_state = engine.removal_state
+        if engine.removal_state == "marking":
+            state.cards_to_remove = frozenset(engine.cards_to_remove)
+            state.mark_frame = engine.frame - engine.removal_flash_frame
+        state.bonus_time = engine.bonus_time
+        state.game_over = engine.game_over
+        self.state = state
+        self.field_version = engine.field_version
+        self.marked = engine.cards_to_remove
+        self.last_keyframe = engine.frame
+
+    def encode(self, engine):
+        """前回の encode からの差分（間隔が空いたとき・最初はキーフレーム）"""
+        state = self.state
+        if (state is None or engine.frame < state.frame
+                or engine.frame - self.last_keyframe >= self.keyframe_ticks
+                or (state.FIELD_WIDTH, state.FIELD_HEIGHT) != (engine.FIELD_WIDTH, engine.FIELD_HEIGHT)):
+            self.capture(engine)
+            return self.keyframe()
+
+        out = bytearray(1)
+        flags = 0
+        elapsed = engine.frame - state.frame
+        write_varint(out, elapsed)
+        state.frame = engine.frame
+
+        # 盤面は field_version が変わったときだけ比べる
+        if engine.field_version != self.field_version:
+            self.field_version = engine.field_version
+            cells = bytes(chain.from_iterable(engine.field))
+            changed = [i for i, (old, new) in enumerate(zip(state.cells, cells)) if old != new]
+            if changed:
+                flags |= FLAG_FIELD
+                write_varint(out, len(changed))
+                for i in changed:
+                    write_varint(out, i)
+                    out.append(cells[i])
+                    state.set_cell(i, cells[i])
+                state.field_version += 1
+
+        if (engine.falling_card != state.falling_card or engine.falling_x != state.falling_x
+                or engine.falling_y != state.falling_y):
+            flags |= FLAG_FALLING
+            state.falling_card = engine.falling_card
+            state.falling_x = engine.falling_x
+            state.falling_y = engine.falling_y
+            self._write_falling(out)
+        if engine.next_card != state.next_card:
+            flags |= FLAG_NEXT
+            state.next_card = engine.next_card
+            out.append(engine.next_card)
+        if engine.score != state.score:
+            flags |= FLAG_SCORE
+            state.score = engine.score
+            write_varint(out, engine.score)
+        if engine.combo != state.combo:
+            flags |= FLAG_COMBO
+            state.combo = engine.combo
+            write_varint(out, engine.combo)
+
+        if engine.removal_state != state.removal_state or (
+                engine.removal_state == "marking" and engine.cards_to_remove is not self.marked):
+            flags |= FLAG_REMOVAL
+            state.removal_state = engine.removal_state
+            if engine.removal_state == "marking":
+                state.cards_to_remove = frozenset(engine.cards_to_remove)
+                state.mark_frame = engine.frame - engine.removal_flash_frame
+            else:
+                state.cards_to_remove = frozenset()
+            self.marked = engine.cards_to_remove
+            self._write_removal(out)
+
+        predicted = max(0, state.bonus_time - elapsed)
+        state.bonus_time = predicted
+        if engine.bonus_time != predicted or engine.game_over != state.game_over:
+            flags |= FLAG_STATUS
+            state.bonus_time = engine.bonus_time
+            state.game_over = engine.game_over
+            self._write_status(out)
+
+        out[0] = flags
+        return bytes(out)
+
+    def keyframe(self):
+        """今の状態の全体"""
+        state = self.state
+        out = bytearray((FLAG_KEYFRAME | FLAG_FIELD | FLAG_FALLING | FLAG_NEXT | FLAG_SCORE
+                         | FLAG_COMBO | FLAG_REMOVAL | FLAG_STATUS,))
+        write_varint(out, state.frame)
+        write_varint(out, state.FIELD_WIDTH)
+        write_varint(out, state.FIELD_HEIGHT)
+        out += state.cells
+        self._write_falling(out)
+        out.append(state.next_card)
+        write_varint(out, state.score)
+        write_varint(out, state.combo)
+        self._write_removal(out)
+        self._write_status(out)
+        return bytes(out)
+
+    def _write_falling(self, out):
+        state = self.state
+        out.append(state.falling_card or 0)
+        write_varint(out, state.falling_x)
+        write_varint(out, state.falling_y)
+
+    def _write_removal(self, out):
+        state = self.state
+        out.append(REMOVAL_CODES[state.removal_state])
+        if state.removal_state == "marking":
+            w = state.FIELD_WIDTH
+            write_varint(out, state.removal_flash_frame)
+            write_varint(out, len(state.cards_to_remove))
+            for x, y in sorted(state.cards_to_remove):
+                write_varint(out, y * w + x)
+
+    def _write_status(self, out):
+        state = self.state
+        write_varint(out, state.bonus_time)
+        out.append(1 if state.game_over else 0)
+
+
+class StateDecoder:
+    """差分メッセージを SpectatorState に反映する"""
+
+    def __init__(self):
+        self.state = None  # 最初のキーフレームが届くまでは None
+
+    def apply(self, message):
+        """メッセージを1つ反映（キーフレーム待ちで読み飛ばしたら False）"""
+        flags = message[0]
+        state = self.state
+        if flags & FLAG_KEYFRAME:
+            frame, pos = read_varint(message, 1)
+            width, pos = read_varint(message, pos)
+            height, pos = read_varint(message, pos)
+            version = state.field_version + 1 if state is not None else 0
+            state = SpectatorState(width, height)
+            state.field_version = version
+            for i in range(width * height):
+                if message[pos + i]:
+                    state.set_cell(i, message[pos + i])
+            pos += width * height
+            self.state = state
+        elif state is None:
+            return False
+        else:
+            elapsed, pos = read_varint(message, 1)
+            frame = state.frame + elapsed
+            state.bonus_time = max(0, state.bonus_time - elapsed)
+            if flags & FLAG_FIELD:
+                count, pos = read_varint(message, pos)
+                for _ in range(count):
+                    i, pos = read_varint(message, pos)
+                    state.set_cell(i, message[pos])
+                    pos += 1
+                state.field_version += 1
+        state.frame = frame
+
+        if flags & FLAG_FALLING:
+            state.falling_card = message[pos] or None
+            state.falling_x, pos = read_varint(message, pos + 1)
+            state.falling_y, pos = read_varint(message, pos)
+        if flags & FLAG_NEXT:
+            state.next_card = message[pos]
+            pos += 1
+        if flags & FLAG_SCORE:
+            state.score, pos = read_varint(message, pos)
+        if flags & FLAG_COMBO:
+            state.combo, pos = read_varint(message, pos)
+        if flags & FLAG_REMOVAL:
+            state.removal_state = REMOVAL_STATES[message[pos]]
+            pos += 1
+            if state.removal_state == "marking":
+                flash, pos = read_varint(message, pos)
+                count, pos = read_varint(message, pos)
+                indices = []
+                for _ in range(count):
+                    i, pos = read_varint(message, pos)
+                    indices.append(i)
+                state.mark_frame = frame - flash
+                state.set_marked(indices)
+            else:
+                state.cards_to_remove = frozenset()
+        if flags & FLAG_STATUS:
+            state.bonus_time, pos = read_varint(message, pos)
+            state.game_over = bool(message[pos])
+        return True
+
+
+def frame_message(message):
+    """長さを前に付けたメッセージ"""
+    out = bytearray()
+    write_varint(out, len(message))
+    out += message
+    return bytes(out)
+
+
+class FrameReader:
+    """受け取ったバイト列からメッセージを切り出す（途中で切れた分は次まで持ち越す）"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """data を足し、揃ったメッセージのリストを返す"""
+        buffer = self.buffer
+        buffer += data
+        messages = []
+        pos = 0
+        while pos < len(buffer):
+            try:
+                length, start = read_varint(buffer, pos)
+            except ReplayError:  # 長さの途中で切れている
+                break
+            if start + length > len(buffer):
+                break
+            messages.append(bytes(buffer[start:start + length]))
+            pos = start + length
+        del buffer[:pos]
+        return messages
+
+
+class SpectatorHub:
+    """1つのゲームの配信（符号化はティックごとに1回、全購読者に同じバイト列を書く）
+
+    購読者は write(bytes) を持つもの（asyncio の StreamWriter など）。
+    """
+
+    def __init__(self, keyframe_ticks=KEYFRAME_TICKS):
+        self.encoder = StateEncoder(keyframe_ticks)
+        self.subscribers = {}  # 購読者 -> キーフレームを待っているか
+        self.messages = 0
+        self.bytes_encoded = 0
+
+    def subscribe(self, sink):
+        self.subscribers[sink] = True
+
+    def unsubscribe(self, sink):
+        self.subscribers.pop(sink, None)
+
+    def publish(self, engine):
+        """エンジンの今の状態を全購読者に送る（購読者がいなければ何もしない）"""
+        subscribers = self.subscribers
+        if not subscribers:
+            self.encoder.reset()
+            return
+        message = self.encoder.encode(engine)
+        data = frame_message(message)
+        self.messages += 1
+        self.bytes_encoded += len(data)
+        keyframe = data if message[0] & FLAG_KEYFRAME else None
+        for sink, waiting in list(subscribers.items()):
+            if _is_closing(sink):
+                del subscribers[sink]
+                continue
+            if _backlog(sink) > MAX_SUBSCRIBER_BACKLOG:
+                # 受け取りが遅れている購読者には送らず、追いついたらキーフレームから送り直す
+                subscribers[sink] = True
+                continue
+            if waiting:
+                if keyframe is None:
+                    keyframe = frame_message(self.encoder.keyframe())
+                sink.write(keyframe)
+                subscribers[sink] = False
+            else:
+                sink.write(data)
+
+    async def handle_client(self, reader, writer):
+        """接続してきた購読者に配信する（最初の1行は要求として読み捨てる）"""
+        try:
+            await reader.readline()
+            self.subscribe(writer)
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.unsubscribe(writer)
+            writer.close()
+
+
+def _is_closing(sink):
+    is_closing = getattr(sink, "is_closing", None)
+    return is_closing is not None and is_closing()
+
+
+def _backlog(sink):
+    transport = getattr(sink, "transport", None)
+    return transport.get_write_buffer_size() if transport is not None else 0
+
+
+class SpectatorClient:
+    """配信を受け取って状態を再現する（ブロックしない読み込み、ゲームループから poll する）"""
+
+    def __init__(self, host, port, request=b"WATCH\n"):
+        self.sock = socket.create_connection((host, port))
+        self.sock.sendall(request)
+        self.sock.setblocking(False)
+        self.reader = FrameReader()
+        self.decoder = StateDecoder()
+        self.closed = False
+
+    @property
+    def state(self):
+        return self.decoder.state
+
+    def poll(self, timeout=0.0):
+        """届いている分を反映し、反映したメッセージの数を返す（timeout 秒まで届くのを待つ）"""
+        applied = 0
+        if timeout and not self.closed:
+            select.select((self.sock,), (), (), timeout)
+        while not self.closed:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                break
+            except OSError:
+                data = b""
+            if not data:
+                self.closed = True
+                break
+            for message in self.reader.feed(data):
+                applied += self.decoder.apply(message)
+        return applied
+
+    def close(self):
+        self.sock.close()
+        self.closed = True
+
+
+async def serve_replay(replay, host="127.0.0.1", port=DEFAULT_PORT, speed=1.0):
+    """リプレイを実時間（speed 倍）で再生しながら配信する（終わったら最後の状態を配り続ける）"""
+    hub = SpectatorHub()
+    server = await asyncio.start_server(hub.handle_client, host, port)
+    engine = new_engine(replay.seed, replay.width, replay.height)
+    actions = replay.actions()
+    # 時計の時刻を speed 倍にすれば、ティックも speed 倍の速さで進む
+    clock = FixedStepClock(time_source=lambda: time.perf_counter() * speed)
+    async with server:
+        while True:
+            for _ in range(clock.advance()):
+                action = next(actions, None)
+                if action is not None:
+                    engine.step(action)
+                hub.publish(engine)
+            await asyncio.sleep((1.0 - clock.alpha) * clock.step / speed)
+
+
+def _address(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="花札テトリスの観戦ストリーム")
+    sub = parser.add_subparsers(dest="command", required=True)
+    replay = sub.add_parser("replay", help="リプレイを配信する")
+    replay.add_argument("file")
+    replay.add_argument("--host", default="127.0.0.1")
+    replay.add_argument("--port", type=int, default=DEFAULT_PORT)
+    replay.add_argument("--speed", type=float, default=1.0)
+    watch = sub.add_parser("watch", help="配信を受け取って得点などを表示する")
+    watch.add_argument("address", help="HOST:PORT")
+    watch.add_argument("--request", default="WATCH", help="接続時に送る要求の行（対戦サーバーでは WATCH 対戦ID 側）")
+    args = parser.parse_args(argv)
+
+    if args.command == "replay":
+        try:
+            asyncio.run(serve_replay(Replay.load(args.file), args.host, args.port, args.speed))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    client = SpectatorClient(*_address(args.address), request=args.request.encode("ascii") + b"\n")
+    last = None
+    while not client.closed:
+        client.poll(1.0)
+        state = client.state
+        if state is None:
+            continue
+        summary = (state.score, state.combo, state.removal_state, state.game_over)
+        if summary != last:
+            last = summary
+            print("frame %d score %d combo %d %s%s" % (state.frame, state.score, state.combo,
+                                                       state.removal_state,
+                                                       " GAME OVER" if state.game_over else ""),
+                  flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""強化学習用のベクトル化環境（Gym 風の reset / step）
+
+num_envs 面の HanafudaEngine をまとめて進める。観測・報酬・終了フラグは最初に確保した
+NumPy 配列にその場で書き込み、step のたびに作り直さない（学習側は同じ配列を見続けてよい、
+次の step で上書きされるので残したいときはコピーする）。盤面は field_version が
+変わったゲームだけ書き直し、月・種類の面は札IDの面から表引きでまとめて作る。
+
+行動の単位は2種類：
+    mode="column"  置く列（0..幅-1）。花札を置き、連鎖を解決して次の花札を動かせるように
+                   なるまで進める（タイマーが進むだけのフレームは fast_forward で飛ばす、
+                   hard_drop=True なら列に着いた花札を即時落下で置き、落ちるフレームも進めない）
+    mode="tick"    ACTION_* のビット（0..7、リスタートは無視）で1ティック進める
+
+終わった（ゲームオーバー・max_frames で打ち切り）ゲームはその場で開始状態に戻し、
+最終スコアを info['final_score'] に残す（Gym のベクトル環境と同じ自動リセット）。
+workers を指定すると環境をサブプロセスに分け、各プロセスが共有メモリの配列に直接書き込む。
+
+    python vec_env.py --envs 64 --steps 500 --workers 4   # 1秒あたりの step 数を測る
+"""
+
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+
+import numpy as np
+
+from cards import CARD_MONTH, CARD_TYPE
+from engine import ACTION_NONE, ACTION_LEFT, ACTION_RIGHT, ACTION_DOWN, ACTION_HARD_DROP, HanafudaEngine, board_size
+
+TICK_ACTIONS = ACTION_LEFT | ACTION_RIGHT | ACTION_DOWN  # tick モードで受け付ける入力のビット
+
+_MONTH_TABLE = np.array(CARD_MONTH, dtype=np.int8)
+_TYPE_TABLE = np.array(CARD_TYPE, dtype=np.int8)
+REMOVAL_CODES = {'none': 0, 'marking': 1, 'removing': 2, 'dropping': 3}
+
+
+def buffer_specs(num_envs, width, height):
+    """共有する配列の (名前, dtype, 形)（観測・行動・報酬・終了フラグ・info）"""
+    n = num_envs
+    return (
+        # 観測
+        ("cards", np.int8, (n, height, width)),   # 札ID（0は空）
+        ("months", np.int8, (n, height, width)),  # 月（0は空）
+        ("types", np.int8, (n, height, width)),   # 種類（cards.TYPE_*）
+        ("falling", np.int16, (n, 3)),            # 落下中の花札の (札ID, x, y)、札IDが0なら出現待ち
+        ("next_card", np.int8, (n,)),
+        ("timers", np.int32, (n, 6)),             # bonus_time pause_time spawn_delay drop_timer drop_speed removal_timer
+        ("removal_state", np.int8, (n,)),         # REMOVAL_CODES
+        ("combo", np.int32, (n,)),
+        # step の入出力
+        ("actions", np.int64, (n,)),
+        ("rewards", np.float32, (n,)),
+        ("terminated", np.bool_, (n,)),
+        ("truncated", np.bool_, (n,)),
+        ("score", np.int64, (n,)),
+        ("final_score", np.int64, (n,)),          # 終わったゲームの最終スコア（終わった step だけ有効）
+        ("frames", np.int64, (n,)),
+    )
+
+
+OBSERVATION_KEYS = ("cards", "months", "types", "falling", "next_card", "timers", "removal_state", "combo")
+
+
+class EnvBlock:
+    """連続した範囲 [start, stop) の環境を進め、結果を配列に書き込む（プロセス内・ワーカー共用）"""
+
+    def __init__(self, arrays, start, stop, width=8, height=6, mode="column", max_frames=None, hard_drop=False):
+        if mode not in ("column", "tick"):
+            raise ValueError("mode は column か tick です: %s" % mode)
+        self.arrays = arrays
+        self.start = start
+        self.stop = stop
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.max_frames = max_frames
+        self.drop_action = ACTION_HARD_DROP if hard_drop else ACTION_DOWN
+        self.engines = {}
+        self.versions = {}  # 環境 -> 配列に書いた盤面の field_version
+
+    def reset(self, seed):
+        """全環境を作り直す（環境 i の乱数は seed と i だけで決まるので、分け方によらず同じゲームになる）"""
+        for i in range(self.start, self.stop):
+            self.engines[i] = HanafudaEngine(rng=random.Random(seed * 1000003 + i),
+                                             width=self.width, height=self.height)
+            self.versions[i] = None
+        arrays = self.arrays
+        for name in ("rewards", "terminated", "truncated", "final_score"):
+            arrays[name][self.start:self.stop] = 0
+        self.observe()
+
+    def step(self):
+        """arrays['actions'] の行動で1 step 進める"""
+        arrays = self.arrays
+        actions = arrays['actions']
+        rewards = arrays['rewards']
+        terminated = arrays['terminated']
+        truncated = arrays['truncated']
+        final_score = arrays['final_score']
+        max_frames = self.max_frames
+        column_mode = self.mode == "column"
+        for i in range(self.start, self.stop):
+            engine = self.engines[i]
+            score = engine.score
+            if column_mode:
+                self.place(engine, int(actions[i]))
+            else:
+                engine.step(int(actions[i]) & TICK_ACTIONS)
+            rewards[i] = engine.score - score
+            over = engine.game_over
+            cut = not over and max_frames is not None and engine.frame >= max_frames
+            terminated[i] = over
+            truncated[i] = cut
+            if over or cut:
+                final_score[i] = engine.score
+                engine.reset()
+        self.observe()
+
+    def place(self, engine, column):
+        """列 column を目指して花札を置き、次の花札を動かせるようになるまで進める"""
+        target = min(max(column, 0), self.width - 1)
+        limit = self.max_frames
+        spawned = False
+        while not engine.game_over and (limit is None or engine.frame < limit):
+            if spawned and engine.input_enabled():
+                break
+            engine.fast_forward(limit)
+            action = ACTION_NONE
+            if engine.falling_card is not None:
+                x, y = engine.falling_x, engine.falling_y
+                if x < target and engine.can_move(x + 1, y):
+                    action = ACTION_RIGHT
+                elif x > target and engine.can_move(x - 1, y):
+                    action = ACTION_LEFT
+                else:
+                    action = self.drop_action
+            for event in engine.step(action):
+                if event[0] == "spawn":
+                    spawned = True
+
+    def observe(self):
+        """各環境の状態を観測の配列に書き込む"""
+        arrays = self.arrays
+        cards = arrays['cards']
+        versions = self.versions
+        changed = False
+        falling = []
+        next_card = []
+        timers = []
+        removal = []
+        combo = []
+        score = []
+        frames = []
+        for i in range(self.start, self.stop):
+            engine = self.engines[i]
+            if engine.field_version != versions[i]:
+                versions[i] = engine.field_version
+                cards[i] = engine.field
+                changed = True
+            falling.append((engine.falling_card or 0, engine.falling_x, engine.falling_y))
+            next_card.append(engine.next_card)
+            timers.append((engine.bonus_time, engine.pause_time, engine.spawn_delay,
+                           engine.drop_timer, engine.drop_speed, engine.removal_timer))
+            removal.append(REMOVAL_CODES[engine.removal_state])
+            combo.append(engine.combo)
+            score.append(engine.score)
+            frames.append(engine.frame)
+        block = slice(self.start, self.stop)
+        if changed:
+            np.take(_MONTH_TABLE, cards[block], out=arrays['months'][block])
+            np.take(_TYPE_TABLE, cards[block], out=arrays['types'][block])
+        arrays['falling'][block] = falling
+        arrays['next_card'][block] = next_card
+        arrays['timers'][block] = timers
+        arrays['removal_state'][block] = removal
+        arrays['combo'][block] = combo
+        arrays['score'][block] = score
+        arrays['frames'][block] = frames
+
+
+def _views(buffers, specs):
+    """共有メモリの各バッファを NumPy 配列として見る（コピーしない）"""
+    return {name: np.frombuffer(buffers[name], dtype=dtype).reshape(shape) for name, dtype, shape in specs}
+
+
+def _worker(conn, buffers, num_envs, start, stop, options):
+    """サブプロセス：担当範囲の環境を命令どおりに進める"""
+    arrays = _views(buffers, buffer_specs(num_envs, options['width'], options['height']))
+    block = EnvBlock(arrays, start, stop, **options)
+    try:
+        while True:
+            command, argument = conn.recv()
+            if command == "step":
+                block.step()
+            elif command == "reset":
+                block.reset(argument)
+            elif command == "close":
+                break
+            conn.send(None)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        conn.close()
+
+
+class HanafudaVecEnv:
+    """num_envs 面をまとめて進めるベクトル化環境
+
+    reset() は (観測, info)、step(actions) は (観測, 報酬, 終了, 打ち切り, info) を返す。
+    観測は OBSERVATION_KEYS の配列の辞書で、返すのは毎回同じ配列（中身だけ書き換わる）。
+    """
+
+    def __init__(self, num_envs=16, width=8, height=6, mode="column", max_frames=None, workers=0,
+                 hard_drop=False):
+        self.num_envs = num_envs
+        self.FIELD_WIDTH = width
+        self.FIELD_HEIGHT = height
+        self.mode = mode
+        self.action_count = width if mode == "column" else TICK_ACTIONS + 1
+        options = {'width': width, 'height': height, 'mode': mode, 'max_frames': max_frames,
+                   'hard_drop': hard_drop}
+        specs = buffer_specs(num_envs, width, height)
+        workers = min(workers, num_envs)
+
+        self.blocks = []
+        self.processes = []
+        self.connections = []
+        if workers:
+            # 配列はロックなしの共有メモリに置く（各ワーカーは自分の範囲にしか書かない）
+            buffers = {name: multiprocessing.RawArray("b", int(np.prod(shape)) * np.dtype(dtype).itemsize)
+                       for name, dtype, shape in specs}
+            self.arrays = _views(buffers, specs)
+            for k in range(workers):
+                start = num_envs * k // workers
+                stop = num_envs * (k + 1) // workers
+                parent, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=_worker, args=(child, buffers, num_envs, start, stop, options),
+                                                  daemon=True)
+                process.start()
+                child.close()
+                self.processes.append(process)
+                self.connections.append(parent)
+        else:
+            self.arrays = {name: np.zeros(shape, dtype=dtype) for name, dtype, shape in specs}
+            self.blocks.append(EnvBlock(self.arrays, 0, num_envs, **options))
+
+        arrays = self.arrays
+        self.observation = {name: arrays[name] for name in OBSERVATION_KEYS}
+        self.info = {name: arrays[name] for name in ("score", "final_score", "frames")}
+
+    def _run(self, command, argument=None):
+        for block in self.blocks:
+            getattr(block, command)(*(() if argument is None else (argument,)))
+        for conn in self.connections:
+            conn.send((command, argument))
+        for conn in self.connections:
+            conn.recv()
+
+    def reset(self, seed=None):
+        """全環境を開始状態にする（seed が同じなら同じゲームの列になる）"""
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(63)
+        self._run("reset", seed)
+        return self.observation, self.info
+
+    def step(self, actions):
+        """各環境に行動を1つずつ与えて進める（終わった環境は自動で開始状態に戻る）"""
+        arrays = self.arrays
+        arrays['actions'][:] = actions
+        self._run("step")
+        return self.observation, arrays['rewards'], arrays['terminated'], arrays['truncated'], self.info
+
+    def close(self):
+        """ワーカーを止める"""
+        for conn in self.connections:
+            try:
+                conn.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for process in self.processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ベクトル化環境の1秒あたりの step 数を測る")
+    parser.add_argument("--envs", type=int, default=64)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=0, help="サブプロセスの数（0ならこのプロセスで進める）")
+    parser.add_argument("--mode", choices=("column", "tick"), default="column")
+    parser.add_argument("--board", type=board_size, default=(8, 6), metavar="WxH",
+                        help="盤面の大きさ（既定: 8x6）")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hard-drop", action="store_true", help="column モードで花札を即時落下で置く")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    with HanafudaVecEnv(args.envs, args.board[0], args.board[1], args.mode, args.max_frames,
+                        args.workers, args.hard_drop) as env:
+        env.reset(args.seed)
+        actions = np.zeros(args.envs, dtype=np.int64)
+        episodes = 0
+        total_score = 0
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            actions[:] = rng.integers(0, env.action_count, size=args.envs)
+            _, _, terminated, truncated, info = env.step(actions)
+            done = terminated | truncated
+            episodes += int(done.sum())
+            total_score += int(info['final_score'][done].sum())
+        elapsed = time.perf_counter() - start
+    steps = args.steps * args.envs
+    print("envs %d  workers %d  mode %s  steps %d  %.1f s  %.0f steps/s  episodes %d  mean score %.0f" % (
+        args.envs, args.workers, args.mode, steps, elapsed, steps / elapsed, episodes,
+        total_score / episodes if episodes else 0.0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
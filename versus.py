@@ -0,0 +1,457 @@
+"""ヘッドレスの対戦サーバー（asyncio）
+
+1つのプロセスで多数の1対1の対戦を、固定ティックのロックステップで進める。
+両者には同じシードで同じ札の並びを配り、役を作るたびに相手へおじゃま行を送る
+（せり上がりは相手の次の花札の出現時、最上段に花札があればそこで負け）。
+入力はティックごとにまとめ（同じティックに届いた分は OR）、両者の入力を
+そのまま両方のクライアントへ流す。クライアントは START のシードで VersusMatch を作り、
+流れてきた入力で両方の盤面を手元で再現する（盤面そのものは送らない）。
+観戦者には spectate.py の差分ストリームで片側の盤面を配る（観戦者がいる側だけ符号化する）。
+
+プロトコル（改行区切りの ASCII）:
+    クライアント → サーバー
+        JOIN                      対戦相手を待つ
+        I <入力>                  次のティックの入力（ACTION_* のビット）
+        WATCH [<対戦ID> [<側>]]   観戦する（省略すると最新の対戦の側0、以後は差分ストリーム）
+    サーバー → クライアント
+        WAIT                      相手待ち
+        START <対戦ID> <シード> <幅> <高さ> <自分の側 0/1>
+        T <ティック> <側0の入力> <側1の入力>   入力のあったティック
+        S <ティック>              入力のないティックがここまで続いた（SYNC_TICKS ごと）
+        END <ティック> <勝った側 (-1 は引き分け)> <側0の得点> <側1の得点> <理由>
+
+    python versus.py serve --port 7650 --report 5
+    python versus.py bots --port 7650 --matches 200
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import deque
+
+from bitboard import popcount
+from clock import FixedStepClock, TICK_RATE
+from engine import ACTION_NONE, board_size
+from policies import POLICIES, ColumnController
+from replay import new_engine, new_seed
+from spectate import SpectatorHub
+
+DEFAULT_PORT = 7650
+SYNC_TICKS = 15               # 入力のないティックが続くときに S を送る間隔
+GARBAGE_PER_YAKU = 1          # 役1つあたりに送るおじゃま行の数
+GARBAGE_SEED = 0x6A5B         # おじゃま行の穴の位置を決める乱数のシードに混ぜる値
+MAX_WRITE_BACKLOG = 1 << 16   # 送信待ちがこのバイト数を超えたクライアントは切断する
+DRAW = -1
+
+
+class VersusMatch:
+    """1対1の対戦のルール（2つのエンジンとおじゃま行のやり取り、サーバーとクライアントで共通）"""
+
+    def __init__(self, seed, width=8, height=6, max_ticks=None):
+        self.seed = seed
+        self.engines = (new_engine(seed, width, height), new_engine(seed, width, height))
+        self.garbage_rng = random.Random(seed ^ GARBAGE_SEED)
+        self.max_ticks = max_ticks  # この数のティックで打ち切って得点で決める（None なら無制限）
+        self.tick = 0
+        self.winner = None          # 終わったら勝った側（0/1、引き分けは DRAW）
+        self.reason = None          # topout: 積み上がって負け / time: 打ち切り / forfeit: 切断
+        self.garbage_sent = [0, 0]
+
+    def step(self, action0, action1):
+        """両方のエンジンを1ティック進める（戻り値は両側の events）"""
+        self.tick += 1
+        engines = self.engines
+        events = (engines[0].step(action0), engines[1].step(action1))
+        rng = self.garbage_rng
+        for side in (0, 1):
+            yaku = sum(popcount(event[1]) for event in events[side] if event[0] == "yaku")
+            if yaku:
+                target = engines[1 - side]
+                for _ in range(yaku * GARBAGE_PER_YAKU):
+                    target.queue_garbage(rng.randrange(target.FIELD_WIDTH), rng.randrange(12))
+                self.garbage_sent[side] += yaku * GARBAGE_PER_YAKU
+
+        over0, over1 = engines[0].game_over, engines[1].game_over
+        if over0 != over1:
+            self.finish(0 if over1 else 1, "topout")
+        elif over0 or (self.max_ticks is not None and self.tick >= self.max_ticks):
+            # 同じティックで両方積み上がったとき・打ち切りは得点で決める
+            score0, score1 = engines[0].score, engines[1].score
+            self.finish(DRAW if score0 == score1 else (0 if score0 > score1 else 1),
+                        "topout" if over0 else "time")
+        return events
+
+    def finish(self, winner, reason):
+        self.winner = winner
+        self.reason = reason
+
+    @property
+    def scores(self):
+        return self.engines[0].score, self.engines[1].score
+
+
+class MatchStats:
+    """対戦ごとのティック処理の計測"""
+
+    __slots__ = ("ticks", "latency_total", "latency_max", "input_backlog_max", "output_backlog_max")
+
+    def __init__(self):
+        self.ticks = 0
+        self.latency_total = 0.0     # ティック開始からこの対戦の送信までの時間の合計（秒）
+        self.latency_max = 0.0
+        self.input_backlog_max = 0   # 1ティックに届いた入力の数の最大
+        self.output_backlog_max = 0  # 送信待ちのバイト数の最大
+
+    def record(self, latency, input_backlog, output_backlog):
+        self.ticks += 1
+        self.latency_total += latency
+        if latency > self.latency_max:
+            self.latency_max = latency
+        if input_backlog > self.input_backlog_max:
+            self.input_backlog_max = input_backlog
+        if output_backlog > self.output_backlog_max:
+            self.output_backlog_max = output_backlog
+
+    def to_dict(self):
+        return {'ticks': self.ticks,
+                'latency_mean_ms': self.latency_total / self.ticks * 1000.0 if self.ticks else 0.0,
+                'latency_max_ms': self.latency_max * 1000.0,
+                'input_backlog_max': self.input_backlog_max,
+                'output_backlog_max': self.output_backlog_max}
+
+
+class Player:
+    """接続しているクライアント"""
+
+    __slots__ = ("writer", "match", "side", "pending", "received")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.match = None
+        self.side = 0
+        self.pending = ACTION_NONE  # 次のティックに渡す入力（届いた分の OR）
+        self.received = 0           # 前のティック以降に届いた入力の数
+
+    def send(self, line):
+        if not self.writer.is_closing():
+            self.writer.write(line.encode("ascii"))
+
+    def backlog(self):
+        """送信待ちのバイト数"""
+        transport = self.writer.transport
+        return transport.get_write_buffer_size() if transport is not None else 0
+
+
+class ServerMatch:
+    """サーバーで進行中の対戦"""
+
+    __slots__ = ("id", "game", "players", "stats", "hubs")
+
+    def __init__(self, match_id, game, players):
+        self.id = match_id
+        self.game = game
+        self.players = players
+        self.stats = MatchStats()
+        self.hubs = [None, None]  # 側ごとの観戦配信（観戦者が来たときに作る）
+
+
+class VersusServer:
+    """多数の対戦を1つのティックループで進めるサーバー"""
+
+    def __init__(self, tick_rate=TICK_RATE, width=8, height=6, max_ticks=None, seed=None):
+        self.clock = FixedStepClock(tick_rate)
+        self.width = width
+        self.height = height
+        self.max_ticks = max_ticks
+        self.rng = random.Random(seed if seed is not None else new_seed())
+        self.matches = {}        # 対戦ID -> ServerMatch
+        self.waiting = None      # 相手を待っている Player
+        self.next_id = 1
+        self.finished = deque(maxlen=1000)  # 終わった対戦の (対戦ID, ティック数, 理由, MatchStats)
+        self.tick_count = 0
+
+    async def handle_client(self, reader, writer):
+        player = Player(writer)
+        hub = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.split()
+                if not parts:
+                    continue
+                command = parts[0]
+                if command == b"I" and len(parts) == 2 and player.match is not None:
+                    player.pending |= int(parts[1])
+                    player.received += 1
+                elif command == b"JOIN" and player.match is None and self.waiting is not player:
+                    self.join(player)
+                elif command == b"WATCH" and player.match is None and hub is None:
+                    hub = self.watch(writer, *(int(part) for part in parts[1:3]))
+                    if hub is None:
+                        break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            if hub is not None:
+                hub.unsubscribe(writer)
+            self.leave(player)
+            writer.close()
+
+    def watch(self, writer, match_id=None, side=0):
+        """観戦者を対戦の片側の配信に加える（対戦がなければ None）"""
+        if match_id is None:
+            match_id = max(self.matches, default=None)
+        match = self.matches.get(match_id)
+        if match is None or side not in (0, 1):
+            return None
+        hub = match.hubs[side]
+        if hub is None:
+            hub = match.hubs[side] = SpectatorHub()
+        hub.subscribe(writer)
+        return hub
+
+    def join(self, player):
+        """相手を待つ（待っている人がいれば対戦を始める）"""
+        opponent = self.waiting
+        if opponent is None:
+            self.waiting = player
+            player.send("WAIT\n")
+            return
+        self.waiting = None
+        seed = self.rng.getrandbits(63)
+        game = VersusMatch(seed, self.width, self.height, self.max_ticks)
+        match = ServerMatch(self.next_id, game, (opponent, player))
+        self.next_id += 1
+        self.matches[match.id] = match
+        for side, p in enumerate(match.players):
+            p.match = match
+            p.side = side
+            p.pending = ACTION_NONE
+            p.received = 0
+            p.send("START %d %d %d %d %d\n" % (match.id, seed, self.width, self.height, side))
+
+    def leave(self, player):
+        """切断したクライアントを外す（対戦中なら相手の勝ち）"""
+        if self.waiting is player:
+            self.waiting = None
+        match = player.match
+        if match is not None and match.id in self.matches:
+            match.game.finish(1 - player.side, "forfeit")
+            self.end(match)
+
+    def end(self, match):
+        """対戦を終え、両者に結果を送る"""
+        game = match.game
+        score0, score1 = game.scores
+        line = "END %d %d %d %d %s\n" % (game.tick, game.winner, score0, score1, game.reason)
+        for p in match.players:
+            p.send(line)
+            p.match = None
+            p.writer.close()
+        for hub in match.hubs:
+            if hub is not None:
+                for sink in list(hub.subscribers):
+                    sink.close()
+        del self.matches[match.id]
+        self.finished.append((match.id, game.tick, game.reason, match.stats))
+
+    def tick(self):
+        """進行中のすべての対戦を1ティック進める"""
+        self.tick_count += 1
+        timer = time.perf_counter
+        start = timer()
+        for match in list(self.matches.values()):
+            p0, p1 = match.players
+            action0, action1 = p0.pending, p1.pending
+            input_backlog = max(p0.received, p1.received)
+            p0.pending = p1.pending = ACTION_NONE
+            p0.received = p1.received = 0
+
+            game = match.game
+            game.step(action0, action1)
+            for side, hub in enumerate(match.hubs):
+                if hub is not None:
+                    hub.publish(game.engines[side])
+            if action0 or action1:
+                line = "T %d %d %d\n" % (game.tick, action0, action1)
+            elif game.tick % SYNC_TICKS == 0:
+                line = "S %d\n" % game.tick
+            else:
+                line = None
+            if line is not None:
+                p0.send(line)
+                p1.send(line)
+
+            output_backlog = max(p0.backlog(), p1.backlog())
+            match.stats.record(timer() - start, input_backlog, output_backlog)
+            if game.winner is not None:
+                self.end(match)
+            elif output_backlog > MAX_WRITE_BACKLOG:
+                # 受け取りが追いつかないクライアントは切断して負けにする
+                slow = p0 if p0.backlog() >= p1.backlog() else p1
+                game.finish(1 - slow.side, "forfeit")
+                self.end(match)
+
+    async def tick_loop(self, report=None):
+        """固定ティックで tick を呼び続ける（遅れたら追いつく分だけまとめて進める）"""
+        clock = self.clock
+        clock.reset()
+        next_report = None if report is None else time.perf_counter() + report
+        while True:
+            for _ in range(clock.advance()):
+                self.tick()
+            if next_report is not None and time.perf_counter() >= next_report:
+                sys.stderr.write(self.report_line() + "\n")
+                next_report += report
+            await asyncio.sleep((1.0 - clock.alpha) * clock.step)
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT, path=None, report=None):
+        """接続を受け付けながらティックループを回す（path を指定すると Unix ドメインソケット）"""
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await self.tick_loop(report)
+
+    def match_stats(self):
+        """進行中の対戦ごとの計測（対戦ID -> dict）"""
+        return {match.id: dict(match.stats.to_dict(), tick=match.game.tick)
+                for match in self.matches.values()}
+
+    def report_line(self):
+        """進行中の対戦の計測をまとめた1行"""
+        stats = [match.stats for match in self.matches.values()]
+        ticks = sum(s.ticks for s in stats)
+        latency = sum(s.latency_total for s in stats) / ticks * 1000.0 if ticks else 0.0
+        return ("matches %d  finished %d  ticks %d  dropped %d  latency mean %.3f max %.3f ms  "
+                "input backlog %d  output backlog %d B" % (
+                    len(stats), len(self.finished), self.tick_count, self.clock.dropped, latency,
+                    max((s.latency_max for s in stats), default=0.0) * 1000.0,
+                    max((s.input_backlog_max for s in stats), default=0),
+                    max((s.output_backlog_max for s in stats), default=0)))
+
+
+async def run_bot(host="127.0.0.1", port=DEFAULT_PORT, path=None, policy_name="greedy", seed=0):
+    """方針に従って1試合だけ対戦するクライアント（負荷試験用）
+
+    受け取った入力で両方の盤面を手元で再現し、最後にサーバーの得点と一致したかを返す。
+    """
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b"JOIN\n")
+    game = None
+    side = 0
+    controller = ColumnController(POLICIES[policy_name](random.Random(seed)))
+    sent_tick = -1
+    result = None
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            parts = line.split()
+            command = parts[0]
+            if command == b"START":
+                width, height, side = int(parts[3]), int(parts[4]), int(parts[5])
+                game = VersusMatch(int(parts[2]), width, height)
+                controller.on_spawn(game.engines[side])
+                continue
+            if command == b"WAIT" or game is None:
+                continue
+
+            # 行のなかったティックは入力なしで進める
+            tick = int(parts[1])
+            while game.tick < tick - 1:
+                _mirror(game, side, controller, ACTION_NONE, ACTION_NONE)
+            if command == b"T":
+                _mirror(game, side, controller, int(parts[2]), int(parts[3]))
+            elif game.tick < tick:
+                _mirror(game, side, controller, ACTION_NONE, ACTION_NONE)
+            if command == b"END":
+                scores = (int(parts[3]), int(parts[4]))
+                result = {'side': side, 'winner': int(parts[2]), 'ticks': tick,
+                          'reason': parts[5].decode("ascii"), 'scores': scores,
+                          'consistent': game.scores == scores or parts[5] == b"forfeit"}
+                break
+
+            # 再現できた最新のティックにつき1回だけ入力を送る
+            if game.tick > sent_tick:
+                action = controller.action(game.engines[side])
+                if action:
+                    writer.write(b"I %d\n" % action)
+                    sent_tick = game.tick
+    finally:
+        writer.close()
+    return result
+
+
+def _mirror(game, side, controller, action0, action1):
+    """サーバーと同じ入力で手元の対戦を1ティック進める"""
+    events = game.step(action0, action1)
+    for event in events[side]:
+        if event[0] == "spawn":
+            controller.on_spawn(game.engines[side])
+
+
+async def run_bots(matches, policy_name="greedy", host="127.0.0.1", port=DEFAULT_PORT, path=None, seed=0):
+    """matches 試合分のクライアントを同時に接続して対戦させ、結果のリストを返す"""
+    tasks = [run_bot(host, port, path, policy_name, seed * 1000003 + i) for i in range(matches * 2)]
+    return await asyncio.gather(*tasks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="花札テトリスの対戦サーバー")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("serve", "bots"):
+        p = sub.add_parser(name)
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=DEFAULT_PORT)
+        p.add_argument("--unix", help="Unix ドメインソケットのパス（指定すると TCP の代わりに使う）")
+        p.add_argument("--seed", type=int, default=None)
+    serve = sub.choices["serve"]
+    serve.add_argument("--board", type=board_size, default=(8, 6), metavar="WxH",
+                       help="盤面の大きさ（既定: 8x6）")
+    serve.add_argument("--tick-rate", type=int, default=TICK_RATE,
+                       help="1秒あたりのティック数（既定: %d、ルール上の時間の意味は変わらない）" % TICK_RATE)
+    serve.add_argument("--max-seconds", type=float, default=None,
+                       help="ゲーム内の時間でこの秒数を過ぎたら得点で勝敗を決める")
+    serve.add_argument("--report", type=float, default=None, help="計測結果を表示する間隔（秒）")
+    bots = sub.choices["bots"]
+    bots.add_argument("--matches", type=int, default=100)
+    bots.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        max_ticks = None if args.max_seconds is None else int(args.max_seconds * TICK_RATE)
+        server = VersusServer(args.tick_rate, args.board[0], args.board[1], max_ticks, args.seed)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix, args.report))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    start = time.perf_counter()
+    results = asyncio.run(run_bots(args.matches, args.policy, args.host, args.port, args.unix,
+                                   args.seed or 0))
+    elapsed = time.perf_counter() - start
+    finished = [r for r in results if r is not None]
+    inconsistent = sum(1 for r in finished if not r['consistent'])
+    reasons = {}
+    for r in finished:
+        reasons[r['reason']] = reasons.get(r['reason'], 0) + 1
+    ticks = sum(r['ticks'] for r in finished) / len(finished) if finished else 0.0
+    print("clients %d  finished %d  inconsistent %d  mean ticks %.0f  %.1f s  %s" % (
+        len(results), len(finished), inconsistent, ticks, elapsed,
+        " ".join("%s %d" % item for item in sorted(reasons.items()))))
+    return 1 if inconsistent else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())